@@ -0,0 +1,348 @@
+"""
+Flux détaillés des activités (temps, distance, altitude, cardio, puissance).
+
+Les athlètes volontaires (profiles.streams_opt_in) voient leurs sorties enrichies de leurs
+flux Strava, récupérés par un passage quotidien plafonné sur le quota de l'API.
+Chaque flux est stocké dans sa propre colonne de activity_streams : tableau typé
+(entiers à pas fixe, codés en différences successives), compressé zlib puis encodé en
+base64. Les courbes puissance / cardio (meilleure moyenne sur 5 s ... 1 h) et les
+meilleurs temps sur distance sont calculés une fois à l'enregistrement (colonne
+mean_max) : les écrans du club ne relisent jamais les flux bruts, chargés à la demande.
+Les records de chaque athlète (meilleure valeur par durée, toutes sorties confondues)
+sont tenus à jour dans athlete_stream_curves : une ligne par athlète pour la courbe du club.
+
+Utilisation :
+    python activity_streams.py fetch [--max 200]   # flux manquants des athlètes volontaires
+    python activity_streams.py curves              # recalcule mean_max et les records depuis les flux stockés
+"""
+import os
+import zlib
+import base64
+import argparse
+import datetime
+
+import numpy as np
+from dotenv import load_dotenv
+
+load_dotenv()
+
+STREAM_KEYS = ("time", "distance", "altitude", "heartrate", "watts")
+STREAM_TYPES = ("Ride", "VirtualRide", "Run")
+# Codage par flux : (type numpy, facteur d'échelle, codage en différences)
+STREAM_CODECS = {
+    "time": ("<i4", 1, True),          # s
+    "distance": ("<i4", 10, True),     # dm
+    "altitude": ("<i4", 10, True),     # dm
+    "heartrate": ("<u1", 1, False),    # bpm
+    "watts": ("<u2", 1, False),        # W
+}
+MEAN_MAX_DURATIONS = (5, 15, 30, 60, 120, 300, 600, 1200, 1800, 3600)    # s
+BEST_EFFORT_DISTANCES = (1000, 5000, 10000, 20000, 40000)                # m
+MAX_GAP_FILL = 10              # s : trou d'enregistrement comblé par la dernière valeur, au-delà 0
+
+# Budget API : plafonné par passage, sans entamer la part du quota du jour réservée aux
+# synchros, et en laissant STREAMS_RESERVE requêtes de chaque fenêtre de 15 min à l'UI
+STREAMS_MAX_PER_RUN = int(os.getenv("STREAMS_MAX_PER_RUN", 200))
+STREAMS_DAY_RESERVE = int(os.getenv("STREAMS_DAY_RESERVE", 400))
+STREAMS_RESERVE = int(os.getenv("STREAMS_RESERVE", 40))
+STREAMS_WRITE_BATCH = 20
+
+
+# --- STOCKAGE COMPACT ---
+
+def encode_stream(key, values):
+    """
+    Tableau de valeurs (None accepté) -> texte base64 d'un tableau typé compressé.
+    Les valeurs hors de la plage du type (cardio négatif, capteur aberrant) sont ramenées
+    à ses bornes au lieu de déborder ; en différences, à la moitié de la plage pour que
+    chaque écart tienne aussi dans le type.
+    """
+    dtype, scale, delta = STREAM_CODECS[key]
+    limits = np.iinfo(dtype)
+    low, high = (limits.min // 2, limits.max // 2) if delta else (limits.min, limits.max)
+    data = np.nan_to_num(np.asarray(values, dtype=np.float64))
+    data = np.clip(np.rint(data * scale), low, high).astype(np.int64)
+    if delta:
+        data = np.diff(data, prepend=0)
+    return base64.b64encode(zlib.compress(data.astype(dtype).tobytes(), 6)).decode()
+
+
+def decode_stream(key, text):
+    """Inverse de encode_stream : tableau numpy float64."""
+    dtype, scale, delta = STREAM_CODECS[key]
+    data = np.frombuffer(zlib.decompress(base64.b64decode(text)), dtype=dtype).astype(np.int64)
+    if delta:
+        data = np.cumsum(data)
+    return data / scale
+
+
+# --- COURBES (vectorisées) ---
+
+def to_1hz(time, values):
+    """
+    Ré-échantillonne un flux à 1 Hz (une valeur par seconde depuis le départ).
+    Les trous de moins de MAX_GAP_FILL s gardent la dernière valeur, les pauses plus longues valent 0.
+    """
+    t = np.asarray(time, dtype=np.int64)
+    t = t - t[0]
+    v = np.nan_to_num(np.asarray(values, dtype=np.float64))
+    seconds = np.arange(t[-1] + 1)
+    last = np.searchsorted(t, seconds, side="right") - 1
+    return np.where(seconds - t[last] <= MAX_GAP_FILL, v[last], 0.0)
+
+
+def mean_max(series, durations=MEAN_MAX_DURATIONS):
+    """Meilleure moyenne glissante pour chaque durée (sommes cumulées, sans boucle sur les fenêtres)."""
+    cumulative = np.concatenate(([0.0], np.cumsum(series)))
+    curve = {}
+    for d in durations:
+        if d <= len(series):
+            curve[str(d)] = round(float(np.max(cumulative[d:] - cumulative[:-d]) / d), 1)
+    return curve
+
+
+def best_efforts(time, distance, distances=BEST_EFFORT_DISTANCES):
+    """Temps (s) le plus court pour couvrir chaque distance, tous points de départ confondus."""
+    t = np.asarray(time, dtype=np.float64)
+    dist = np.maximum.accumulate(np.nan_to_num(np.asarray(distance, dtype=np.float64)))
+    efforts = {}
+    for target in distances:
+        end = np.searchsorted(dist, dist + target, side="left")
+        valid = end < len(dist)
+        if valid.any():
+            efforts[str(target)] = int(np.min(t[end[valid]] - t[valid]))
+    return efforts
+
+
+def activity_curves(streams):
+    """Courbes d'une activité (colonne mean_max) : {"watts": {...}, "heartrate": {...}, "best_efforts": {...}}."""
+    time = streams.get("time")
+    if time is None or len(time) < 2:
+        return {}
+    curves = {}
+    for key in ("watts", "heartrate"):
+        values = streams.get(key)
+        if values is not None and len(values) == len(time):
+            curves[key] = mean_max(to_1hz(time, values))
+    if streams.get("distance") is not None and len(streams["distance"]) == len(time):
+        curves["best_efforts"] = best_efforts(time, streams["distance"])
+    return curves
+
+
+def average_watts(arrays):
+    """Puissance moyenne de l'activité (points manquants comptés à 0, comme une fois stockés)."""
+    watts = arrays.get("watts")
+    return round(float(np.mean(watts)), 1) if watts is not None and len(watts) else None
+
+
+def stream_row(activity, streams):
+    """Ligne activity_streams d'une activité (streams : {type: valeurs}, éventuellement vide)."""
+    arrays = {k: np.array([0 if v is None else v for v in streams[k]], dtype=np.float64)
+              for k in STREAM_KEYS if streams.get(k)}
+    row = {
+        "id_activity": activity["id_activity"],
+        "id_strava": activity["id_strava"],
+        "points": len(arrays["time"]) if "time" in arrays else 0,
+        "mean_max": activity_curves(arrays),
+        "average_watts": average_watts(arrays),
+        "fetched_at": datetime.datetime.now(datetime.timezone.utc).isoformat(),
+    }
+    for key in STREAM_KEYS:
+        # Toutes les colonnes sur chaque ligne : l'upsert groupé l'exige
+        row[key] = encode_stream(key, arrays[key]) if key in arrays else None
+    return row
+
+
+def merge_curves(curves):
+    """Records de plusieurs courbes mean_max : plus grande valeur par durée, plus petit temps par distance."""
+    merged = {}
+    for curve in curves:
+        for key, values in (curve or {}).items():
+            best = min if key == "best_efforts" else max
+            target = merged.setdefault(key, {})
+            for point, value in values.items():
+                target[point] = value if point not in target else best(target[point], value)
+    return merged
+
+
+def club_curves(rows, key="watts", durations=MEAN_MAX_DURATIONS):
+    """
+    Courbe record de chaque athlète : meilleure valeur par durée sur toutes ses activités.
+    rows : lignes (id_strava, mean_max) d'activités ou d'athlete_stream_curves ; retourne un DataFrame indexé par id_strava, une colonne par durée.
+    """
+    import pandas as pd   # seul usage : le cron de récupération des flux s'en passe
+    if not rows:
+        return pd.DataFrame(columns=list(durations))
+    values = np.array(
+        [[(r.get("mean_max") or {}).get(key, {}).get(str(d), np.nan) for d in durations] for r in rows],
+        dtype=np.float64,
+    )
+    df = pd.DataFrame(values, columns=list(durations))
+    df["id_strava"] = [r["id_strava"] for r in rows]
+    return df.groupby("id_strava").max().dropna(how="all")
+
+
+# --- BASE ---
+# Imports tardifs de core.db : le stockage et les courbes s'utilisent sans Supabase.
+
+def get_stream_summaries(athlete_ids=None):
+    """Courbes et puissance moyenne par activité, sans les flux bruts (lecture légère)."""
+    from core.db import supabase, MAX_ROWS_FORSQL
+    query = supabase.table("activity_streams").select("id_activity, id_strava, average_watts, mean_max").gt("points", 0)
+    if athlete_ids is not None:
+        query = query.in_("id_strava", list(athlete_ids))
+    return query.limit(MAX_ROWS_FORSQL).execute().data
+
+
+def load_streams(activity_ids, keys=STREAM_KEYS):
+    """Flux bruts décodés {id_activity: {type: tableau}} ; seules les colonnes demandées sont lues."""
+    from core.db import supabase
+    res = supabase.table("activity_streams") \
+        .select(", ".join(("id_activity",) + tuple(keys))) \
+        .in_("id_activity", list(activity_ids)) \
+        .execute()
+    return {r["id_activity"]: {k: decode_stream(k, r[k]) for k in keys if r.get(k)} for r in res.data}
+
+
+def get_athlete_curves(athlete_ids=None):
+    """Records par athlète (athlete_stream_curves) : une ligne (id_strava, mean_max) par athlète."""
+    from core.db import supabase
+    query = supabase.table("athlete_stream_curves").select("id_strava, mean_max")
+    if athlete_ids is not None:
+        query = query.in_("id_strava", list(athlete_ids))
+    return query.execute().data
+
+
+def save_athlete_curves(curves_by_athlete):
+    from core.db import supabase
+    if curves_by_athlete:
+        now = datetime.datetime.now(datetime.timezone.utc).isoformat()
+        supabase.table("athlete_stream_curves").upsert([
+            {"id_strava": athlete_id, "mean_max": curves, "updated_at": now}
+            for athlete_id, curves in curves_by_athlete.items()
+        ]).execute()
+
+
+def save_stream_rows(rows):
+    """Enregistre des lignes activity_streams et fusionne leurs courbes dans les records des athlètes."""
+    from core.db import supabase
+    if not rows:
+        return
+    supabase.table("activity_streams").upsert(rows).execute()
+    by_athlete = {}
+    for row in rows:
+        by_athlete.setdefault(row["id_strava"], []).append(row["mean_max"])
+    current = {r["id_strava"]: r["mean_max"] for r in get_athlete_curves(by_athlete)}
+    save_athlete_curves({athlete_id: merge_curves([current.get(athlete_id)] + curves)
+                         for athlete_id, curves in by_athlete.items()})
+
+
+def pending_activities(limit):
+    """
+    Activités des athlètes volontaires sans flux en base, les plus récentes d'abord,
+    alternées entre athlètes (un gros historique ne prend pas tout le budget).
+    Retourne ([activité, ...], {id_strava: profil}).
+    """
+    from core.db import supabase, MAX_ROWS_FORSQL
+    profiles = supabase.table("profiles") \
+        .select("id_strava, firstname, refresh_token, access_token, token_expires_at") \
+        .eq("streams_opt_in", True) \
+        .execute().data
+    queues = []
+    for p in profiles:
+        done = supabase.table("activity_streams").select("id_activity") \
+            .eq("id_strava", p["id_strava"]).limit(MAX_ROWS_FORSQL).execute().data
+        done_ids = {r["id_activity"] for r in done}
+        activities = supabase.table("activities").select("id_activity, id_strava, type, start_date") \
+            .eq("id_strava", p["id_strava"]).in_("type", list(STREAM_TYPES)) \
+            .order("start_date", desc=True).limit(MAX_ROWS_FORSQL).execute().data
+        queues.append([a for a in activities if a["id_activity"] not in done_ids])
+    selected = []
+    for rank in range(max((len(q) for q in queues), default=0)):
+        selected.extend(q[rank] for q in queues if rank < len(q))
+        if len(selected) >= limit:
+            break
+    return selected[:limit], {p["id_strava"]: p for p in profiles}
+
+
+# --- RÉCUPÉRATION ---
+
+def streams_budget(status, max_requests=STREAMS_MAX_PER_RUN):
+    """Requêtes accordées au passage : plafond par run, hors part du jour réservée aux synchros."""
+    return max(0, min(max_requests, status["daily_limit"] - status["day_used"] - STREAMS_DAY_RESERVE))
+
+
+def fetch_pending_streams(max_requests=STREAMS_MAX_PER_RUN):
+    """Récupère les flux manquants dans la limite du budget. Retourne le nombre d'activités enrichies."""
+    from strava_ratelimit import rate_limiter, RateLimitExceeded
+    from core.strava import fetch_activity_streams
+    from strava_tokens import get_valid_tokens
+
+    budget = streams_budget(rate_limiter.status(), max_requests)
+    if budget <= 0:
+        print("⏸️ Pas de budget Strava disponible pour les flux aujourd'hui.")
+        return 0
+    activities, profiles = pending_activities(budget)
+    print(f"🌊 {len(activities)} activité(s) à enrichir (budget : {budget} requêtes).")
+
+    tokens, rows, done = {}, [], 0
+    try:
+        for activity in activities:
+            athlete_id = activity["id_strava"]
+            if athlete_id not in tokens:
+                profile = profiles[athlete_id]
+                tokens[athlete_id] = get_valid_tokens(athlete_id, profile["refresh_token"], profile)
+            if not tokens[athlete_id]:
+                continue
+            streams = fetch_activity_streams(tokens[athlete_id]["access_token"], activity["id_activity"],
+                                             STREAM_KEYS, reserve=STREAMS_RESERVE)
+            if streams is None:
+                continue
+            rows.append(stream_row(activity, streams))
+            done += 1
+            if len(rows) >= STREAMS_WRITE_BATCH:
+                save_stream_rows(rows)
+                rows = []
+    except RateLimitExceeded as e:
+        print(f"🛑 {e} : arrêt, reprise au prochain passage.")
+    finally:
+        save_stream_rows(rows)
+    print(f"✅ Flux enregistrés pour {done} activité(s).")
+    return done
+
+
+def recompute_curves(batch=50):
+    """Recalcule mean_max et average_watts depuis les flux stockés (changement de durées), sans appel Strava."""
+    from core.db import supabase, MAX_ROWS_FORSQL
+    ids = [r["id_activity"] for r in supabase.table("activity_streams").select("id_activity")
+           .gt("points", 0).limit(MAX_ROWS_FORSQL).execute().data]
+    for i in range(0, len(ids), batch):
+        for activity_id, arrays in load_streams(ids[i:i + batch]).items():
+            supabase.table("activity_streams").update({
+                "mean_max": activity_curves(arrays),
+                "average_watts": average_watts(arrays),
+            }).eq("id_activity", activity_id).execute()
+    # Records reconstruits depuis zéro : une durée retirée ne doit pas y survivre
+    by_athlete = {}
+    for r in get_stream_summaries():
+        by_athlete.setdefault(r["id_strava"], []).append(r["mean_max"])
+    save_athlete_curves({athlete_id: merge_curves(curves) for athlete_id, curves in by_athlete.items()})
+    print(f"✅ Courbes recalculées pour {len(ids)} activité(s), records de {len(by_athlete)} athlète(s).")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Flux détaillés des activités (athlètes volontaires)")
+    sub = parser.add_subparsers(dest="command", required=True)
+    p_fetch = sub.add_parser("fetch", help="récupère les flux manquants, dans la limite du budget")
+    p_fetch.add_argument("--max", type=int, default=STREAMS_MAX_PER_RUN, help="requêtes Strava maximum")
+    sub.add_parser("curves", help="recalcule les courbes depuis les flux stockés")
+    args = parser.parse_args()
+
+    if args.command == "fetch":
+        import sync_metrics
+        from core.db import save_sync_run
+        # Run mesuré comme les crons de synchro : rapports sync_metrics/ et historique sync_runs
+        with sync_metrics.run("streams", on_finish=save_sync_run):
+            fetch_pending_streams(args.max)
+    else:
+        recompute_curves()
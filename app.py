@@ -1,9 +1,10 @@
 import streamlit as st
-import threading
 import streamlit.components.v1 as components
 from db_operations import *
 from strava_operations import *
 from translation import lang_dict
+from strava_tokens import store_tokens
+from sync_jobs import SyncJobManager
 from ui_components_sidebar import sidebar_component
 import importlib
 
@@ -39,8 +40,10 @@ DEFAULT_SESSION = {
     "athlete": None,
     "lang": "fr",
     "auto_sync_done": False,
-    "sync_started": False,
+    "sync_job": None,
+    "sync_windows_seen": 0,
     "sync_error": None,
+    "sync_notice": None,
 }
 for k,v in DEFAULT_SESSION.items():
     if k not in st.session_state:
@@ -59,6 +62,8 @@ if code and st.session_state.access_token is None:
         st.session_state.access_token = data["access_token"]
         st.session_state.refresh_token = data["refresh_token"]
         st.session_state.athlete = data["athlete"]
+        # Le token frais du login est réutilisable par le cron / la console admin
+        store_tokens(data["athlete"]["id"], data)
         st.query_params.clear()
         st.rerun()
 
@@ -101,65 +106,127 @@ def refresh_local_data():
 # BACKGROUND SYNC
 # ---------------------------------------------------
 
-sync_status = {"done": False, "error": None}
-def run_sync_background(athlete, access_token, refresh_token):
-    try:
+@st.cache_resource
+def get_sync_manager():
+    """Gestionnaire unique pour tout le processus : partagé entre sessions et onglets."""
+    return SyncJobManager()
+
+def run_sync_background(job, athlete, access_token, refresh_token):
+    """Synchro de connexion (thread du pool). Retourne les compteurs inserted/updated/skipped."""
+    athlete_id = athlete["id"]
+    after_ts = get_sync_cursor(athlete_id)
+    if after_ts is not None:
+        latest = fetch_strava_activities(access_token, after_ts)
+    else:
         latest = fetch_page(access_token, page=1, per_page=10)
-        sync_profile_and_activities(
+    job.report(pages=1, activities=len(latest))
+    stats = sync_profile_and_activities(
+        athlete,
+        latest,
+        refresh_token,
+        is_from_ui=True
+    )
+    if stats is False:
+        raise RuntimeError("échec de l'enregistrement du profil")
+
+    total_db, _ = get_athlete_summary(athlete_id)
+    if total_db <= 100:
+        history = run_history_backfill(job, athlete, access_token, refresh_token)
+        stats = {k: stats[k] + history[k] for k in stats}
+    return stats
+
+def run_history_backfill(job, athlete, access_token, refresh_token):
+    """
+    Historique d'un nouveau membre, année par année en partant de la plus récente.
+    Chaque année est écrite page par page ; le cache de l'athlète est invalidé dès
+    qu'elle est en base, pour que les pages l'affichent sans attendre la suite.
+    """
+    athlete_id = athlete["id"]
+    stats = {"inserted": 0, "updated": 0, "skipped": 0}
+    empty_years = 0
+    stopped_at = None
+    now = datetime.datetime.now(datetime.timezone.utc)
+    for year, after, before in backfill_windows(now, athlete.get("created_at")):
+        job.report(window=year)
+        window_stats = stream_pages_to_db(
             athlete,
-            latest,
             refresh_token,
-            is_from_ui=True
+            iter_backfill_pages(access_token, after, before),
+            is_from_ui=False,   # connexion déjà comptée par la synchro de la page 1
+            on_page_written=lambda page_num, page_data: job.report(pages=1, activities=len(page_data))
         )
-
-        athlete_id = athlete["id"]
-        total_db, _ = get_athlete_summary(athlete_id)
-        if total_db <= 100:
-            history = fetch_all_activities_parallel(
-                access_token,
-                max_pages=100
-            )
-            if history:
-                sync_profile_and_activities(
-                    athlete,
-                    history,
-                    refresh_token,
-                    is_from_ui=True
-                )
-
-    except Exception as e:
-        sync_status["error"] = str(e)
-    finally:
-        sync_status["done"] = True
+        for k in stats:
+            stats[k] += window_stats[k]
+        if any(window_stats.values()):
+            empty_years = 0
+            get_athlete_summary.clear(athlete_id)
+            job.report(window_done=True)
+        else:
+            empty_years += 1
+            if empty_years >= BACKFILL_EMPTY_YEARS and not athlete.get("created_at"):
+                # Date de création du compte inconnue : deux années vides d'affilée, on s'arrête
+                stopped_at = after
+                break
+    # Arrêt sur années vides : l'historique n'est complet que si Strava n'a rien avant
+    if stopped_at is not None and has_activities_before(access_token, stopped_at) is not False:
+        # Sinon la synchro complète de nuit reprend sous la dernière année parcourue
+        save_full_sync_checkpoint(athlete_id, datetime.datetime.fromtimestamp(stopped_at, datetime.timezone.utc).isoformat())
+        return stats
+    # Historique complet : le planificateur du cron complet n'a plus à le reprendre en priorité
+    finish_full_sync(athlete_id)
+    return stats
+
+def run_full_sync(job, athlete, access_token, refresh_token):
+    """Synchro complète demandée depuis la sidebar (thread du pool)."""
+    return stream_pages_to_db(
+        athlete,
+        refresh_token,
+        iter_activity_pages(access_token),
+        is_from_ui=True,
+        on_page_written=lambda page_num, page_data: job.report(pages=1, activities=len(page_data))
+    )
 
 # ---------------------------------------------------
 # START BACKGROUND SYNC
 # ---------------------------------------------------
 
 if not st.session_state.auto_sync_done:
-    if not st.session_state.sync_started:
-        sync_status["done"] = False
-        sync_status["error"] = None
-        t = threading.Thread(
-            target=run_sync_background,
-            args=(
-                st.session_state.athlete,
-                st.session_state.access_token,
-                st.session_state.refresh_token
-            ),
-            daemon=True
+    if st.session_state.sync_job is None:
+        # Une seule synchro par athlète : un deuxième onglet reçoit le job en cours
+        st.session_state.sync_job = get_sync_manager().submit(
+            st.session_state.athlete["id"],
+            run_sync_background,
+            st.session_state.athlete,
+            st.session_state.access_token,
+            st.session_state.refresh_token
         )
 
-        t.start()
-        st.session_state.sync_started = True
-
-    @st.fragment(run_every=2)
+    @st.fragment(run_every=3)
     def check_sync():
-        if sync_status["done"]:
-            st.session_state.auto_sync_done = True
-            st.session_state.sync_started = False
-            if sync_status["error"]:
-                st.session_state.sync_error = sync_status["error"]
+        job = st.session_state.sync_job
+        if not job.finished:
+            progress = job.progress
+            if progress["window"] is None:
+                label = texts["sync_spinner"] if job.kind == "full" else "Synchro Strava :"
+                st.caption(f"🔄 {label} {progress['activities']} activités ({progress['pages']} pages)")
+            else:
+                st.caption(f"🔄 Import de l'historique : année {progress['window']} "
+                           f"({progress['activities']} activités, {progress['pages']} pages)")
+            # Une année de plus en base : les pages la montrent sans attendre la fin de l'import
+            if progress["windows_done"] > st.session_state.sync_windows_seen:
+                st.session_state.sync_windows_seen = progress["windows_done"]
+                st.rerun()
+            return
+        st.session_state.auto_sync_done = True
+        if job.error:
+            st.session_state.sync_error = job.error
+        elif job.kind == "full":
+            st.session_state.sync_notice = texts["sync_success"]
+            st.session_state.pop("leaderboard_cache", None)
+            get_user_memberships.clear()
+        # Rechargement complet seulement si la base a changé (ou pour afficher l'erreur / le succès)
+        if job.error or job.kind == "full" or (job.result and (job.result["inserted"] or job.result["updated"])):
+            get_athlete_summary.clear()
             st.rerun()
 
     check_sync()
@@ -172,6 +239,9 @@ sidebar_component(texts)
 if st.session_state.sync_error:
     st.error("Erreur sync : " + st.session_state.sync_error)
     st.session_state.sync_error = None
+if st.session_state.sync_notice:
+    st.sidebar.success(st.session_state.sync_notice)
+    st.session_state.sync_notice = None
 athlete = st.session_state.athlete
 refresh_local_data()
 
@@ -236,26 +306,25 @@ with st.sidebar:
         st.rerun()
 
     if st.button(texts["sync_btn"], use_container_width=True):
-        with st.spinner(texts["sync_spinner"]):
-            all_activities = fetch_all_activities_parallel(
-                st.session_state.access_token
-            )
-            if all_activities:
-                success = sync_profile_and_activities(
-                    athlete,
-                    all_activities,
-                    st.session_state.refresh_token
-                )
-                if success:
-                    st.session_state.pop("leaderboard_cache", None)
-                    get_athlete_summary.clear()
-                    get_user_memberships.clear()
-                    st.sidebar.success(texts["sync_success"])
-                    st.rerun() # Ne s'exécute QUE si success est True
-                else:
-                    # Si success est False, le code s'arrête ici.
-                    # L'erreur affichée par st.error() dans db_operations restera visible.
-                    st.warning("La synchronisation a échoué. Vérifiez les messages d'erreur ci-dessus.")
+        # Même pool que la synchro de connexion : un double clic ou un second onglet
+        # reçoit la synchro en cours au lieu d'en lancer une autre
+        job = get_sync_manager().submit(
+            athlete["id"],
+            run_full_sync,
+            athlete,
+            st.session_state.access_token,
+            st.session_state.refresh_token,
+            kind="full"
+        )
+        if job.kind != "full" and not job.finished:
+            # Synchro de connexion ou import d'historique en cours : pas de synchro complète lancée
+            st.info(texts["sync_running"])
+        else:
+            # Progression et résultat suivis par le fragment check_sync, sans bloquer la page
+            st.session_state.sync_job = job
+            st.session_state.sync_windows_seen = 0
+            st.session_state.auto_sync_done = False
+            st.rerun()
     st.divider()
     st.info("Groupe WhatsApp [🔗ici](https://chat.whatsapp.com/JRpGyeubaI89ulRTu21TYE) pour déclarer les bugs ou proposer des idées.")
     st.divider()
@@ -0,0 +1,97 @@
+"""
+Benchmark du temps de démarrage des points d'entrée headless (cron, worker, webhook...).
+
+Chaque module est importé dans un processus Python neuf, plusieurs fois ; on retient
+la médiane et on note si Streamlit / pandas ont été chargés au passage. Avec --ref,
+la même mesure est faite sur une ancienne version du dépôt (extraite par git archive)
+pour comparer avant / après.
+
+Utilisation :
+    python bench_startup.py                       # arbre courant
+    python bench_startup.py --ref HEAD~1          # arbre courant vs HEAD~1
+    python bench_startup.py --modules cron_sync --runs 10
+"""
+import os
+import sys
+import json
+import argparse
+import tarfile
+import tempfile
+import statistics
+import subprocess
+
+DEFAULT_MODULES = ["cron_sync", "sync_worker", "strava_webhook", "strava_tokens",
+                   "activity_streams", "strava_archive", "full_sync_forDBUpdate"]
+
+# Exécuté dans le sous-processus : durée de l'import et modules lourds chargés
+_PROBE = """
+import sys, time, json, io, contextlib
+t = time.perf_counter()
+with contextlib.redirect_stdout(io.StringIO()):
+    __import__(sys.argv[1])
+print(json.dumps({"seconds": time.perf_counter() - t,
+                  "streamlit": "streamlit" in sys.modules,
+                  "pandas": "pandas" in sys.modules}))
+"""
+
+
+def measure(module, cwd, runs):
+    """Médiane du temps d'import de module (processus neufs), None si l'import échoue."""
+    timings, last = [], None
+    for _ in range(runs):
+        proc = subprocess.run([sys.executable, "-c", _PROBE, module], cwd=cwd,
+                              capture_output=True, text=True)
+        if proc.returncode != 0:
+            return None
+        last = json.loads(proc.stdout.strip().splitlines()[-1])
+        timings.append(last["seconds"])
+    return {"module": module, "seconds": round(statistics.median(timings), 3),
+            "streamlit": last["streamlit"], "pandas": last["pandas"]}
+
+
+def extract_ref(ref):
+    """Extrait l'arbre d'un commit git dans un dossier temporaire ; retourne son chemin."""
+    target = tempfile.mkdtemp(prefix="bench_startup_")
+    archive = os.path.join(target, "tree.tar")
+    subprocess.run(["git", "archive", "--format=tar", "-o", archive, ref], check=True,
+                   cwd=os.path.dirname(os.path.abspath(__file__)))
+    with tarfile.open(archive) as tar:
+        tar.extractall(target)
+    os.remove(archive)
+    return target
+
+
+def run_benchmark(modules, runs, ref=None):
+    trees = [("actuel", os.path.dirname(os.path.abspath(__file__)))]
+    if ref:
+        trees.insert(0, (ref, extract_ref(ref)))
+    rows = []
+    for label, path in trees:
+        for module in modules:
+            result = measure(module, path, runs)
+            if result:
+                rows.append({"tree": label, **result})
+            else:
+                print(f"⚠️ {module} : import impossible dans l'arbre {label}")
+    return rows
+
+
+def _flag(value):
+    return "oui" if value else "non"
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Temps de démarrage des points d'entrée headless")
+    parser.add_argument("--modules", nargs="+", default=DEFAULT_MODULES, help="modules à importer")
+    parser.add_argument("--runs", type=int, default=5, help="processus par module (médiane)")
+    parser.add_argument("--ref", help="commit git de comparaison (ex. HEAD~1)")
+    parser.add_argument("--json", action="store_true", help="sortie JSON")
+    args = parser.parse_args()
+
+    rows = run_benchmark(args.modules, args.runs, args.ref)
+    if args.json:
+        print(json.dumps(rows, indent=2))
+    else:
+        print(f"{'arbre':<10}{'module':<24}{'import s':>10}{'streamlit':>11}{'pandas':>8}")
+        for r in rows:
+            print(f"{r['tree']:<10}{r['module']:<24}{r['seconds']:>10}{_flag(r['streamlit']):>11}{_flag(r['pandas']):>8}")
@@ -0,0 +1,115 @@
+"""
+Benchmark de bout en bout de la synchro (nightly_sync) contre le faux Strava local
+et une base Supabase en mémoire (voir fake_strava.py).
+
+Mesure, pour une synchro complète puis une synchro partielle :
+activités/seconde, requêtes Strava par athlète et pic mémoire Python.
+
+Utilisation : python bench_sync.py --sizes 10 100 1000 --latency 0.02
+"""
+import io
+import os
+import sys
+import json
+import time
+import random
+import argparse
+import tempfile
+import tracemalloc
+import contextlib
+
+import fake_strava
+
+
+def _configure_env(base_url):
+    """À appeler AVANT d'importer les modules de synchro (URLs et quotas lus à l'import)."""
+    os.environ["STRAVA_BASE_URL"] = base_url
+    os.environ.setdefault("STRAVA_CLIENT_ID", "bench")
+    os.environ.setdefault("STRAVA_CLIENT_SECRET", "bench")
+    os.environ["STRAVA_RATE_STATE"] = os.path.join(tempfile.mkdtemp(), "rate_state.json")
+    os.environ["STRAVA_RATE_LIMIT_15MIN"] = str(10 ** 9)
+    os.environ["STRAVA_RATE_LIMIT_DAILY"] = str(10 ** 9)
+
+
+def _install_db(db):
+    """Branche la base en mémoire à la place du client Supabase dans les modules du projet."""
+    repo_dir = os.path.dirname(os.path.abspath(__file__))
+    for module in list(sys.modules.values()):
+        module_file = getattr(module, "__file__", None) or ""
+        if module_file.startswith(repo_dir) and hasattr(module, "supabase"):
+            module.supabase = db
+
+
+def _measure(label, nb_athletes, fake, func):
+    requests_before = fake.request_count
+    served_before = fake.activities_served
+    tracemalloc.start()
+    start = time.perf_counter()
+    with contextlib.redirect_stdout(io.StringIO()):
+        func()
+    elapsed = time.perf_counter() - start
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    requests = fake.request_count - requests_before
+    activities = fake.activities_served - served_before
+    return {
+        "scenario": label,
+        "athletes": nb_athletes,
+        "seconds": round(elapsed, 2),
+        "activities": activities,
+        "activities_per_s": round(activities / elapsed, 1) if elapsed else None,
+        "requests_per_athlete": round(requests / nb_athletes, 2),
+        "peak_mem_mb": round(peak / 1e6, 1),
+    }
+
+
+def run_benchmark(sizes, mean_activities, latency, concurrency):
+    server, base_url = fake_strava.serve(fake_strava.FakeStrava())
+    _configure_env(base_url)
+    import cron_sync
+    import strava_tokens
+
+    results = []
+    for nb_athletes in sizes:
+        fake = fake_strava.build_fake(nb_athletes, mean_activities, latency=latency,
+                                      short_limit=10 ** 9, daily_limit=10 ** 9)
+        server.RequestHandlerClass.fake = fake
+        db = fake_strava.MemorySupabase()
+        _install_db(db)
+        strava_tokens._tokens.clear()
+        for athlete_id, athlete in fake.athletes.items():
+            db.table("profiles").insert({
+                "id_strava": athlete_id,
+                "firstname": athlete["firstname"],
+                "lastname": athlete["lastname"],
+                "refresh_token": f"refresh-{athlete_id}",
+            }).execute()
+
+        results.append(_measure("full", nb_athletes, fake, lambda: cron_sync.nightly_sync(False, max_concurrency=concurrency)))
+
+        # Quelques nouvelles sorties depuis la synchro complète
+        rng = random.Random(nb_athletes)
+        for athlete_id in fake.athletes:
+            fake.add_new_activities(athlete_id, rng.randint(0, 2))
+        results.append(_measure("partial", nb_athletes, fake, lambda: cron_sync.nightly_sync(True, max_concurrency=concurrency)))
+
+    server.shutdown()
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark de la synchro Strava -> base")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10, 100, 1000], help="nombres d'athlètes")
+    parser.add_argument("--activities", type=int, default=200, help="nombre moyen d'activités par athlète")
+    parser.add_argument("--latency", type=float, default=0.02, help="latence simulée par requête (s)")
+    parser.add_argument("--concurrency", type=int, default=4, help="athlètes synchronisés simultanément")
+    parser.add_argument("--json", action="store_true", help="sortie JSON")
+    args = parser.parse_args()
+
+    rows = run_benchmark(args.sizes, args.activities, args.latency, args.concurrency)
+    if args.json:
+        print(json.dumps(rows, indent=2))
+    else:
+        print(f"{'scénario':<9}{'athlètes':>9}{'durée s':>9}{'activités':>11}{'act/s':>9}{'req/athl.':>11}{'pic Mo':>8}")
+        for r in rows:
+            print(f"{r['scenario']:<9}{r['athletes']:>9}{r['seconds']:>9}{r['activities']:>11}{r['activities_per_s']:>9}{r['requests_per_athlete']:>11}{r['peak_mem_mb']:>8}")
@@ -0,0 +1,7 @@
+"""
+Cœur sans interface : configuration, client Strava et accès à la base.
+
+Importable par les crons, le worker, le webhook et les scripts sans charger Streamlit.
+Les modules db_operations et strava_operations en sont les adaptateurs pour l'application
+Streamlit (caches st.cache_data, session, textes traduits).
+"""
@@ -0,0 +1,20 @@
+import os
+import sys
+from dotenv import load_dotenv
+
+# --- CONFIGURATION ---
+# Variables d'environnement (.env en local, secrets GitHub Actions pour les crons).
+# Dans le processus Streamlit, st.secrets (secrets.toml / Streamlit Cloud) reste prioritaire,
+# sans que les processus headless (cron, worker, webhook) aient à importer Streamlit.
+load_dotenv()
+
+
+def get_config(key, default=None):
+    """Valeur d'une clé de configuration : st.secrets si Streamlit est chargé, sinon l'environnement."""
+    st = sys.modules.get("streamlit")
+    if st is not None:
+        try:
+            return st.secrets[key]
+        except (FileNotFoundError, AttributeError, KeyError):
+            pass
+    return os.getenv(key, default)
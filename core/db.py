@@ -0,0 +1,745 @@
+from supabase import create_client, Client
+import os
+import datetime
+from zoneinfo import ZoneInfo
+import json
+import atexit
+import contextlib
+import queue
+import hashlib
+import threading
+import concurrent.futures
+import polyline
+import sync_metrics
+from strava_cache import response_cache
+from sync_scheduler import login_poll_schedule
+from core.config import get_config
+
+# --- INIT SUPABASE HYBRIDE ---
+# st.secrets dans l'application, variables d'environnement pour le script local / GitHub Actions
+SUPABASE_URL = get_config("SUPABASE_URL")
+SUPABASE_KEY = get_config("SUPABASE_KEY")
+
+# On vérifie qu'on a bien les clés avant de créer le client
+if SUPABASE_URL and SUPABASE_KEY:
+    supabase: Client = create_client(SUPABASE_URL, SUPABASE_KEY)
+else:
+    # Pour éviter que l'import plante si on n'a pas les clés (ex: lors du build)
+    supabase = None 
+
+MAX_ROWS_FORSQL = 100000
+# Marge de recouvrement du curseur de synchro : rattrape les activités
+# uploadées en retard (ex : sortie de la veille envoyée après celle du jour)
+SYNC_CURSOR_OVERLAP = datetime.timedelta(days=3)
+
+def sync_profile_and_activities(athlete, activities, refresh_token,is_full_sync=False, is_from_ui=True):
+    """
+    Sauvegarde le profil et les activités dans Supabase.
+    Retourne les compteurs {"inserted", "updated", "skipped"} des activités, ou False en cas d'erreur.
+    """
+    try:
+       
+        # Profil déjà chargé par le run de synchro de masse, sinon lu en base
+        current = _profile_buffer.snapshot(athlete["id"]) if _profile_buffer is not None else None
+        if current is None:
+            current_profile = supabase.table("profiles").select("last_activity_date").eq("id_strava", athlete["id"]).execute()
+            current = current_profile.data[0] if current_profile.data else {}
+        current_cursor = current.get("last_activity_date")
+
+        # 1. Sauvegarde Profil (last_login = dernière connexion / sync)
+        profile_data = {
+            "id_strava": athlete["id"],
+            "firstname": athlete.get("firstname"),
+            "lastname": athlete.get("lastname"),
+            "refresh_token": refresh_token,
+            #"scope": accepted_scopes, # <--- ON AJOUTE LE SCOPE ICI
+            "avatar_url": athlete.get("profile_medium"),
+        }
+        
+        if is_from_ui:
+            now = datetime.datetime.now(datetime.timezone.utc)
+            profile_data["last_login"] = now.isoformat()
+            # Athlète actif : le cron le repasse au rythme le plus rapide
+            profile_data.update(login_poll_schedule(now))
+
+        # AJOUT : Si c'est une synchro full, on enregistre la date
+        if is_full_sync:
+            profile_data["last_full_synchro"] = datetime.datetime.now().isoformat()
+
+        if _profile_buffer is not None and _profile_buffer.snapshot(athlete["id"]) is not None:
+            _profile_buffer.update(athlete["id"], profile_data)
+        else:
+            supabase.table("profiles").upsert(profile_data).execute()
+        if is_from_ui:
+            # Incrément atomique côté base (après l'upsert : la ligne existe)
+            increment_connection(athlete["id"])
+
+        # 2. Sauvegarde Activités
+        stats = {"inserted": 0, "updated": 0, "skipped": 0}
+        if activities:
+            stats = upsert_activities(athlete["id"], activities)
+
+            # 3. Curseur de synchro incrémentale (date de la plus récente activité connue),
+            # avancé seulement une fois les activités en base : une écriture en échec
+            # laisse le curseur en place et les mêmes activités seront relues
+            newest = max(activities, key=lambda a: _parse_strava_date(a["start_date"]))
+            if not current_cursor or _parse_strava_date(newest["start_date"]) > _parse_strava_date(current_cursor):
+                write_profile(athlete["id"], {"last_activity_date": newest["start_date"]})
+        return stats
+    except Exception as e:
+        print(f"❌ Erreur Supabase : {e}")
+        return False
+
+# --- CHALLENGE DU DIMANCHE ---
+# Définition unique d'une sortie du challenge : colonne activities.is_sunday_challenge
+# et fin de la rafale du dimanche (cron_sync) s'appuient toutes deux sur elle.
+CLUB_TIMEZONE = ZoneInfo("Europe/Paris")
+SUNDAY_START_HOUR = 5          # départ le dimanche entre 5h00 et 10h59, heure du club
+SUNDAY_END_HOUR = 10
+SUNDAY_MIN_KM = 50
+
+def is_sunday_challenge_ride(a):
+    """Activité Strava (JSON API) partie un dimanche matin, d'au moins 50 km, passée par Escalquens."""
+    local = _parse_strava_date(a["start_date"]).astimezone(CLUB_TIMEZONE)
+    if local.weekday() != 6 or not SUNDAY_START_HOUR <= local.hour <= SUNDAY_END_HOUR:
+        return False
+    if (a.get('distance') or 0) / 1000 < SUNDAY_MIN_KM:
+        return False
+    # On vérifie le passage à Escalquens (Mairie : 43.517, 1.562)
+    poly = a.get('map', {}).get('summary_polyline') if a.get('map') else None
+    return bool(poly and is_passing_through_escalquens(poly))
+
+def format_activity(a, athlete_id):
+    """Convertit une activité Strava (JSON API) en ligne de la table activities."""
+    # Extraction de la polyline
+    poly = a.get('map', {}).get('summary_polyline') if a.get('map') else None
+    is_sunday_challenge = is_sunday_challenge_ride(a)
+
+    return {
+        "id_activity": a["id"],
+        "id_strava": athlete_id,
+        "name": a["name"],
+        "distance_km": a["distance"] / 1000,
+        "total_elevation_gain": a['total_elevation_gain'], 
+        "moving_time": a.get("moving_time", 0), 
+        "type": a["type"],
+        "start_date": a["start_date"],
+        "summary_polyline": poly,
+        "is_sunday_challenge": is_sunday_challenge
+    }
+
+# --- UPSERT DES ACTIVITÉS ---
+# Les lignes sont envoyées par paquets bornés (nombre de lignes ET taille du JSON,
+# les polylines pèsent lourd) écrits en parallèle. Chaque ligne porte un hash de son
+# contenu : une ligne identique à celle déjà en base n'est pas réécrite.
+# Les hashes sont relus en base à chaque synchro (d'autres processus écrivent aussi :
+# cron, réconciliation, webhook, corrections SQL) : rien n'est gardé d'un appel à l'autre.
+UPSERT_CHUNK_ROWS = 500
+UPSERT_CHUNK_BYTES = 1_000_000
+UPSERT_WORKERS = 4
+HASH_LOOKUP_IDS = 200          # ids par requête de lecture ciblée des hashes
+
+def activity_content_hash(row):
+    """Empreinte du contenu d'une ligne activities (hors colonne content_hash)."""
+    payload = json.dumps({k: v for k, v in row.items() if k != "content_hash"}, sort_keys=True, default=str)
+    return hashlib.sha1(payload.encode()).hexdigest()[:16]
+
+def _known_hashes(athlete_id, activity_ids=None):
+    """
+    {id_activity: content_hash} des activités en base d'un athlète, lus maintenant :
+    toutes, ou seulement celles de activity_ids (synchro incrémentale : quelques lignes).
+    """
+    query = lambda: supabase.table("activities").select("id_activity, content_hash").eq("id_strava", athlete_id)
+    if activity_ids is None:
+        rows = query().limit(MAX_ROWS_FORSQL).execute().data
+    else:
+        ids = list(activity_ids)
+        rows = []
+        for i in range(0, len(ids), HASH_LOOKUP_IDS):
+            rows += query().in_("id_activity", ids[i:i + HASH_LOOKUP_IDS]).execute().data
+    return {r["id_activity"]: r.get("content_hash") for r in rows}
+
+def _chunk_rows(rows):
+    """Découpe en paquets de UPSERT_CHUNK_ROWS lignes / UPSERT_CHUNK_BYTES octets maximum."""
+    chunk, size = [], 0
+    for row in rows:
+        row_size = len(json.dumps(row, default=str))
+        if chunk and (len(chunk) >= UPSERT_CHUNK_ROWS or size + row_size > UPSERT_CHUNK_BYTES):
+            yield chunk
+            chunk, size = [], 0
+        chunk.append(row)
+        size += row_size
+    if chunk:
+        yield chunk
+
+def upsert_activities(athlete_id, activities, known=None):
+    """
+    Upsert des activités Strava (JSON API) d'un athlète, avec leurs polylines.
+    known : hashes déjà lus pour cette synchro (stream_pages_to_db les partage entre ses pages),
+    sinon ceux des activités reçues sont relus en base.
+    Retourne {"inserted": n, "updated": n, "skipped": n} (skipped = contenu inchangé).
+    """
+    if known is None:
+        known = _known_hashes(athlete_id, [a["id"] for a in activities])
+    known_lock = threading.Lock()
+    stats = {"inserted": 0, "updated": 0, "skipped": 0}
+    to_write = []
+    for a in activities:
+        row = format_activity(a, athlete_id)
+        row["content_hash"] = activity_content_hash(row)
+        previous = known.get(row["id_activity"])
+        if previous == row["content_hash"]:
+            stats["skipped"] += 1
+            continue
+        stats["updated" if row["id_activity"] in known else "inserted"] += 1
+        to_write.append(row)
+
+    def write(chunk):
+        supabase.table("activities").upsert(chunk).execute()
+        with known_lock:
+            known.update({r["id_activity"]: r["content_hash"] for r in chunk})
+
+    chunks = list(_chunk_rows(to_write))
+    if len(chunks) == 1:
+        write(chunks[0])
+    elif chunks:
+        with concurrent.futures.ThreadPoolExecutor(max_workers=UPSERT_WORKERS) as executor:
+            # list() : relève la première erreur d'écriture éventuelle
+            list(executor.map(write, chunks))
+    for outcome, count in stats.items():
+        sync_metrics.add(f"activities_{outcome}", count, athlete_id)
+    if to_write:
+        # Totaux Strava de l'athlète périmés : revalidés à la prochaine lecture
+        response_cache.invalidate(athlete_id, "/stats")
+    return stats
+
+# Pages en attente d'écriture : au-delà, les threads de fetch attendent le writer
+WRITE_QUEUE_PAGES = 2
+_END_OF_PAGES = object()
+
+def stream_pages_to_db(athlete, refresh_token, pages, is_from_ui=False, on_page_written=None):
+    """
+    Ingestion en flux : chaque page (numéro, activités) produite par
+    core.strava.iter_activity_pages est formatée et upsertée dès son arrivée
+    par un thread d'écriture, via une file bornée (backpressure sur le fetch).
+    La mémoire reste bornée quel que soit l'historique de l'athlète.
+    La première page met aussi à jour le profil (et le curseur de synchro).
+    on_page_written(numéro, activités) est appelé après chaque page enregistrée, dans l'ordre.
+    Retourne les compteurs {"inserted", "updated", "skipped"} ; les erreurs (fetch ou écriture) sont relevées.
+    """
+    pending = queue.Queue(maxsize=WRITE_QUEUE_PAGES)
+    writer_failed = threading.Event()
+    state = {"stats": {"inserted": 0, "updated": 0, "skipped": 0}, "error": None, "profile_saved": False, "known": None}
+
+    def writer():
+        while True:
+            item = pending.get()
+            if item is _END_OF_PAGES:
+                return
+            page_num, page_data = item
+            try:
+                if not state["profile_saved"]:
+                    page_stats = sync_profile_and_activities(athlete, page_data, refresh_token, is_from_ui=is_from_ui)
+                    if not page_stats:
+                        raise RuntimeError(f"échec de l'enregistrement du profil {athlete['id']}")
+                    state["profile_saved"] = True
+                else:
+                    if state["known"] is None:
+                        # Hashes de l'athlète lus une fois pour toute la synchro (historique complet)
+                        state["known"] = _known_hashes(athlete["id"])
+                    page_stats = upsert_activities(athlete["id"], page_data, known=state["known"])
+                for k, v in page_stats.items():
+                    state["stats"][k] += v
+                if on_page_written:
+                    on_page_written(page_num, page_data)
+            except Exception as e:
+                state["error"] = e
+                writer_failed.set()
+                return
+
+    def put(item):
+        # put() avec timeout : on n'attend pas indéfiniment un writer tombé en erreur
+        while not writer_failed.is_set():
+            try:
+                pending.put(item, timeout=0.5)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    thread = threading.Thread(target=writer, daemon=True)
+    thread.start()
+    try:
+        for page_num, page_data in pages:
+            if page_data and not put((page_num, page_data)):
+                break
+    finally:
+        # Les pages déjà en file sont écrites avant de rendre la main
+        put(_END_OF_PAGES)
+        thread.join()
+    if state["error"]:
+        raise state["error"]
+    return state["stats"]
+
+def delete_activities(athlete_id, activity_ids):
+    """Supprime des activités d'un athlète (supprimées côté Strava) ; jamais celles d'un autre."""
+    if activity_ids:
+        supabase.table("activities").delete() \
+            .eq("id_strava", athlete_id) \
+            .in_("id_activity", list(activity_ids)) \
+            .execute()
+
+def get_activities_since(athlete_id, since_iso):
+    """Colonnes légères (empreintes de réconciliation) des activités d'un athlète depuis une date."""
+    res = supabase.table("activities") \
+        .select("id_activity, name, type, distance_km, moving_time, total_elevation_gain, start_date") \
+        .eq("id_strava", athlete_id) \
+        .gte("start_date", since_iso) \
+        .limit(MAX_ROWS_FORSQL) \
+        .execute()
+    return res.data
+
+def get_profile(athlete_id):
+    """Ligne profiles d'un athlète, ou None."""
+    res = supabase.table("profiles").select("*").eq("id_strava", athlete_id).execute()
+    return res.data[0] if res.data else None
+
+# --- ÉCRITURES DIFFÉRÉES DES PROFILS (SYNCHROS DE MASSE) ---
+# Pendant un run du cron, les mises à jour de profiles (tokens, curseurs, fréquence de
+# synchro, last_full_synchro, compteur de connexions) sont regroupées en mémoire puis
+# écrites par paquets de PROFILE_FLUSH_SIZE athlètes : un upsert groupé + un appel RPC
+# increment_connections, au lieu de plusieurs allers-retours par athlète.
+# Le vidage est déclenché par la boucle du run (flush_profile_writes), jamais pendant la
+# synchro d'un athlète ; une écriture en échec reste en attente pour le vidage suivant.
+# Hors d'un bloc buffered_profile_writes (UI), les écritures sont immédiates.
+PROFILE_FLUSH_SIZE = 25
+
+class ProfileWriteBuffer:
+    """Mises à jour de profiles en attente, fusionnées par athlète."""
+
+    def __init__(self, profiles=(), flush_size=PROFILE_FLUSH_SIZE):
+        self.known = {p["id_strava"]: dict(p) for p in profiles}
+        self.flush_size = flush_size
+        self.pending = {}
+        self.increments = {}
+        self.lock = threading.RLock()
+        self.flush_lock = threading.Lock()   # un seul vidage à la fois, sans bloquer les update()
+
+    def snapshot(self, athlete_id):
+        """Profil connu du run, avec les modifications en attente ; None si l'athlète est inconnu."""
+        with self.lock:
+            if athlete_id not in self.known:
+                return None
+            return {**self.known[athlete_id], **self.pending.get(athlete_id, {})}
+
+    def pending_for(self, athlete_id):
+        """Colonnes de l'athlète pas encore écrites en base."""
+        with self.lock:
+            return dict(self.pending.get(athlete_id, {}))
+
+    def update(self, athlete_id, fields, urgent=False):
+        """
+        Met des colonnes en attente ; urgent=True écrit tout de suite la ligne de l'athlète
+        (en cas d'échec, elle reste en attente et l'erreur est relevée).
+        """
+        with self.lock:
+            self.pending.setdefault(athlete_id, {}).update(fields)
+        if not urgent:
+            return
+        # Après un vidage en cours : il ne doit pas réécrire une valeur plus ancienne par-dessus
+        with self.flush_lock:
+            with self.lock:
+                row = dict(self.pending.get(athlete_id) or {})
+            if row:
+                self._write({athlete_id: row}, {})
+                self._written({athlete_id: row}, {})
+
+    def increment_connection(self, athlete_id):
+        with self.lock:
+            self.increments[athlete_id] = self.increments.get(athlete_id, 0) + 1
+
+    def is_due(self):
+        with self.lock:
+            return len(self.pending) >= self.flush_size
+
+    def flush(self):
+        """Écrit tout ce qui est en attente ; en cas d'erreur rien n'est retiré (réessai au vidage suivant)."""
+        with self.flush_lock:
+            with self.lock:
+                pending = {athlete_id: dict(fields) for athlete_id, fields in self.pending.items()}
+                increments = dict(self.increments)
+            if pending or increments:
+                self._write(pending, increments)
+                self._written(pending, increments)
+
+    def _written(self, pending, increments):
+        """Écriture réussie : valeurs reportées dans known, retirées de l'attente si inchangées depuis."""
+        with self.lock:
+            for athlete_id, fields in pending.items():
+                self.known.setdefault(athlete_id, {"id_strava": athlete_id}).update(fields)
+                current = self.pending.get(athlete_id)
+                if current is None:
+                    continue
+                for column, value in fields.items():
+                    if column in current and current[column] == value:
+                        del current[column]
+                if not current:
+                    del self.pending[athlete_id]
+            for athlete_id, n in increments.items():
+                left = self.increments.get(athlete_id, 0) - n
+                if left > 0:
+                    self.increments[athlete_id] = left
+                else:
+                    self.increments.pop(athlete_id, None)
+
+    def _write(self, pending, increments):
+        # PostgREST attend les mêmes colonnes sur toutes les lignes d'un upsert groupé
+        by_columns = {}
+        for athlete_id, fields in pending.items():
+            by_columns.setdefault(tuple(sorted(fields)), []).append({"id_strava": athlete_id, **fields})
+        for rows in by_columns.values():
+            supabase.table("profiles").upsert(rows).execute()
+        # Une connexion = +1 ; plusieurs connexions du même athlète : une entrée par connexion
+        target_ids = [athlete_id for athlete_id, n in increments.items() for _ in range(n)]
+        if target_ids:
+            supabase.rpc("increment_connections", {"target_ids": target_ids}).execute()
+
+_profile_buffer = None
+
+@contextlib.contextmanager
+def buffered_profile_writes(profiles=()):
+    """Bloc de synchro de masse : écritures de profiles différées, vidées en sortie (même sur erreur)."""
+    global _profile_buffer
+    buffer = ProfileWriteBuffer(profiles)
+    _profile_buffer = buffer
+    # Arrêt brutal du processus (sys.exit dans un thread, fin du job) : dernier vidage
+    atexit.register(buffer.flush)
+    try:
+        yield buffer
+    finally:
+        _profile_buffer = None
+        atexit.unregister(buffer.flush)
+        buffer.flush()
+
+def flush_profile_writes(force=False):
+    """
+    Vidage des écritures de profiles du run en cours, depuis la boucle du run : seulement
+    si le paquet est plein (ou force=True). Une erreur est journalisée au niveau du run
+    et les écritures restent en attente. Retourne False si le vidage a échoué.
+    """
+    buffer = _profile_buffer
+    if buffer is None or not (force or buffer.is_due()):
+        return True
+    try:
+        buffer.flush()
+        return True
+    except Exception as e:
+        print(f"⚠️ Écriture groupée des profils en échec ({len(buffer.pending)} athlète(s) en attente, réessai au prochain vidage) : {e}")
+        sync_metrics.record_error(e)
+        return False
+
+def write_profile(athlete_id, fields, urgent=False):
+    """Met à jour des colonnes de profiles (différé pendant une synchro de masse)."""
+    buffer = _profile_buffer
+    if buffer is not None and buffer.snapshot(athlete_id) is not None:
+        buffer.update(athlete_id, fields, urgent=urgent)
+    else:
+        supabase.table("profiles").update(fields).eq("id_strava", athlete_id).execute()
+
+def increment_connection(athlete_id):
+    """+1 connexion (RPC increment_connection, regroupé en increment_connections pendant un run)."""
+    buffer = _profile_buffer
+    if buffer is not None and buffer.snapshot(athlete_id) is not None:
+        buffer.increment_connection(athlete_id)
+    else:
+        supabase.rpc("increment_connection", {"target_id": athlete_id}).execute()
+
+def get_activity_counts():
+    """{id_strava: nb_activités} depuis la vue athlete_activity_counts (coût des synchros complètes)."""
+    res = supabase.table("athlete_activity_counts").select("id_strava, nb_activities").limit(MAX_ROWS_FORSQL).execute()
+    return {r["id_strava"]: r["nb_activities"] for r in res.data}
+
+def get_recent_activity_counts(since_iso):
+    """{id_strava: nb_activités depuis since_iso} pour tout le club (cadence de synchro)."""
+    res = supabase.table("activities").select("id_strava").gte("start_date", since_iso).limit(MAX_ROWS_FORSQL).execute()
+    counts = {}
+    for r in res.data:
+        counts[r["id_strava"]] = counts.get(r["id_strava"], 0) + 1
+    return counts
+
+def save_poll_schedule(athlete_id, interval_hours, next_poll_at):
+    """Intervalle de synchro partielle de l'athlète et date du prochain passage du cron."""
+    write_profile(athlete_id, {
+        "poll_interval_hours": interval_hours,
+        "next_poll_at": next_poll_at.isoformat(),
+    })
+
+def get_challenge_members(since_iso):
+    """
+    Profils des membres (approuvés) des groupes dont le challenge dominical est actif,
+    c.-à-d. qui comptent au moins une sortie challenge depuis since_iso.
+    """
+    active = supabase.table("group_activities") \
+        .select("group_id") \
+        .eq("is_sunday_challenge", True) \
+        .gte("start_date", since_iso) \
+        .limit(MAX_ROWS_FORSQL) \
+        .execute()
+    group_ids = list({r["group_id"] for r in active.data})
+    if not group_ids:
+        return []
+    members = supabase.table("group_members") \
+        .select("athlete_id") \
+        .in_("group_id", group_ids) \
+        .eq("status", "approved") \
+        .execute()
+    athlete_ids = list({m["athlete_id"] for m in members.data})
+    if not athlete_ids:
+        return []
+    return supabase.table("profiles").select("*").in_("id_strava", athlete_ids).execute().data
+
+def save_token_health(athlete_id, failures, retry_after=None):
+    """Échecs consécutifs du refresh token et date du prochain essai (None = token sain)."""
+    write_profile(athlete_id, {
+        "token_failures": failures,
+        "token_retry_after": retry_after.isoformat() if retry_after else None,
+    })
+
+def save_full_sync_checkpoint(athlete_id, before_date):
+    """
+    Point de reprise d'une synchro complète : date de départ de la plus ancienne activité
+    déjà enregistrée (None = pas de synchro complète en cours).
+    """
+    # Écrit immédiatement : c'est le point de reprise si le run s'arrête
+    write_profile(athlete_id, {"full_sync_before": before_date}, urgent=True)
+
+def finish_full_sync(athlete_id):
+    """Synchro complète terminée : on date la synchro et on efface le point de reprise."""
+    write_profile(athlete_id, {
+        "last_full_synchro": datetime.datetime.now().isoformat(),
+        "full_sync_before": None,
+    })
+
+def save_strava_tokens(athlete_id, access_token, refresh_token, expires_at):
+    """Persiste les tokens Strava d'un athlète (partagés entre UI et cron)."""
+    if not supabase:
+        return
+    try:
+        # Un refresh token qui change est écrit tout de suite : l'ancien ne marche plus
+        known = _profile_buffer.snapshot(athlete_id) if _profile_buffer is not None else None
+        write_profile(athlete_id, {
+            "access_token": access_token,
+            "refresh_token": refresh_token,
+            "token_expires_at": expires_at,
+        }, urgent=not known or known.get("refresh_token") != refresh_token)
+    except Exception as e:
+        print(f"⚠️ Impossible d'enregistrer les tokens de {athlete_id} : {e}")
+
+def get_stored_tokens(athlete_id):
+    """
+    Tokens Strava actuels d'un athlète, relus dans profiles (avec les écritures encore
+    en attente du run) : ils ont pu tourner dans un autre processus depuis le début du run.
+    """
+    if not supabase:
+        return None
+    res = supabase.table("profiles").select("access_token, refresh_token, token_expires_at") \
+        .eq("id_strava", athlete_id).execute()
+    row = res.data[0] if res.data else {}
+    if _profile_buffer is not None:
+        row = {**row, **{k: v for k, v in _profile_buffer.pending_for(athlete_id).items()
+                         if k in ("access_token", "refresh_token", "token_expires_at")}}
+    return row or None
+
+def save_sync_run(summary):
+    """Résumé d'un run de synchro (sync_metrics) : historique lu par la console admin."""
+    if not supabase:
+        return
+    supabase.table("sync_runs").insert({
+        "mode": summary["mode"],
+        "started_at": summary["started_at"],
+        "finished_at": summary["finished_at"],
+        "duration_s": summary["duration_s"],
+        "totals": summary["totals"],
+        "errors": summary["errors"],
+        "status_codes": summary["status_codes"],
+        "athletes": summary["athletes"],
+    }).execute()
+
+def get_sync_runs(limit=50):
+    """Derniers runs de synchro, du plus récent au plus ancien."""
+    return supabase.table("sync_runs").select("*").order("started_at", desc=True).limit(limit).execute().data
+
+def _parse_strava_date(date_str):
+    """Convertit une date ISO Strava/Supabase en datetime UTC."""
+    dt = datetime.datetime.fromisoformat(date_str.replace('Z', '+00:00'))
+    if dt.tzinfo is None:
+        dt = dt.replace(tzinfo=datetime.timezone.utc)
+    return dt
+
+def get_sync_cursor(athlete_id, profile=None):
+    """
+    Retourne le timestamp (epoch) à partir duquel demander les activités à Strava
+    (paramètre 'after'), ou None si on ne connaît encore aucune activité.
+    Utilise la colonne profiles.last_activity_date, sinon la plus récente activité en base.
+    """
+    last_date = profile.get("last_activity_date") if profile is not None else None
+    if not isinstance(last_date, str):
+        # Profil absent ou valeur vide (None / NaN quand le profil vient d'un DataFrame)
+        last_date = None
+    if not last_date:
+        res = supabase.table("profiles").select("last_activity_date").eq("id_strava", athlete_id).execute()
+        if res.data:
+            last_date = res.data[0].get("last_activity_date")
+    if not last_date:
+        res = supabase.table("activities") \
+            .select("start_date") \
+            .eq("id_strava", athlete_id) \
+            .order("start_date", desc=True) \
+            .limit(1) \
+            .execute()
+        if res.data:
+            last_date = res.data[0]["start_date"]
+    if not last_date:
+        return None
+    return int((_parse_strava_date(last_date) - SYNC_CURSOR_OVERLAP).timestamp())
+
+def is_passing_through_escalquens(poly_str):
+    """Vérifie si un point de la polyline est à < 3000m de la mairie."""
+    try:
+        points = polyline.decode(poly_str)
+        target = (43.5171, 1.5624)
+        for p in points:
+            if abs(p[0] - target[0]) < 0.03 and abs(p[1] - target[1]) < 0.005:
+                return True
+        return False
+    except:
+        return False
+    
+def get_leaderboard_data():
+    """Récupère les données consolidées pour le classement."""
+    return supabase.table("activities").select("distance_km, type, start_date, profiles(firstname, avatar_url)").execute()
+
+
+
+def get_years_for_group(group_id):
+    """Récupère les années distinctes pour un groupe spécifique"""
+    # On ne sélectionne que la colonne start_date pour être léger
+    response = supabase.table("group_years").select("year").eq("group_id", group_id).execute()
+    if response.data:
+        # response.data ressemble à: [{'year': 2026}, {'year': 2025}, {'year': 2017}]
+        # On extrait juste la valeur numérique de la clé 'year'
+        years = [row['year'] for row in response.data]
+        
+        # On trie du plus récent au plus ancien
+        return sorted(years, reverse=True)
+    return [2026]
+
+
+# Option plus performante si vous avez des milliers d'activités
+def get_leaderboard_by_group_by_year(group_id, year):
+    start_date = f"{year}-01-01"
+    end_date = f"{year}-12-31"
+    
+    return supabase.table("group_activities")\
+        .select("*")\
+        .eq("group_id", group_id)\
+        .eq("type", "Ride")\
+        .gte("start_date", start_date)\
+        .lte("start_date", end_date)\
+        .limit(MAX_ROWS_FORSQL)\
+        .execute()
+
+def get_leaderboard_by_group(group_id):
+    """Récupère les activités Ride pour un groupe, incluant la date pour le tri"""
+    return supabase.table("group_activities")\
+        .select("firstname, avatar_url, distance_km, total_elevation_gain, start_date, type")\
+        .eq("group_id", group_id)\
+        .eq("type", "Ride")\
+        .limit(MAX_ROWS_FORSQL)\
+        .execute() # On filtre directement 'Ride' ici pour alléger le transfert
+
+def get_athlete_summary(athlete_id):
+    """Récupère le nombre total d'activités et les 30 plus récentes."""
+    # 1. Compter le total
+    # Si Supabase :
+    count_res = supabase.table("activities").select("*", count="exact").eq("id_strava", athlete_id).execute()
+    total_count = count_res.count if count_res else 0
+
+    # 2. Récupérer les N dernières
+    activities_res = supabase.table("activities") \
+        .select("*") \
+        .eq("id_strava", athlete_id) \
+        .order("start_date", desc=True) \
+        .limit(100) \
+        .execute()
+    return total_count, activities_res.data
+
+
+# --- GESTION DES GROUPES ---
+
+def create_group(name, admin_id):
+    """Crée un nouveau groupe dont l'admin est l'utilisateur actuel"""
+    data = {"name": name, "admin_id": admin_id}
+    # On insère le groupe et on ajoute automatiquement l'admin comme membre approuvé
+    response = supabase.table("groups").insert(data).execute()
+    if response.data:
+        group_id = response.data[0]['id']
+        supabase.table("group_members").insert({
+            "group_id": group_id,
+            "athlete_id": admin_id,
+            "status": "approved"
+        }).execute()
+    return response
+
+def get_all_groups():
+    """Récupère la liste de tous les groupes disponibles"""
+    return supabase.table("groups").select("*").execute()
+
+def get_user_memberships(athlete_id):
+    """Récupère les groupes auxquels l'utilisateur appartient (approuvé ou non)"""
+    return supabase.table("group_members")\
+        .select("group_id, status, groups(name)")\
+        .eq("athlete_id", athlete_id).execute()
+
+def request_to_join_group(group_id, athlete_id):
+    """Envoie une demande d'adhésion à un groupe"""
+    data = {"group_id": group_id, "athlete_id": athlete_id, "status": "pending"}
+    return supabase.table("group_members").insert(data).execute()
+
+def get_pending_requests_for_admin(admin_id):
+    """Récupère les demandes en attente pour les groupes gérés par cet admin"""
+    # On cherche les groupes où l'utilisateur est admin
+    admin_groups = supabase.table("groups").select("id").eq("admin_id", admin_id).execute()
+    group_ids = [g['id'] for g in admin_groups.data]
+    
+    if not group_ids:
+        return []
+
+    return supabase.table("group_members")\
+        .select("id, status, groups(name), profiles(firstname)")\
+        .in_("group_id", group_ids)\
+        .eq("status", "pending").execute()
+
+def update_membership_status(membership_id, status="approved"):
+    """Approuve ou refuse un membre"""
+    return supabase.table("group_members").update({"status": status}).eq("id", membership_id).execute()
+
+def get_activities_for_athlete(athlete_id):
+    """
+    Récupère toutes les activités d'un athlète spécifique via son ID Strava.
+    Triées par date décroissante (la plus récente en premier).
+    """
+    try:
+        response = supabase.table("activities") \
+            .select("*") \
+            .eq("id_strava", athlete_id) \
+            .eq("type", "Ride")\
+            .order("start_date", desc=True) \
+            .execute()
+        
+        return response
+        
+    except Exception as e:
+        print(f"Erreur lors de la récupération des activités pour {athlete_id}: {e}")
+        # On retourne un objet vide ou une structure compatible en cas d'erreur
+        return None
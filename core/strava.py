@@ -0,0 +1,222 @@
+import os
+import datetime
+import contextvars
+import concurrent.futures
+import sync_metrics
+from strava_ratelimit import rate_limiter, RateLimitExceeded
+from strava_http import strava_get, strava_get_cached, strava_post, POOL_SIZE, STRAVA_API_URL, STRAVA_TOKEN_URL
+from core.config import get_config
+
+STRAVA_CLIENT_ID = get_config("STRAVA_CLIENT_ID")
+STRAVA_CLIENT_SECRET = get_config("STRAVA_CLIENT_SECRET")
+STRAVA_REDIRECT_URI = get_config("STRAVA_REDIRECT_URI")
+
+def exchange_refresh_token(refresh_token):
+    """Échange le refresh token contre un nouvel access token."""
+    res = strava_post(STRAVA_TOKEN_URL, data={
+        'client_id': STRAVA_CLIENT_ID,
+        'client_secret': STRAVA_CLIENT_SECRET,
+        'refresh_token': refresh_token,
+        'grant_type': 'refresh_token'
+    })
+    return res.json() if res.status_code == 200 else None
+
+def get_strava_auth_url():
+    # On demande explicitement le droit de lire les activités
+    scopes = "read,activity:read_all"
+    
+    params = {
+        "client_id": STRAVA_CLIENT_ID,
+        "response_type": "code",
+        "redirect_uri": STRAVA_REDIRECT_URI,
+        "approval_prompt": "force",
+        "scope": scopes
+    }
+    
+    # Utiliser urllib pour encoder proprement les paramètres
+    import urllib.parse
+    return f"https://www.strava.com/oauth/authorize?{urllib.parse.urlencode(params)}"
+
+def exchange_code_for_token(code):
+    res = strava_post(STRAVA_TOKEN_URL, data={
+        'client_id': STRAVA_CLIENT_ID,
+        'client_secret': STRAVA_CLIENT_SECRET,
+        'code': code,
+        'grant_type': 'authorization_code'
+    })
+    return res.json() if res.status_code == 200 else None
+
+def fetch_strava_activities(access_token, after_timestamp, per_page=200):
+    """
+    Récupère toutes les activités postérieures à after_timestamp (epoch).
+    Strava renvoie les pages dans l'ordre chronologique quand 'after' est fourni.
+    Lève PaginationError si une page échoue : une liste vide veut toujours dire « rien de nouveau ».
+    """
+    return fetch_all_activities_parallel(access_token, per_page=per_page, after=after_timestamp)
+
+class PaginationError(Exception):
+    """Une page d'activités n'a pas pu être récupérée : la suite de l'historique est inconnue."""
+
+def _request_page(access_token, page, per_page=200, after=None, before=None, reserve=0):
+    """Récupère une page d'activités ; None en cas d'erreur (à distinguer d'une page vide)."""
+    url = f"{STRAVA_API_URL}/athlete/activities"
+    headers = {'Authorization': f'Bearer {access_token}'}
+    params = {'page': page, 'per_page': per_page}
+    if after is not None:
+        params['after'] = int(after)
+    if before is not None:
+        params['before'] = int(before)
+    
+    response = strava_get(url, headers=headers, params=params, reserve=reserve)
+    if response.status_code == 200:
+        return response.json()
+    else:
+        print(f"❌ Erreur API Strava : {response.status_code}")
+        if response.status_code == 429:
+            # Récupération des infos de limite dans les headers
+            usage = response.headers.get('X-ReadRateLimit-Usage', 'Inconnu')
+            limit = response.headers.get('X-ReadRateLimit-Limit', 'Inconnu')
+            print(f"🛑 LIMITE STRAVA DÉPASSÉE (429) ! 📊 Usage actuel (15min, 24h) : {usage}📊 Limites autorisées : {limit}")
+    return None
+
+def fetch_page(access_token, page, per_page=200, after=None):
+    """Récupère une seule page d'activités (optionnellement postérieures à 'after') ; PaginationError si elle échoue."""
+    page_data = _request_page(access_token, page, per_page=per_page, after=after)
+    if page_data is None:
+        raise PaginationError(f"Page {page} non récupérée (erreur API)")
+    return page_data
+
+def iter_activity_pages(access_token, per_page=200, after=None, before=None, max_window=POOL_SIZE, max_pages=None, reserve=0):
+    """
+    Générateur de pages d'activités (numéro, liste), dans l'ordre des pages.
+    Sonde l'historique par fenêtres parallèles de taille croissante (1, 2, 4... max_window)
+    et s'arrête à la première page incomplète ou vide : un athlète avec 150 activités
+    ne coûte qu'une requête, un athlète avec 10 000 activités n'est plus tronqué.
+    max_pages reste un garde-fou optionnel (None = pas de limite).
+    'before' (epoch) fige le haut de l'historique : la numérotation des pages reste stable
+    même si l'athlète enregistre une sortie pendant la pagination.
+    'reserve' : requêtes de la fenêtre de 15 min que cette pagination laisse aux autres appels.
+    """
+    page = 1
+    window = 1
+    with concurrent.futures.ThreadPoolExecutor(max_workers=max_window) as executor:
+        while max_pages is None or page <= max_pages:
+            last = page + window - 1 if max_pages is None else min(page + window - 1, max_pages)
+            pages = list(range(page, last + 1))
+            # Contexte copié : les requêtes des threads restent attribuées à l'athlète (sync_metrics)
+            futures = [executor.submit(contextvars.copy_context().run, _request_page, access_token, p, per_page, after, before, reserve)
+                       for p in pages]
+            for p, future in zip(pages, futures):
+                page_data = future.result()
+                if page_data is None:
+                    # Page en erreur : on ne sait pas si l'historique continue
+                    raise PaginationError(f"Pagination interrompue à la page {p} (erreur API)")
+                sync_metrics.add("pages")
+                sync_metrics.add("activities_fetched", len(page_data))
+                yield p, page_data
+                if len(page_data) < per_page:
+                    return
+            page = last + 1
+            window = min(window * 2, max_window)
+
+def fetch_all_activities_parallel(access_token, max_pages=None, per_page=200, after=None):
+    """
+    Récupère tout l'historique via la pagination adaptative, sans doublons.
+    Une page en erreur lève PaginationError (et une erreur réseau son exception) : l'appelant
+    signale l'échec au lieu de prendre un historique tronqué pour complet.
+    """
+    activities_by_id = {}
+    for _, page_data in iter_activity_pages(access_token, per_page=per_page, after=after, max_pages=max_pages):
+        # Dédoublonnage par id : une activité peut glisser d'une page à l'autre pendant la pagination
+        for a in page_data:
+            activities_by_id[a["id"]] = a
+    return list(activities_by_id.values())
+
+# --- HISTORIQUE D'UN NOUVEAU MEMBRE ---
+# À la première connexion, l'historique est récupéré par année civile, de la plus récente
+# à la plus ancienne : l'année en cours (celle des challenges) est en base en quelques
+# secondes. Peu de pages en parallèle et une réserve sur le quota de 15 min : un nouveau
+# membre attend la fenêtre suivante plutôt que de vider celle de tout le club.
+BACKFILL_MAX_WINDOW = 2
+BACKFILL_RESERVE = int(os.getenv("STRAVA_BACKFILL_RESERVE", 50))
+BACKFILL_EMPTY_YEARS = 2       # années vides d'affilée avant de considérer l'historique terminé
+STRAVA_FIRST_YEAR = 2009
+
+def backfill_windows(now, created_at=None):
+    """
+    Fenêtres (année, after, before) en epoch, de l'année en cours à l'année de création
+    du compte Strava (athlete["created_at"], sinon STRAVA_FIRST_YEAR).
+    """
+    first_year = STRAVA_FIRST_YEAR
+    if isinstance(created_at, str) and created_at:
+        try:
+            first_year = max(first_year, datetime.datetime.fromisoformat(created_at.replace('Z', '+00:00')).year)
+        except ValueError:
+            pass
+    before = now
+    for year in range(now.year, first_year - 1, -1):
+        after = datetime.datetime(year, 1, 1, tzinfo=datetime.timezone.utc)
+        yield year, after.timestamp(), before.timestamp()
+        before = after
+
+def iter_backfill_pages(access_token, after, before, per_page=200):
+    """Pages d'une fenêtre de l'historique, au rythme réduit de l'onboarding."""
+    return iter_activity_pages(access_token, per_page=per_page, after=after, before=before,
+                               max_window=BACKFILL_MAX_WINDOW, reserve=BACKFILL_RESERVE)
+
+def has_activities_before(access_token, before):
+    """
+    Une page d'une activité antérieure à before (epoch) : False si Strava n'en a aucune,
+    True sinon, None si la requête échoue.
+    """
+    page = _request_page(access_token, 1, per_page=1, before=before, reserve=BACKFILL_RESERVE)
+    if page is None:
+        return None
+    return bool(page)
+
+def fetch_activity(access_token, activity_id):
+    """
+    Récupère une activité précise.
+    Retourne {} si Strava répond 404 (activité supprimée ou invisible), None en cas d'erreur.
+    """
+    url = f"{STRAVA_API_URL}/activities/{activity_id}"
+    headers = {'Authorization': f'Bearer {access_token}'}
+    response = strava_get(url, headers=headers)
+    if response.status_code == 200:
+        return response.json()
+    if response.status_code == 404:
+        return {}
+    print(f"❌ Erreur API Strava (activité {activity_id}) : {response.status_code}")
+    return None
+
+def fetch_activity_streams(access_token, activity_id, keys, reserve=0):
+    """
+    Flux détaillés d'une activité : {type: [valeurs]} (types absents de l'activité omis).
+    {} si l'activité n'a pas de flux (saisie manuelle, supprimée) ; None en cas d'erreur.
+    """
+    url = f"{STRAVA_API_URL}/activities/{activity_id}/streams"
+    headers = {'Authorization': f'Bearer {access_token}'}
+    params = {'keys': ",".join(keys), 'key_by_type': 'true'}
+    response = strava_get(url, headers=headers, params=params, reserve=reserve)
+    if response.status_code == 200:
+        return {k: v.get("data", []) for k, v in response.json().items() if k in keys}
+    if response.status_code == 404:
+        return {}
+    print(f"❌ Erreur API Strava (flux de l'activité {activity_id}) : {response.status_code}")
+    return None
+
+def get_strava_totals(access_token, athlete_id):
+    """
+    Nombre d'activités Strava par sport : {"rides", "runs", "swims"} ; None si indisponible.
+    Réponse en cache disque (strava_cache) : les affichages répétés ne consomment pas de quota.
+    """
+    url = f"{STRAVA_API_URL}/athletes/{athlete_id}/stats"
+    headers = {'Authorization': f'Bearer {access_token}'}
+    status, data = strava_get_cached(url, athlete_id, headers=headers)
+    if status != 200:
+        return None
+    return {
+        "rides": data.get('all_ride_totals', {}).get('count', 0),
+        "runs": data.get('all_run_totals', {}).get('count', 0),
+        "swims": data.get('all_swim_totals', {}).get('count', 0),
+    }
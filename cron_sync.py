@@ -1,34 +1,46 @@
 import time
 import sys
+import asyncio
 import os
 import datetime
+import hashlib
 import traceback
-import requests
-from db_operations import *
-from strava_operations import *
+import sync_metrics
+from core.db import *
+from core.strava import *
 from dotenv import load_dotenv
 
 # --- 1. CONFIGURATION DE L'ENVIRONNEMENT ---
 load_dotenv()
 
 try:
-    from db_operations import supabase, sync_profile_and_activities, get_athlete_summary
-    from strava_operations import fetch_page, fetch_all_activities_parallel
+    from core.db import supabase, sync_profile_and_activities, get_athlete_summary, get_sync_cursor, save_full_sync_checkpoint, finish_full_sync, stream_pages_to_db, upsert_activities, delete_activities, get_activities_since, _parse_strava_date, get_activity_counts, save_token_health, get_recent_activity_counts, save_poll_schedule, get_challenge_members, buffered_profile_writes, flush_profile_writes, write_profile, save_sync_run, is_sunday_challenge_ride, CLUB_TIMEZONE
+    from core.strava import fetch_page, fetch_all_activities_parallel, fetch_strava_activities, iter_activity_pages
+    from strava_ratelimit import rate_limiter, RateLimitExceeded
+    from strava_http import strava_post, STRAVA_TOKEN_URL
+    from strava_tokens import get_valid_tokens, TokenRejected
+    from sync_scheduler import WINDOW_RESERVE, plan_full_sync, token_failures, token_retry_after, is_token_blocked, is_poll_due, poll_interval_hours, CADENCE_DAYS
 except ImportError as e:
-    print("❌ ERREUR D'IMPORT : Assurez-vous que db_operations et strava_operations sont accessibles.")
+    print("❌ ERREUR D'IMPORT : Assurez-vous que le paquet core est accessible.")
     raise e
 
 STRAVA_CLIENT_ID = os.getenv("STRAVA_CLIENT_ID")
 STRAVA_CLIENT_SECRET = os.getenv("STRAVA_CLIENT_SECRET")
+# Nombre d'athlètes synchronisés simultanément (chacun pagine déjà en parallèle)
+SYNC_CONCURRENCY = int(os.getenv("SYNC_CONCURRENCY", 4))
 
 def exchange_refresh_token_local(refresh_token):
-    """Échange le token sans dépendre de st.secrets."""
+    """
+    Échange le token sans dépendre de st.secrets.
+    Lève TokenRejected si Strava refuse le refresh token (400 / 401) ; retourne None
+    pour une erreur passagère (réseau, 5xx, 429).
+    """
     if not STRAVA_CLIENT_ID or not STRAVA_CLIENT_SECRET:
         print("❌ ERREUR : STRAVA_CLIENT_ID ou SECRET manquant.")
         return None
 
     try:
-        res = requests.post("https://www.strava.com/oauth/token", data={
+        res = strava_post(STRAVA_TOKEN_URL, data={
             'client_id': STRAVA_CLIENT_ID,
             'client_secret': STRAVA_CLIENT_SECRET,
             'refresh_token': refresh_token,
@@ -36,11 +48,118 @@ def exchange_refresh_token_local(refresh_token):
         })
         if res.status_code == 200:
             return res.json()
+        if res.status_code in (400, 401):
+            raise TokenRejected(f"refresh token refusé par Strava ({res.status_code})")
+        print(f"⚠️ Refresh du token : Strava a répondu {res.status_code}.")
         return None
+    except TokenRejected:
+        raise
     except Exception as e:
         print(f"⚠️ Exception réseau : {e}")
         return None
 
+# Nombre de pages (de 200 activités) écrites entre deux points de reprise
+FULL_SYNC_CHECKPOINT_PAGES = 5
+
+def sync_full_history(athlete_obj, access_token, refresh_token, resume_before=None):
+    """
+    Synchro complète avec points de reprise : l'historique est parcouru du plus récent
+    au plus ancien, enregistré page par page, et profiles.full_sync_before garde
+    la date de la plus ancienne activité déjà enregistrée. Si le run s'arrête (timeout,
+    429, erreur Supabase), le suivant repart de ce point au lieu du début.
+    Retourne (succès_bool, nb_activités_enregistrées).
+    """
+    athlete_id = athlete_obj["id"]
+    before_ts = None
+    if isinstance(resume_before, str) and resume_before:
+        # +1 s : on ré-inclut les activités partageant la seconde du point de reprise
+        before_ts = int(datetime.datetime.fromisoformat(resume_before.replace('Z', '+00:00')).timestamp()) + 1
+    else:
+        # Haut de l'historique figé au lancement : pages stables pendant toute la synchro
+        before_ts = int(time.time())
+
+    # Chaque page est upsertée dès réception (stream_pages_to_db) ; le point de reprise
+    # suit la plus ancienne activité écrite, pages écrites dans l'ordre
+    progress = {"saved": 0, "pages": 0, "oldest": None, "checkpointed": None}
+
+    def save_checkpoint():
+        if progress["oldest"] and progress["oldest"] != progress["checkpointed"]:
+            save_full_sync_checkpoint(athlete_id, progress["oldest"])
+            progress["checkpointed"] = progress["oldest"]
+
+    def on_page_written(page_num, page_data):
+        progress["saved"] += len(page_data)
+        progress["pages"] += 1
+        progress["oldest"] = min(a["start_date"] for a in page_data)
+        if progress["pages"] % FULL_SYNC_CHECKPOINT_PAGES == 0:
+            save_checkpoint()
+
+    pages = iter_activity_pages(access_token, before=before_ts)
+    try:
+        stats = stream_pages_to_db(athlete_obj, refresh_token, pages, on_page_written=on_page_written)
+    except RateLimitExceeded:
+        save_checkpoint()
+        raise
+    except Exception as e:
+        # Pagination ou écriture interrompue : les pages écrites sont contiguës, on repartira de là
+        print(f"⚠️ {athlete_id} : {e}")
+        sync_metrics.record_error(e)
+        try:
+            save_checkpoint()
+        except Exception as checkpoint_error:
+            print(f"⚠️ {athlete_id} : point de reprise non enregistré ({checkpoint_error})")
+        return False, progress["saved"]
+
+    saved = progress["saved"]
+    print(f"💾 {athlete_id} : {stats['inserted']} nouvelles, {stats['updated']} modifiées, {stats['skipped']} inchangées.")
+    finish_full_sync(athlete_id)
+    return True, saved
+
+def _refresh_athlete(profile):
+    """
+    Token valide et objet athlète pour une ligne profiles.
+    Retourne (athlete_obj, access_token, refresh_token), ou None si le refresh échoue.
+    """
+    athlete_id = profile['id_strava']
+    old_refresh = profile.get('refresh_token')
+
+    # Access token réutilisé tant qu'il n'expire pas (un seul refresh partagé)
+    try:
+        tokens = get_valid_tokens(athlete_id, old_refresh, profile, refresh_func=exchange_refresh_token_local)
+    except TokenRejected as e:
+        print(f"⛔ {athlete_id} : {e}")
+        sync_metrics.record_error(e)
+        # Échecs répétés : l'athlète est écarté des prochains runs avec un délai croissant
+        failures = token_failures(profile) + 1
+        save_token_health(athlete_id, failures, token_retry_after(failures, datetime.datetime.now(datetime.timezone.utc)))
+        return None
+    if not tokens or 'access_token' not in tokens:
+        # Erreur passagère (réseau, Strava indisponible) : ce n'est pas un token en échec,
+        # l'athlète repasse au prochain run sans délai supplémentaire
+        sync_metrics.record_error("TokenRefreshFailed")
+        return None
+    if token_failures(profile):
+        save_token_health(athlete_id, 0)
+
+    new_access = tokens['access_token']
+    new_refresh = tokens['refresh_token']
+
+    # Sauvegarde du nouveau token
+    # (le nouveau refresh token est déjà persisté par get_valid_tokens -> store_tokens)
+    if new_refresh != old_refresh:
+        write_profile(athlete_id, {
+            "refresh_token": new_refresh,
+            "last_login": datetime.datetime.now(datetime.timezone.utc).isoformat()
+        })
+
+    athlete_obj = {
+        "id": athlete_id,
+        "firstname": profile.get("firstname"),
+        "lastname": profile.get("lastname"),
+        "profile_medium": profile.get("avatar_url")
+    }
+    return athlete_obj, new_access, new_refresh
+
 def sync_single_athlete(profile, is_partial=True):
     """
     Synchronise un seul athlète. 
@@ -48,51 +167,273 @@ def sync_single_athlete(profile, is_partial=True):
     """
     athlete_id = profile['id_strava']
     full_name = f"{profile.get('firstname', 'Athlète')} {profile.get('lastname', '')}".strip()
-    old_refresh = profile.get('refresh_token')
 
-    if not old_refresh:
+    if not profile.get('refresh_token'):
         return False, f"⚠️ Pas de refresh token pour {full_name}."
 
     try:
-        tokens = exchange_refresh_token_local(old_refresh)
-        if not tokens or 'access_token' not in tokens:
+        refreshed = _refresh_athlete(profile)
+        if not refreshed:
             return False, f"⛔ Impossible de rafraîchir le token pour {full_name}."
+        athlete_obj, new_access, new_refresh = refreshed
 
-        new_access = tokens['access_token']
-        new_refresh = tokens['refresh_token']
-
-        # Sauvegarde du nouveau token
-        if new_refresh != old_refresh:
-            supabase.table("profiles").update({
-                "refresh_token": new_refresh,
-                "last_login": datetime.datetime.now(datetime.timezone.utc).isoformat()
-            }).eq("id_strava", athlete_id).execute()
-        
         # Récupération des activités
-        if is_partial:
-            gathered_activities = fetch_page(new_access, page=1, per_page=10)
+        if not is_partial:
+            resume_before = profile.get('full_sync_before')
+            ok, saved = sync_full_history(athlete_obj, new_access, new_refresh, resume_before)
+            resumed = " (reprise)" if isinstance(resume_before, str) and resume_before else ""
+            if not ok:
+                return False, f"⚠️ Synchro complète interrompue pour {full_name}{resumed} après {saved} activités : reprise au prochain run."
+            return True, f"✅ {saved} activités synchronisées pour {full_name}{resumed}."
+
+        # Synchro incrémentale : uniquement les activités plus récentes que le curseur
+        after_ts = get_sync_cursor(athlete_id, profile)
+        if after_ts is not None:
+            gathered_activities = fetch_strava_activities(new_access, after_ts)
         else:
-            total, recent = get_athlete_summary(athlete_id)
-            gathered_activities = fetch_all_activities_parallel(new_access)
-        
-        print(f"⚠️DEBUG⚠️ : {full_name} - {len(gathered_activities)} activités récupérées sur Strava; force full={is_partial}")
-        
+            gathered_activities = fetch_page(new_access, page=1, per_page=10)
+
         if gathered_activities:
-            athlete_obj = {
-                "id": athlete_id,
-                "firstname": profile.get("firstname"),
-                "lastname": profile.get("lastname"),
-                "profile_medium": profile.get("avatar_url")
-            }
-            sync_profile_and_activities(athlete_obj, gathered_activities, new_refresh, is_from_ui=False, is_full_sync=not is_partial)
-            return True, f"✅ {len(gathered_activities)} activités synchronisées pour {full_name}."
+            stats = sync_profile_and_activities(athlete_obj, gathered_activities, new_refresh, is_from_ui=False)
+            if not stats:
+                return False, f"❌ Échec de l'enregistrement pour {full_name}."
+            return True, (f"✅ {len(gathered_activities)} activités synchronisées pour {full_name} "
+                          f"({stats['inserted']} nouvelles, {stats['updated']} modifiées, {stats['skipped']} inchangées).")
         else:
             return True, f"ℹ️ Aucune activité mise à jour pour {full_name}."
 
+    except RateLimitExceeded:
+        # Quota du jour épuisé : on remonte l'info pour arrêter le batch
+        raise
+    except PaginationError as e:
+        # Activités non récupérées : échec (prochain passage inchangé), pas « rien de nouveau »
+        sync_metrics.record_error(e)
+        return False, f"⚠️ Activités de {full_name} non récupérées ({e}) : nouvel essai au prochain passage."
     except Exception as e:
+        sync_metrics.record_error(e)
         return False, f"❌ Erreur inattendue pour {full_name} : {e}"
 
 
+# --- RÉCONCILIATION PAR FENÊTRES ---
+# Les modifications faites après coup sur Strava (renommage, correction de distance,
+# Ride -> VirtualRide, suppression) échappent à la synchro incrémentale. On compare
+# des empreintes par fenêtre de RECONCILE_WINDOW_DAYS jours sur les RECONCILE_HORIZON_DAYS
+# derniers jours, et seules les fenêtres qui diffèrent sont corrigées en base.
+RECONCILE_HORIZON_DAYS = int(os.getenv("RECONCILE_HORIZON_DAYS", 90))
+RECONCILE_WINDOW_DAYS = int(os.getenv("RECONCILE_WINDOW_DAYS", 7))
+
+def _fingerprint_row(activity_id, name, activity_type, distance_km, moving_time, elevation):
+    """Champs comparés (normalisés identiquement côté Strava et côté base)."""
+    return (int(activity_id), name or "", activity_type or "", round(float(distance_km or 0), 2),
+            int(moving_time or 0), round(float(elevation or 0), 1))
+
+def _window_fingerprints(rows, horizon_ts, window_seconds):
+    """
+    rows : liste de (timestamp, tuple _fingerprint_row).
+    Retourne {fenêtre: (nb, distance totale, id max, digest)} et {fenêtre: [ids]}.
+    """
+    grouped = {}
+    for ts, row in rows:
+        grouped.setdefault(int((ts - horizon_ts) // window_seconds), []).append(row)
+    fingerprints = {}
+    for window, window_rows in grouped.items():
+        window_rows.sort()
+        digest = hashlib.sha1(repr(window_rows).encode()).hexdigest()[:12]
+        fingerprints[window] = (len(window_rows), round(sum(r[3] for r in window_rows), 1),
+                                max(r[0] for r in window_rows), digest)
+    return fingerprints, {w: [r[0] for r in rs] for w, rs in grouped.items()}
+
+def reconcile_athlete(athlete_obj, access_token, horizon_days=RECONCILE_HORIZON_DAYS, window_days=RECONCILE_WINDOW_DAYS):
+    """
+    Compare Strava et la table activities fenêtre par fenêtre sur l'horizon,
+    puis réécrit / supprime uniquement les activités des fenêtres différentes.
+    Retourne (nb_fenêtres_corrigées, nb_fenêtres, stats_upsert, nb_supprimées).
+    """
+    athlete_id = athlete_obj["id"]
+    horizon_ts = int(time.time()) - horizon_days * 86400
+    window_seconds = window_days * 86400
+
+    # Résumés Strava de l'horizon (quelques pages) : la pagination lève en cas d'erreur,
+    # une liste incomplète ne doit jamais provoquer de suppressions
+    strava_by_id = {}
+    for _, page_data in iter_activity_pages(access_token, after=horizon_ts):
+        for a in page_data:
+            strava_by_id[a["id"]] = a
+    strava_fp, strava_ids = _window_fingerprints([
+        (_parse_strava_date(a["start_date"]).timestamp(),
+         _fingerprint_row(a["id"], a.get("name"), a.get("type"), (a.get("distance") or 0) / 1000,
+                          a.get("moving_time"), a.get("total_elevation_gain")))
+        for a in strava_by_id.values()
+    ], horizon_ts, window_seconds)
+
+    since_iso = datetime.datetime.fromtimestamp(horizon_ts, datetime.timezone.utc).isoformat()
+    db_rows = []
+    for r in get_activities_since(athlete_id, since_iso):
+        ts = _parse_strava_date(r["start_date"]).timestamp()
+        if ts > horizon_ts:  # même borne que le paramètre after de Strava
+            db_rows.append((ts, _fingerprint_row(r["id_activity"], r.get("name"), r.get("type"), r.get("distance_km"),
+                                                 r.get("moving_time"), r.get("total_elevation_gain"))))
+    db_fp, db_ids = _window_fingerprints(db_rows, horizon_ts, window_seconds)
+
+    windows = set(strava_fp) | set(db_fp)
+    stale = sorted(w for w in windows if strava_fp.get(w) != db_fp.get(w))
+    to_upsert = [strava_by_id[i] for w in stale for i in strava_ids.get(w, [])]
+    to_delete = [i for w in stale for i in db_ids.get(w, []) if i not in strava_by_id]
+
+    stats = {"inserted": 0, "updated": 0, "skipped": 0}
+    if to_upsert:
+        stats = upsert_activities(athlete_id, to_upsert)
+    delete_activities(athlete_id, to_delete)
+    return len(stale), len(windows), stats, len(to_delete)
+
+def reconcile_single_athlete(profile):
+    """Réconciliation d'un athlète. Retourne (succès_bool, message_string)."""
+    full_name = f"{profile.get('firstname', 'Athlète')} {profile.get('lastname', '')}".strip()
+    if not profile.get('refresh_token'):
+        return False, f"⚠️ Pas de refresh token pour {full_name}."
+    try:
+        refreshed = _refresh_athlete(profile)
+        if not refreshed:
+            return False, f"⛔ Impossible de rafraîchir le token pour {full_name}."
+        athlete_obj, new_access, _ = refreshed
+        stale, windows, stats, deleted = reconcile_athlete(athlete_obj, new_access)
+        if not stale:
+            return True, f"ℹ️ {full_name} : {windows} fenêtres identiques."
+        return True, (f"🔁 {full_name} : {stale}/{windows} fenêtres corrigées "
+                      f"({stats['inserted']} ajoutées, {stats['updated']} modifiées, {deleted} supprimées).")
+    except RateLimitExceeded:
+        raise
+    except Exception as e:
+        sync_metrics.record_error(e)
+        return False, f"❌ Erreur de réconciliation pour {full_name} : {e}"
+
+def nightly_reconcile(max_concurrency=SYNC_CONCURRENCY):
+    """Réconciliation de masse (Cron) : python cron_sync.py reconcile"""
+    print(f"\n[{datetime.datetime.now()}] --- 🔁 DÉBUT DE LA RÉCONCILIATION ({RECONCILE_HORIZON_DAYS} j) ---")
+    if not supabase: return
+
+    profiles = supabase.table("profiles").select("*").execute().data
+    with buffered_profile_writes(profiles):
+        results = asyncio.run(sync_athletes_async(profiles, True, max_concurrency, sync_func=reconcile_single_athlete))
+    success_count = sum(1 for success, _ in results if success)
+    print(f"[{datetime.datetime.now()}] --- TERMINÉ : {success_count} OK, {len(results) - success_count} Erreurs ---")
+
+
+# --- RAFALE DU DIMANCHE ---
+# Après la sortie club, les membres des groupes dont le challenge est actif sont interrogés
+# en boucle via le curseur incrémental, jusqu'à l'arrivée d'une sortie du challenge
+# (core.db.is_sunday_challenge_ride, la définition de la colonne is_sunday_challenge) ou l'heure limite. L'intervalle entre deux interrogations d'un même
+# athlète double à chaque passage sans nouveauté (15, 30, 60 min...) pour que ceux qui
+# n'ont pas roulé ne consomment pas le quota.
+SUNDAY_DEADLINE_HOUR = int(os.getenv("SUNDAY_DEADLINE_HOUR", 16))
+SUNDAY_POLL_MINUTES = 15
+SUNDAY_MAX_POLL_MINUTES = 60
+ACTIVE_CHALLENGE_WEEKS = 8
+
+def _is_challenge_morning_ride(activity, sunday):
+    """Sortie du challenge (même règle que la colonne is_sunday_challenge) partie le dimanche `sunday`."""
+    local = _parse_strava_date(activity["start_date"]).astimezone(CLUB_TIMEZONE)
+    return local.date() == sunday and is_sunday_challenge_ride(activity)
+
+def _burst_poll(profile, sunday):
+    """
+    Une interrogation incrémentale d'un athlète.
+    Retourne True si une sortie du challenge est arrivée et enregistrée, False sinon
+    (l'athlète reste dans la rafale, y compris si l'écriture en base a échoué), None si le token échoue.
+    Une page d'activités en erreur lève PaginationError : comptée en erreur, l'athlète reste dans la rafale.
+    """
+    with sync_metrics.athlete(profile['id_strava']):
+        refreshed = _refresh_athlete(profile)
+        if not refreshed:
+            return None
+        athlete_obj, access_token, refresh_token = refreshed
+        after_ts = get_sync_cursor(profile['id_strava'], profile)
+        if after_ts is not None:
+            activities = fetch_strava_activities(access_token, after_ts)
+        else:
+            activities = fetch_page(access_token, page=1, per_page=10)
+        if not activities:
+            return False
+        if not sync_profile_and_activities(athlete_obj, activities, refresh_token, is_from_ui=False):
+            # Écriture en échec : curseur inchangé, les mêmes activités seront relues au prochain passage
+            print(f"⚠️ {profile['id_strava']} : activités non enregistrées, nouvel essai au prochain passage.")
+            return False
+    # Curseur local à jour pour le passage suivant
+    profile['last_activity_date'] = max(activities, key=lambda a: _parse_strava_date(a["start_date"]))["start_date"]
+    return any(_is_challenge_morning_ride(a, sunday) for a in activities)
+
+def sunday_burst_sync(max_concurrency=SYNC_CONCURRENCY):
+    """Rafale du dimanche (Cron) : python cron_sync.py sunday"""
+    now_local = datetime.datetime.now(CLUB_TIMEZONE)
+    sunday = now_local.date()
+    deadline = now_local.replace(hour=SUNDAY_DEADLINE_HOUR, minute=0, second=0, microsecond=0)
+    print(f"\n[{datetime.datetime.now()}] --- 🥐 RAFALE DU DIMANCHE jusqu'à {deadline:%H:%M} ---")
+    if not supabase: return
+    if now_local.weekday() != 6:
+        print("ℹ️ Pas dimanche : rien à faire.")
+        return
+
+    since_iso = (now_local - datetime.timedelta(weeks=ACTIVE_CHALLENGE_WEEKS)).isoformat()
+    pending = {p['id_strava']: p for p in get_challenge_members(since_iso)
+               if p.get('refresh_token') and not is_token_blocked(p, now_local)}
+    next_poll = {athlete_id: now_local for athlete_id in pending}
+    delay = {athlete_id: SUNDAY_POLL_MINUTES for athlete_id in pending}
+    arrived = 0
+    print(f"👥 {len(pending)} membres de groupes au challenge actif.")
+
+    with buffered_profile_writes(pending.values()):
+        while pending and datetime.datetime.now(CLUB_TIMEZONE) < deadline:
+            now_local = datetime.datetime.now(CLUB_TIMEZONE)
+            due = [pending[i] for i in pending if next_poll[i] <= now_local]
+            budget = rate_limiter.status()
+            day_left = budget['daily_limit'] - budget['day_used'] - WINDOW_RESERVE
+            if len(due) > day_left:
+                # On garde de quoi servir l'UI et le cron du soir
+                print(f"🛑 Quota du jour insuffisant ({day_left} requêtes restantes) : fin de la rafale.")
+                break
+
+            async def poll_due():
+                semaphore = asyncio.Semaphore(max_concurrency)
+                async def run_one(profile):
+                    async with semaphore:
+                        try:
+                            return profile['id_strava'], await asyncio.to_thread(_burst_poll, profile, sunday)
+                        except RateLimitExceeded:
+                            raise
+                        except Exception as e:
+                            print(f"⚠️ {profile['id_strava']} : {e}")
+                            sync_metrics.record_error(e, profile['id_strava'])
+                            return profile['id_strava'], False
+                return await asyncio.gather(*(run_one(p) for p in due))
+
+            try:
+                results = asyncio.run(poll_due()) if due else []
+            except RateLimitExceeded as e:
+                print(f"🛑 {e} : fin de la rafale.")
+                break
+            for athlete_id, got_ride in results:
+                if got_ride is None:
+                    print(f"⛔ {athlete_id} : token en échec, retiré de la rafale.")
+                    del pending[athlete_id]
+                elif got_ride:
+                    arrived += 1
+                    print(f"🚴 {pending[athlete_id].get('firstname', athlete_id)} : sortie du dimanche enregistrée.")
+                    del pending[athlete_id]
+                else:
+                    next_poll[athlete_id] = now_local + datetime.timedelta(minutes=delay[athlete_id])
+                    delay[athlete_id] = min(SUNDAY_MAX_POLL_MINUTES, delay[athlete_id] * 2)
+
+            # Curseurs et tokens écrits à chaque tour : la rafale dure plusieurs heures
+            flush_profile_writes(force=True)
+            if pending:
+                wake_up = min(min(next_poll[i] for i in pending), deadline)
+                time.sleep(max(1, (wake_up - datetime.datetime.now(CLUB_TIMEZONE)).total_seconds()))
+
+    budget = rate_limiter.status()
+    print(f"📊 Quota Strava : {budget['short_used']}/{budget['short_limit']} (15 min), {budget['day_used']}/{budget['daily_limit']} (jour)")
+    print(f"[{datetime.datetime.now()}] --- TERMINÉ : {arrived} sorties arrivées, {len(pending)} sans sortie ---")
+
+
 def nightly_sync_old(yesForOnlyRecentFalseForAll):
     """Synchronisation de masse (Cron)"""
     print(f"\n[{datetime.datetime.now()}] --- 🚀 DÉBUT DE LA SYNCHRONISATION BATCH ---")
@@ -109,71 +450,151 @@ def nightly_sync_old(yesForOnlyRecentFalseForAll):
 
     print(f"[{datetime.datetime.now()}] --- TERMINÉ : {success_count} OK, {error_count} Erreurs ---")
 
-import datetime
+def needs_full_sync(profile, now):
+    """Une synchro complète n'est relancée que si la dernière date d'au moins 2 jours."""
+    full_name = f"{profile.get('firstname', '')} {profile.get('lastname', '')}"
+    last_sync_str = profile.get('last_full_synchro')
+    if not last_sync_str:
+        return True
+    try:
+        # Conversion de la string ISO de la DB en objet datetime
+        # On utilise fromisoformat et on s'assure d'être en UTC
+        last_sync = datetime.datetime.fromisoformat(last_sync_str.replace('Z', '+00:00'))
+        if last_sync.tzinfo is None:
+            last_sync = last_sync.replace(tzinfo=datetime.timezone.utc)
+    except ValueError:
+        # En cas d'erreur de format, on force la synchro par sécurité
+        return True
+
+    diff = now - last_sync
+    # Si la dernière synchro date de moins de 2 jours
+    if diff.days < 2:
+        print(f"⏳ {full_name} : Passé (Dernière Full Sync il y a {diff.days} jours)")
+        return False
+    return True
+
+async def sync_athletes_async(profiles, is_partial, max_concurrency=SYNC_CONCURRENCY, sync_func=None, on_result=None):
+    """
+    Moteur asyncio : plusieurs athlètes synchronisés en même temps (refresh token,
+    fetch, upsert), sous une limite de concurrence unique. Le budget Strava reste
+    celui de strava_ratelimit, partagé par tous les threads.
+    sync_func(profile) remplace sync_single_athlete (ex. reconcile_single_athlete).
+    on_result(profile, résultat) est appelé à la fin de chaque athlète (ex. file de jobs).
+    Retourne la liste des (succès_bool, message_string) de sync_single_athlete.
+    """
+    if sync_func is None:
+        sync_func = lambda profile: sync_single_athlete(profile, is_partial)
+
+    def metered(profile):
+        # Compteurs (requêtes, pages, écritures...) attribués à l'athlète dans sync_metrics
+        with sync_metrics.athlete(profile['id_strava']):
+            return sync_func(profile)
 
-def nightly_sync(yesForOnlyRecentFalseForAll):
+    semaphore = asyncio.Semaphore(max_concurrency)
+    quota_exhausted = asyncio.Event()
+
+    async def run_one(profile):
+        async with semaphore:
+            if quota_exhausted.is_set():
+                return None
+            try:
+                result = await asyncio.to_thread(metered, profile)
+            except RateLimitExceeded as e:
+                sync_metrics.record_error(e, profile['id_strava'])
+                if not quota_exhausted.is_set():
+                    print(f"🛑 {e} : arrêt de la synchronisation.")
+                quota_exhausted.set()
+                return None
+            if on_result:
+                on_result(profile, result)
+            return result
+
+    results = []
+    for next_done in asyncio.as_completed([run_one(p) for p in profiles]):
+        result = await next_done
+        if result is not None:
+            print(result[1])
+            results.append(result)
+        # Paquet de profils plein : vidé ici, hors de la synchro d'un athlète
+        await asyncio.to_thread(flush_profile_writes)
+    return results
+
+def metered_run(mode):
+    """Run mesuré (sync_metrics) : rapports JSON / Prometheus et historique sync_runs en base."""
+    return sync_metrics.run(mode, on_finish=save_sync_run)
+
+def nightly_sync(yesForOnlyRecentFalseForAll, max_concurrency=SYNC_CONCURRENCY, on_result=None, force=False):
     
     is_partial = yesForOnlyRecentFalseForAll
-    """Synchronisation de masse (Cron)"""
+    """
+    Synchronisation de masse (Cron). on_result(profile, (succès, message)) par athlète.
+    force=True (runs manuels, console admin) : la synchro partielle interroge tout le club,
+    sans le filtre de fréquence adaptative ni la mise à l'écart des tokens en échec.
+    """
     print(f"\n[{datetime.datetime.now()}] --- 🚀 DÉBUT DE LA SYNCHRONISATION BATCH isPartial = {is_partial}---")
     if not supabase: return
 
     profiles = supabase.table("profiles").select("*").execute().data
-    success_count = error_count = 0
     now = datetime.datetime.now(datetime.timezone.utc)
 
-    for profile in profiles:
-        athlete_id = profile.get('id_strava')
-        full_name = f"{profile.get('firstname', '')} {profile.get('lastname', '')}"
-        
-        # --- LOGIQUE DE FILTRAGE POUR LA SYNCHRO COMPLÈTE ---
-        
-        
-        if not is_partial:
-            last_sync_str = profile.get('last_full_synchro')
-            should_sync_full = True
-            
-            if last_sync_str:
-                try:
-                    # Conversion de la string ISO de la DB en objet datetime
-                    # On utilise fromisoformat et on s'assure d'être en UTC
-                    last_sync = datetime.datetime.fromisoformat(last_sync_str.replace('Z', '+00:00'))
-                    if last_sync.tzinfo is None:
-                        last_sync = last_sync.replace(tzinfo=datetime.timezone.utc)
-                    
-                    diff = now - last_sync
-                    
-                    # Si la dernière synchro date de moins de 2 jours
-                    if diff.days < 2:
-                        should_sync_full = False
-                        print(f"⏳ {full_name} : Passé (Dernière Full Sync il y a {diff.days} jours)")
-                except ValueError:
-                    # En cas d'erreur de format, on force la synchro par sécurité
-                    should_sync_full = True
-
-            if not should_sync_full:
-                continue # On passe à l'athlète suivant
+    # Écritures de profiles regroupées pendant tout le run (vidées par paquets et en sortie)
+    with buffered_profile_writes(profiles):
+        # --- SYNCHRO PARTIELLE : athlètes dont le prochain passage est échu, en parallèle ---
+        if is_partial:
+            if force:
+                due = profiles
+                print(f"🗓️ {len(due)} athlètes à interroger (run manuel : tout le club).")
             else:
-                # --- EXÉCUTION DE LA SYNCHRO full car pâs fait depuis longtemps ---
-                success, msg = sync_single_athlete(profile, is_partial)
-                print(f"🕒 Attente de 10 minutes pour réinitialiser le quota Strava (100 req/15min)...")
-                # 901 secondes pour être sûr de dépasser la fenêtre glissante de Strava
-                time.sleep(600) 
-        else:
-            # --- EXÉCUTION DE LA SYNCHRO partielle ---
-            success, msg = sync_single_athlete(profile, is_partial)
-        
-        print(msg)
-        
-        if success:
-            success_count += 1
+                due = [p for p in profiles if is_poll_due(p, now) and not is_token_blocked(p, now)]
+                print(f"🗓️ {len(due)}/{len(profiles)} athlètes à interroger (fréquence adaptée au rythme de sorties).")
+            since_iso = (now - datetime.timedelta(days=CADENCE_DAYS)).isoformat()
+            recent_counts = get_recent_activity_counts(since_iso) if due else {}
+
+            def poll_athlete(profile):
+                result = sync_single_athlete(profile, True)
+                if result[0]:
+                    interval = poll_interval_hours(profile, recent_counts.get(profile['id_strava'], 0), now)
+                    save_poll_schedule(profile['id_strava'], interval, now + datetime.timedelta(hours=interval))
+                return result
+
+            results = asyncio.run(sync_athletes_async(due, is_partial, max_concurrency, sync_func=poll_athlete, on_result=on_result))
+
+        # --- SYNCHRO COMPLÈTE : athlètes éligibles, classés et rangés par fenêtre de quota ---
+        # Pas de pause fixe entre athlètes : le budget partagé (strava_ratelimit) n'attend
+        # la fenêtre suivante que lorsque le quota est réellement atteint
         else:
-            error_count += 1
+            profiles = [p for p in profiles if needs_full_sync(p, now)]
+            windows, deferred, blocked = plan_full_sync(profiles, get_activity_counts(), now, rate_limiter.status())
+            for p in blocked:
+                print(f"⛔ {p.get('firstname', '')} {p.get('lastname', '')} : token en échec, prochain essai après {p.get('token_retry_after')}")
+            print(f"🗓️ {sum(len(w) for w in windows)} athlètes planifiés sur {len(windows)} fenêtre(s) de 15 min, {len(deferred)} reporté(s).")
+
+            # Une seule boucle pour toutes les fenêtres, dans l'ordre du plan : un athlète de la
+            # fenêtre suivante démarre dès qu'une place se libère, sans attendre le plus lent de
+            # la fenêtre en cours. Le budget partagé attend la fenêtre de 15 min suivante quand le
+            # quota court est atteint, et le quota du jour épuisé arrête le run (RateLimitExceeded).
+            ordered = [p for window in windows for p in window]
+            results = asyncio.run(sync_athletes_async(ordered, is_partial, max_concurrency, on_result=on_result))
+            if len(results) < len(ordered):
+                print("🛑 Quota journalier atteint : les athlètes restants passeront au prochain run.")
+
+    success_count = sum(1 for success, _ in results if success)
+    error_count = len(results) - success_count
 
+    budget = rate_limiter.status()
+    print(f"📊 Quota Strava : {budget['short_used']}/{budget['short_limit']} (15 min), {budget['day_used']}/{budget['daily_limit']} (jour)")
     print(f"[{datetime.datetime.now()}] --- TERMINÉ : {success_count} OK, {error_count} Erreurs ---")
 
 
 if __name__ == "__main__":
-    # Utilisation : python cron_sync.py full
-    mode_full = "full" in sys.argv
-    nightly_sync(not mode_full)
+    # Utilisation : python cron_sync.py [full|reconcile|sunday]
+    if "reconcile" in sys.argv:
+        with metered_run("reconcile"):
+            nightly_reconcile()
+    elif "sunday" in sys.argv:
+        with metered_run("sunday"):
+            sunday_burst_sync()
+    else:
+        mode_full = "full" in sys.argv
+        with metered_run("full" if mode_full else "partial"):
+            nightly_sync(not mode_full)
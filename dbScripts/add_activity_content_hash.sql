@@ -0,0 +1,2 @@
+-- Empreinte du contenu de chaque activité : l'upsert ne réécrit que les lignes modifiées
+ALTER TABLE activities ADD COLUMN IF NOT EXISTS content_hash TEXT;
@@ -0,0 +1,19 @@
+-- Flux détaillés des activités (activity_streams.py), pour les athlètes volontaires.
+-- Une colonne par flux : tableau typé compressé (zlib) encodé en base64, NULL si absent.
+-- mean_max : courbes puissance / cardio et meilleurs temps sur distance, calculés à l'enregistrement.
+ALTER TABLE profiles ADD COLUMN IF NOT EXISTS streams_opt_in BOOLEAN NOT NULL DEFAULT FALSE;
+
+CREATE TABLE IF NOT EXISTS activity_streams (
+    id_activity BIGINT PRIMARY KEY REFERENCES activities (id_activity) ON DELETE CASCADE,
+    id_strava BIGINT NOT NULL,
+    points INTEGER NOT NULL,              -- 0 : activité sans flux (saisie manuelle)
+    time TEXT,
+    distance TEXT,
+    altitude TEXT,
+    heartrate TEXT,
+    watts TEXT,
+    mean_max JSONB NOT NULL DEFAULT '{}',
+    average_watts REAL,
+    fetched_at TIMESTAMPTZ NOT NULL DEFAULT now()
+);
+CREATE INDEX IF NOT EXISTS activity_streams_athlete ON activity_streams (id_strava);
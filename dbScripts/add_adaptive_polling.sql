@@ -0,0 +1,3 @@
+-- Fréquence de synchro partielle par athlète (sync_scheduler.poll_interval_hours)
+ALTER TABLE profiles ADD COLUMN IF NOT EXISTS poll_interval_hours real;
+ALTER TABLE profiles ADD COLUMN IF NOT EXISTS next_poll_at timestamptz;
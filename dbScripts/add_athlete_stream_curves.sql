@@ -0,0 +1,8 @@
+-- Records puissance / cardio et meilleurs temps de chaque athlète (activity_streams.py),
+-- fusionnés à chaque enregistrement de flux : la courbe du club lit une ligne par athlète
+-- au lieu des courbes de toutes les activités. Remplissage initial : python activity_streams.py curves
+CREATE TABLE IF NOT EXISTS athlete_stream_curves (
+    id_strava BIGINT PRIMARY KEY,
+    mean_max JSONB NOT NULL DEFAULT '{}',
+    updated_at TIMESTAMPTZ NOT NULL DEFAULT now()
+);
@@ -0,0 +1,3 @@
+-- Point de reprise des synchros complètes : date de la plus ancienne activité déjà enregistrée
+-- (NULL = aucune synchro complète en cours pour cet athlète)
+ALTER TABLE profiles ADD COLUMN IF NOT EXISTS full_sync_before timestamptz;
@@ -0,0 +1,11 @@
+-- Curseur de synchro incrémentale : date de départ de la plus récente activité connue
+ALTER TABLE profiles ADD COLUMN IF NOT EXISTS last_activity_date timestamptz;
+
+UPDATE profiles p
+SET last_activity_date = sub.max_date
+FROM (
+    SELECT id_strava, MAX(start_date) AS max_date
+    FROM activities
+    GROUP BY id_strava
+) sub
+WHERE p.id_strava = sub.id_strava;
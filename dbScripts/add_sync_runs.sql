@@ -0,0 +1,14 @@
+-- Historique des runs de synchro (sync_metrics.py) : compteurs totaux et par athlète,
+-- erreurs par classe et codes de réponse Strava. Affiché dans la console admin.
+CREATE TABLE IF NOT EXISTS sync_runs (
+    id BIGSERIAL PRIMARY KEY,
+    mode TEXT NOT NULL,                   -- partial, full, reconcile, sunday, athlete, streams
+    started_at TIMESTAMPTZ NOT NULL,
+    finished_at TIMESTAMPTZ NOT NULL,
+    duration_s REAL NOT NULL,
+    totals JSONB NOT NULL DEFAULT '{}',
+    errors JSONB NOT NULL DEFAULT '{}',
+    status_codes JSONB NOT NULL DEFAULT '{}',
+    athletes JSONB NOT NULL DEFAULT '{}'
+);
+CREATE INDEX IF NOT EXISTS sync_runs_started ON sync_runs (started_at DESC);
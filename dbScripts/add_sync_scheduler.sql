@@ -0,0 +1,11 @@
+-- Planification des synchros complètes (sync_scheduler.py)
+
+-- Santé du refresh token : échecs consécutifs et date du prochain essai
+ALTER TABLE profiles ADD COLUMN IF NOT EXISTS token_failures integer NOT NULL DEFAULT 0;
+ALTER TABLE profiles ADD COLUMN IF NOT EXISTS token_retry_after timestamptz;
+
+-- Nombre d'activités par athlète : estimation du nombre de pages Strava à lire
+CREATE OR REPLACE VIEW athlete_activity_counts AS
+SELECT id_strava, COUNT(*) AS nb_activities
+FROM activities
+GROUP BY id_strava;
@@ -0,0 +1,3 @@
+-- Cache des access tokens Strava (réutilisés jusqu'à expiration entre UI et cron)
+ALTER TABLE profiles ADD COLUMN IF NOT EXISTS access_token text;
+ALTER TABLE profiles ADD COLUMN IF NOT EXISTS token_expires_at bigint;
@@ -0,0 +1,14 @@
+-- Version groupée de increment_connection : un id par connexion (doublons = plusieurs connexions)
+CREATE OR REPLACE FUNCTION increment_connections(target_ids bigint[])
+RETURNS void AS $$
+BEGIN
+    UPDATE profiles p
+    SET nb_connection = COALESCE(p.nb_connection, 0) + t.n
+    FROM (
+        SELECT id, COUNT(*) AS n
+        FROM unnest(target_ids) AS id
+        GROUP BY id
+    ) t
+    WHERE p.id_strava = t.id;
+END;
+$$ LANGUAGE plpgsql;
@@ -0,0 +1,481 @@
+"""
+Bouchons locaux pour mesurer la synchro sans l'API Strava ni Supabase :
+- FakeStrava : faux serveur HTTP pour /athlete/activities, /activities/{id},
+  /oauth/token et /athletes/{id}/stats (latence, taille de page, 429 injectés, headers de quota) ;
+- MemorySupabase : client Supabase en mémoire (sous-ensemble utilisé par core.db).
+
+Utilisation : python fake_strava.py --athletes 10 --port 8765
+puis STRAVA_BASE_URL=http://127.0.0.1:8765 pour y faire pointer strava_http.
+"""
+import sys
+import json
+import hashlib
+import math
+import time
+import random
+import argparse
+import datetime
+import threading
+import urllib.parse
+import http.server
+import polyline
+
+# Point de départ des traces synthétiques : la mairie d'Escalquens
+ESCALQUENS = (43.5171, 1.5624)
+FIRST_ACTIVITY_ID = 10_000_000_000
+SHORT_WINDOW_SECONDS = 15 * 60
+
+
+def synthetic_polyline(seed, points=60, start=ESCALQUENS):
+    """Polyline encodée d'une boucle aléatoire (déterministe pour une graine donnée)."""
+    rng = random.Random(seed)
+    lat, lng = start
+    coords = [(lat, lng)]
+    heading = rng.uniform(0, 360)
+    for _ in range(points - 1):
+        heading += rng.uniform(-35, 35)
+        step = rng.uniform(0.002, 0.006)
+        lat += step * math.cos(math.radians(heading))
+        lng += step * math.sin(math.radians(heading))
+        coords.append((round(lat, 5), round(lng, 5)))
+    return polyline.encode(coords)
+
+
+class FakeStrava:
+    """
+    État du faux Strava : athlètes, activités et quota.
+    Les activités sont stockées sous forme compacte et sérialisées à la demande.
+    """
+
+    def __init__(self, latency=0.0, max_per_page=200, error_rate_429=0.0,
+                 short_limit=100, daily_limit=1000, enforce_limits=True, seed=42):
+        self.latency = latency
+        self.max_per_page = max_per_page
+        self.error_rate_429 = error_rate_429
+        self.short_limit = short_limit
+        self.daily_limit = daily_limit
+        self.enforce_limits = enforce_limits
+        self.rng = random.Random(seed)
+        self.lock = threading.Lock()
+        self.athletes = {}       # id -> {"firstname", "lastname", "activities": [tuples triés du plus récent au plus ancien]}
+        self.access_tokens = {}  # access_token -> athlete_id
+        self.next_activity_id = FIRST_ACTIVITY_ID
+        self.request_count = 0
+        self.activities_served = 0
+        self.requests_by_athlete = {}
+        self.short_window = None
+        self.short_used = 0
+        self.day_used = 0
+
+    # --- JEU DE DONNÉES ---
+
+    def add_athlete(self, athlete_id, nb_activities, rides_per_week=3.0, firstname=None, lastname=None):
+        """Ajoute un athlète et un historique d'activités régulièrement espacées jusqu'à aujourd'hui."""
+        now = datetime.datetime.now(datetime.timezone.utc).replace(microsecond=0)
+        gap = datetime.timedelta(days=7 / max(rides_per_week, 0.01))
+        self.athletes[athlete_id] = {
+            "firstname": firstname or f"Athlete{athlete_id}",
+            "lastname": lastname or "Fake",
+            "activities": [],
+        }
+        for i in range(nb_activities):
+            self._append_activity(athlete_id, now - gap * (nb_activities - i) + datetime.timedelta(hours=self.rng.uniform(-6, 6)))
+        self.athletes[athlete_id]["activities"].sort(key=lambda a: a[1], reverse=True)
+
+    def add_new_activities(self, athlete_id, count=1):
+        """Simule des sorties enregistrées depuis la dernière synchro."""
+        now = datetime.datetime.now(datetime.timezone.utc).replace(microsecond=0)
+        for i in range(count):
+            self._append_activity(athlete_id, now - datetime.timedelta(minutes=30 * (i + 1)))
+        self.athletes[athlete_id]["activities"].sort(key=lambda a: a[1], reverse=True)
+
+    def _append_activity(self, athlete_id, start):
+        with self.lock:
+            activity_id = self.next_activity_id
+            self.next_activity_id += 1
+        distance = round(self.rng.lognormvariate(10.6, 0.5), 1)  # ~40 km en moyenne
+        sport = self.rng.choices(("Ride", "VirtualRide", "Run"), weights=(80, 10, 10))[0]
+        # (id, epoch de départ, distance m, D+ m, temps de déplacement s, type)
+        self.athletes[athlete_id]["activities"].append(
+            (activity_id, int(start.timestamp()), distance, round(distance / 100 * self.rng.uniform(0.3, 1.5), 1), int(distance / 7.5), sport)
+        )
+
+    def _activity_json(self, athlete_id, act):
+        activity_id, start, distance, elevation, moving_time, sport = act
+        start_date = datetime.datetime.fromtimestamp(start, datetime.timezone.utc).strftime("%Y-%m-%dT%H:%M:%SZ")
+        return {
+            "id": activity_id,
+            "athlete": {"id": athlete_id},
+            "name": f"Sortie {activity_id}",
+            "distance": distance,
+            "total_elevation_gain": elevation,
+            "moving_time": moving_time,
+            "type": sport,
+            "start_date": start_date,
+            "map": {"summary_polyline": synthetic_polyline(activity_id)},
+        }
+
+    def issue_token(self, athlete_id):
+        token = f"access-{athlete_id}-{self.rng.getrandbits(32):08x}"
+        self.access_tokens[token] = athlete_id
+        return {
+            "token_type": "Bearer",
+            "access_token": token,
+            "refresh_token": f"refresh-{athlete_id}",
+            "expires_at": int(time.time()) + 6 * 3600,
+            "expires_in": 6 * 3600,
+            "athlete": {"id": athlete_id, **{k: self.athletes[athlete_id][k] for k in ("firstname", "lastname")}},
+        }
+
+    # --- QUOTA ---
+
+    def _count_request(self, athlete_id):
+        """Décompte une requête API ; retourne False si le quota est dépassé."""
+        with self.lock:
+            window = int(time.time() // SHORT_WINDOW_SECONDS)
+            if window != self.short_window:
+                self.short_window = window
+                self.short_used = 0
+            self.request_count += 1
+            self.requests_by_athlete[athlete_id] = self.requests_by_athlete.get(athlete_id, 0) + 1
+            self.short_used += 1
+            self.day_used += 1
+            if self.enforce_limits and (self.short_used > self.short_limit or self.day_used > self.daily_limit):
+                return False
+            return self.rng.random() >= self.error_rate_429
+
+    def rate_headers(self):
+        return {
+            "X-ReadRateLimit-Usage": f"{self.short_used},{self.day_used}",
+            "X-ReadRateLimit-Limit": f"{self.short_limit},{self.daily_limit}",
+        }
+
+    # --- ENDPOINTS ---
+
+    def list_activities(self, athlete_id, page=1, per_page=30, after=None, before=None):
+        acts = self.athletes[athlete_id]["activities"]
+        if before is not None:
+            acts = [a for a in acts if a[1] < before]
+        if after is not None:
+            # Comme Strava : avec 'after', ordre chronologique croissant
+            acts = [a for a in reversed(acts) if a[1] > after]
+        per_page = min(per_page, self.max_per_page)
+        chunk = acts[(page - 1) * per_page: page * per_page]
+        with self.lock:
+            self.activities_served += len(chunk)
+        return [self._activity_json(athlete_id, a) for a in chunk]
+
+    def get_activity(self, athlete_id, activity_id):
+        for a in self.athletes[athlete_id]["activities"]:
+            if a[0] == activity_id:
+                return self._activity_json(athlete_id, a)
+        return None
+
+    def streams(self, athlete_id, activity_id, keys):
+        """Flux synthétiques à 1 Hz (format key_by_type) ; None si l'activité est inconnue."""
+        act = next((a for a in self.athletes[athlete_id]["activities"] if a[0] == activity_id), None)
+        if act is None:
+            return None
+        rng = random.Random(activity_id)
+        points = max(2, act[4])
+        speed = act[2] / points
+        data = {
+            "time": list(range(points)),
+            "distance": [round(i * speed, 1) for i in range(points)],
+            "altitude": [round(150 + 50 * math.sin(i / 600), 1) for i in range(points)],
+            "heartrate": [int(120 + 30 * math.sin(i / 900) + rng.uniform(-5, 5)) for i in range(points)],
+            "watts": [max(0, int(rng.gauss(180, 60))) for _ in range(points)],
+        }
+        return {k: {"data": v, "series_type": "time", "original_size": points} for k, v in data.items() if k in keys}
+
+    def stats(self, athlete_id):
+        acts = self.athletes[athlete_id]["activities"]
+        totals = {}
+        for sport, key in (("Ride", "all_ride_totals"), ("Run", "all_run_totals"), ("Swim", "all_swim_totals")):
+            sel = [a for a in acts if a[5] == sport]
+            totals[key] = {"count": len(sel), "distance": sum(a[2] for a in sel)}
+        return totals
+
+
+class _Handler(http.server.BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    fake = None
+
+    def log_message(self, *args):
+        pass
+
+    def _send(self, status, payload, headers=None):
+        body = json.dumps(payload).encode()
+        if status == 200 and self.command == "GET":
+            # ETag faible comme Strava : If-None-Match identique -> 304 sans corps
+            etag = f'W/"{hashlib.md5(body).hexdigest()}"'
+            headers = {**(headers or {}), "ETag": etag}
+            if self.headers.get("If-None-Match") == etag:
+                status, body = 304, b""
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        for k, v in (headers or {}).items():
+            self.send_header(k, v)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _athlete_from_token(self):
+        auth = self.headers.get("Authorization", "")
+        return self.fake.access_tokens.get(auth.replace("Bearer ", ""))
+
+    def do_POST(self):
+        fake = self.fake
+        length = int(self.headers.get("Content-Length", 0))
+        form = urllib.parse.parse_qs(self.rfile.read(length).decode())
+        if fake.latency:
+            time.sleep(fake.latency)
+        if self.path.startswith("/oauth/token"):
+            grant = form.get("grant_type", [""])[0]
+            value = form.get("refresh_token" if grant == "refresh_token" else "code", [""])[0]
+            try:
+                athlete_id = int(value.split("-")[-1])
+            except ValueError:
+                athlete_id = None
+            if athlete_id in fake.athletes:
+                return self._send(200, fake.issue_token(athlete_id))
+            return self._send(400, {"message": "Bad Request"})
+        self._send(404, {"message": "Not Found"})
+
+    def do_GET(self):
+        fake = self.fake
+        url = urllib.parse.urlparse(self.path)
+        query = {k: v[0] for k, v in urllib.parse.parse_qs(url.query).items()}
+        athlete_id = self._athlete_from_token()
+        if fake.latency:
+            time.sleep(fake.latency)
+        if athlete_id is None:
+            return self._send(401, {"message": "Authorization Error"})
+        if not fake._count_request(athlete_id):
+            return self._send(429, {"message": "Rate Limit Exceeded"}, fake.rate_headers())
+
+        if url.path == "/api/v3/athlete/activities":
+            data = fake.list_activities(
+                athlete_id,
+                page=int(query.get("page", 1)),
+                per_page=int(query.get("per_page", 30)),
+                after=int(query["after"]) if "after" in query else None,
+                before=int(query["before"]) if "before" in query else None,
+            )
+            return self._send(200, data, fake.rate_headers())
+        if url.path.startswith("/api/v3/activities/") and url.path.endswith("/streams"):
+            streams = fake.streams(athlete_id, int(url.path.split("/")[-2]), query.get("keys", "").split(","))
+            if streams is None:
+                return self._send(404, {"message": "Record Not Found"}, fake.rate_headers())
+            return self._send(200, streams, fake.rate_headers())
+        if url.path.startswith("/api/v3/activities/"):
+            activity = fake.get_activity(athlete_id, int(url.path.rsplit("/", 1)[-1]))
+            if activity is None:
+                return self._send(404, {"message": "Record Not Found"}, fake.rate_headers())
+            return self._send(200, activity, fake.rate_headers())
+        if url.path.startswith("/api/v3/athletes/") and url.path.endswith("/stats"):
+            return self._send(200, fake.stats(athlete_id), fake.rate_headers())
+        self._send(404, {"message": "Not Found"}, fake.rate_headers())
+
+
+def serve(fake, host="127.0.0.1", port=0):
+    """Démarre le faux Strava dans un thread ; retourne (serveur, base_url)."""
+    handler = type("FakeStravaHandler", (_Handler,), {"fake": fake})
+    server = http.server.ThreadingHTTPServer((host, port), handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://{host}:{server.server_port}"
+
+
+# --- SUPABASE EN MÉMOIRE ---
+
+PRIMARY_KEYS = {"profiles": "id_strava", "activities": "id_activity", "activity_streams": "id_activity",
+                "athlete_stream_curves": "id_strava"}
+
+
+class _Result:
+    def __init__(self, data, count=None):
+        self.data = data
+        self.count = count
+
+
+class _Query:
+    def __init__(self, db, table):
+        self.db = db
+        self.table = table
+        self.filters = []
+        self.action = "select"
+        self.payload = None
+        self.count = None
+        self.order_by = None
+        self.max_rows = None
+
+    def select(self, columns="*", count=None):
+        self.action, self.count = "select", count
+        return self
+
+    def insert(self, data):
+        self.action, self.payload = "insert", data
+        return self
+
+    def upsert(self, data, **kwargs):
+        self.action, self.payload = "upsert", data
+        return self
+
+    def update(self, data):
+        self.action, self.payload = "update", data
+        return self
+
+    def delete(self):
+        self.action = "delete"
+        return self
+
+    def eq(self, col, value):
+        self.filters.append(lambda r: r.get(col) == value)
+        return self
+
+    def in_(self, col, values):
+        values = set(values)
+        self.filters.append(lambda r: r.get(col) in values)
+        return self
+
+    def gte(self, col, value):
+        self.filters.append(lambda r: r.get(col) is not None and str(r.get(col)) >= str(value))
+        return self
+
+    def lte(self, col, value):
+        self.filters.append(lambda r: r.get(col) is not None and str(r.get(col)) <= str(value))
+        return self
+
+    def gt(self, col, value):
+        self.filters.append(lambda r: r.get(col) is not None and r.get(col) > value)
+        return self
+
+    def lt(self, col, value):
+        self.filters.append(lambda r: r.get(col) is not None and str(r.get(col)) < str(value))
+        return self
+
+    def order(self, col, desc=False):
+        self.order_by = (col, desc)
+        return self
+
+    def limit(self, n):
+        self.max_rows = n
+        return self
+
+    def execute(self):
+        return self.db._execute(self)
+
+
+def _athlete_activity_counts(tables):
+    counts = {}
+    for row in tables.get("activities", {}).values():
+        counts[row["id_strava"]] = counts.get(row["id_strava"], 0) + 1
+    return {athlete_id: {"id_strava": athlete_id, "nb_activities": n} for athlete_id, n in counts.items()}
+
+
+def _group_activities(tables):
+    approved = [m for m in tables.get("group_members", {}).values() if m.get("status") == "approved"]
+    rows = {}
+    for member in approved:
+        for activity in tables.get("activities", {}).values():
+            if activity["id_strava"] == member["athlete_id"]:
+                rows[(member["group_id"], activity["id_activity"])] = {**activity, "group_id": member["group_id"]}
+    return rows
+
+
+# Vues SQL (dbScripts) recalculées à chaque lecture
+VIEWS = {"athlete_activity_counts": _athlete_activity_counts, "group_activities": _group_activities}
+
+
+class MemorySupabase:
+    """Client Supabase minimal en mémoire : tables = dict {clé primaire: ligne}."""
+
+    def __init__(self):
+        self.tables = {}
+        self.lock = threading.Lock()
+        self.round_trips = 0
+
+    def table(self, name):
+        return _Query(self, name)
+
+    def rpc(self, name, params):
+        db = self
+
+        class _Rpc:
+            def execute(self):
+                with db.lock:
+                    db.round_trips += 1
+                    rows = db.tables.setdefault("profiles", {})
+                    ids = params.get("target_ids") or [params.get("target_id")]
+                    for target in ids:
+                        if target in rows:
+                            rows[target]["nb_connection"] = (rows[target].get("nb_connection") or 0) + 1
+                return _Result(None)
+
+        return _Rpc()
+
+    def _execute(self, q):
+        with self.lock:
+            self.round_trips += 1
+            rows = VIEWS[q.table](self.tables) if q.table in VIEWS else self.tables.setdefault(q.table, {})
+            key = PRIMARY_KEYS.get(q.table, "id")
+            matches = [r for r in rows.values() if all(f(r) for f in q.filters)]
+
+            if q.action == "select":
+                if q.order_by:
+                    col, desc = q.order_by
+                    matches.sort(key=lambda r: (r.get(col) is not None, r.get(col)), reverse=desc)
+                count = len(matches) if q.count else None
+                if q.max_rows is not None:
+                    matches = matches[:q.max_rows]
+                return _Result([dict(r) for r in matches], count)
+            if q.action in ("insert", "upsert"):
+                payload = q.payload if isinstance(q.payload, list) else [q.payload]
+                for row in payload:
+                    pk = row.get(key)
+                    if pk is None:
+                        pk = len(rows) + 1
+                        row = {**row, key: pk}
+                    rows.setdefault(pk, {}).update(row)
+                return _Result([dict(rows[r.get(key)]) for r in payload if r.get(key) in rows])
+            if q.action == "update":
+                for r in matches:
+                    r.update(q.payload)
+                return _Result([dict(r) for r in matches])
+            if q.action == "delete":
+                for r in matches:
+                    rows.pop(r[key], None)
+                return _Result([dict(r) for r in matches])
+        raise ValueError(q.action)
+
+
+def build_fake(nb_athletes, mean_activities=200, first_athlete_id=1, **options):
+    """Faux Strava peuplé de nb_athletes athlètes (volumes d'activités log-normaux)."""
+    fake = FakeStrava(**options)
+    for i in range(nb_athletes):
+        nb = max(1, int(fake.rng.lognormvariate(0, 0.8) * mean_activities))
+        fake.add_athlete(first_athlete_id + i, nb, rides_per_week=fake.rng.uniform(0.5, 6))
+    return fake
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Faux serveur Strava local")
+    parser.add_argument("--athletes", type=int, default=10)
+    parser.add_argument("--activities", type=int, default=200, help="nombre moyen d'activités par athlète")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--latency", type=float, default=0.05, help="latence par requête (s)")
+    parser.add_argument("--page-size", type=int, default=200, help="taille de page maximale servie")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="proportion de 429 injectés")
+    args = parser.parse_args()
+
+    fake = build_fake(args.athletes, args.activities, latency=args.latency,
+                      max_per_page=args.page_size, error_rate_429=args.error_rate)
+    server, base_url = serve(fake, port=args.port)
+    print(f"🧪 Faux Strava sur {base_url} ({args.athletes} athlètes) — refresh tokens : refresh-<id_strava>")
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        server.shutdown()
+        sys.exit(0)
@@ -3,8 +3,9 @@ import time
 import datetime
 from dateutil import parser # Utile pour parser les dates de la DB
 from dotenv import load_dotenv
-from db_operations import supabase, sync_profile_and_activities
-from strava_operations import fetch_all_activities_parallel, exchange_refresh_token
+from core.db import supabase
+from strava_tokens import get_valid_tokens
+from cron_sync import sync_full_history
 
 # --- 1. CONFIGURATION ---
 load_dotenv()
@@ -14,7 +15,7 @@ def run_migration():
     print("Objectif : Récupérer 'moving_time' pour toutes les activités en base.\n")
 
     # A. Récupérer tous les profils qui ont un refresh_token
-    profiles_res = supabase.table("profiles").select("id_strava, firstname, lastname, refresh_token, avatar_url,last_full_synchro").execute()
+    profiles_res = supabase.table("profiles").select("id_strava, firstname, lastname, refresh_token, access_token, token_expires_at, avatar_url,last_full_synchro, full_sync_before").execute()
     
     if not profiles_res.data:
         print("❌ Aucun profil trouvé dans la base de données.")
@@ -55,7 +56,7 @@ def run_migration():
 
         try:
             # 1. Obtenir un access_token frais
-            token_response = exchange_refresh_token(refresh_token)
+            token_response = get_valid_tokens(athlete_id, refresh_token, athlete)
             if not token_response or 'access_token' not in token_response:
                 print(f"   ⚠️ Impossible de rafraîchir le token pour {full_name}. Skip.")
                 error_count += 1
@@ -64,29 +65,30 @@ def run_migration():
             new_access = token_response['access_token']
             new_refresh = token_response.get('refresh_token', refresh_token)
 
-            # 2. Fetch de TOUTES les activités (Full Sync)
-            print(f"   📥 Récupération de tout l'historique Strava...")
-            all_activities = fetch_all_activities_parallel(new_access)
-
-            if all_activities:
-                # 3. Préparation de l'objet athlète pour sync_profile_and_activities
-                athlete_obj = {
-                    "id": athlete_id,
-                    "firstname": athlete.get("firstname"),
-                    "lastname": athlete.get("lastname"),
-                    "profile_medium": athlete.get("avatar_url")
-                }
-
-                # 4. Envoi vers Supabase (Upsert)
-                # Note: Assurez-vous que db_operations.py inclut 'moving_time' dans le mapping
-                sync_profile_and_activities(athlete_obj, all_activities, new_refresh, is_full_sync=True,is_from_ui=False)
-                print(f"   ✅ {len(all_activities)} activités synchronisées/mises à jour.")
+            # 2. Préparation de l'objet athlète pour sync_profile_and_activities
+            athlete_obj = {
+                "id": athlete_id,
+                "firstname": athlete.get("firstname"),
+                "lastname": athlete.get("lastname"),
+                "profile_medium": athlete.get("avatar_url")
+            }
+
+            # 3. Fetch + Upsert de TOUTES les activités (Full Sync), par paquets avec point de reprise
+            resume_before = athlete.get('full_sync_before')
+            if resume_before:
+                print(f"   ⏯️ Reprise de la synchro interrompue (activités avant {resume_before})...")
+            else:
+                print(f"   📥 Récupération de tout l'historique Strava...")
+            ok, saved = sync_full_history(athlete_obj, new_access, new_refresh, resume_before)
+
+            if ok:
+                print(f"   ✅ {saved} activités synchronisées/mises à jour.")
                 success_count += 1
             else:
-                print(f"   ℹ️ Aucune activité trouvée pour cet athlète.")
+                print(f"   ⚠️ Synchro interrompue après {saved} activités : reprise au prochain lancement.")
+                error_count += 1
 
-            # 5. Pause de sécurité pour le Rate Limit Strava (100 requêtes / 15 min)
-            # fetch_all_activities_parallel fait plusieurs requêtes par athlète.
+            # 4. Petite pause entre athlètes (le quota Strava est géré par strava_ratelimit)
             time.sleep(2)
 
         except Exception as e:
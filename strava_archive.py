@@ -0,0 +1,493 @@
+"""
+Import d'un export Strava en masse (zip « Télécharger vos données » du compte Strava).
+
+Les fichiers d'activités (GPX, FIT, TCX, éventuellement .gz) sont analysés dans un pool
+de processus : distance, dénivelé positif, temps en mouvement, date de départ et polyline
+résumée. L'id d'activité Strava vient de activities.csv (colonne Filename), sinon du nom
+du fichier. Les lignes passent par le même upsert par paquets que la synchro API
+(core.db.upsert_activities) : aucune requête Strava n'est consommée. L'import n'ajoute
+que les activités absentes de la base : celles déjà synchronisées par l'API (type exact,
+polyline de Strava) ne sont jamais réécrites avec les valeurs recalculées de l'archive.
+
+Utilisation :
+    python strava_archive.py export_12345.zip --athlete 12345
+    python strava_archive.py export_12345.zip --athlete 12345 --workers 8 --dry-run
+"""
+import io
+import os
+import csv
+import gzip
+import math
+import time
+import struct
+import zipfile
+import argparse
+import datetime
+import concurrent.futures
+import xml.etree.ElementTree as ET
+
+import polyline
+
+IMPORT_BATCH = 1000             # activités par appel à upsert_activities
+MOVING_SPEED = 0.5              # m/s : en dessous, le segment compte comme un arrêt
+ELEVATION_THRESHOLD = 3.0       # m : hystérésis du dénivelé (bruit GPS / baro)
+POLYLINE_STEP_M = 250           # espacement minimal des points de la polyline résumée
+EARTH_RADIUS_M = 6371000
+FIT_EPOCH = 631065600           # 1989-12-31T00:00:00Z
+
+
+_DEG_M = math.pi / 180 * EARTH_RADIUS_M
+
+
+def _step_m(lat1, lon1, lat2, lon2, cos_lat):
+    """Distance (m) entre deux points successifs : approximation équirectangulaire, à cos_lat fixé."""
+    return _DEG_M * math.hypot(lat2 - lat1, (lon2 - lon1) * cos_lat)
+
+
+def _parse_time(value):
+    """Horodatage ISO 8601 (GPX / TCX) -> epoch, ou None."""
+    if not value:
+        return None
+    try:
+        dt = datetime.datetime.fromisoformat(value.strip().replace('Z', '+00:00'))
+    except ValueError:
+        return None
+    if dt.tzinfo is None:
+        dt = dt.replace(tzinfo=datetime.timezone.utc)
+    return dt.timestamp()
+
+
+_FIT_SPORTS = {1: "Run", 2: "Ride", 5: "Swim", 11: "Walk", 17: "Hike"}
+
+
+def _sport_type(sport):
+    """Sport du fichier (GPX type, TCX Sport, énuméré FIT) -> type d'activité Strava."""
+    if isinstance(sport, int):
+        return _FIT_SPORTS.get(sport, "Workout")
+    sport = (sport or "").lower()
+    if "bik" in sport or "cycl" in sport or "ride" in sport:
+        return "Ride"
+    if "run" in sport:
+        return "Run"
+    if "walk" in sport:
+        return "Walk"
+    if "hik" in sport:
+        return "Hike"
+    if "swim" in sport:
+        return "Swim"
+    return "Workout"
+
+
+# --- LECTURE DES FICHIERS ---
+# Chaque lecteur renvoie (points, infos) : points = [(epoch, lat, lon, altitude, distance)]
+# (valeurs None si absentes), infos = champs de résumé trouvés dans le fichier.
+
+_local_names = {}
+
+
+def _local(tag):
+    """Nom de balise sans namespace (mémorisé : appelé pour chaque élément du fichier)."""
+    name = _local_names.get(tag)
+    if name is None:
+        name = _local_names[tag] = tag.rsplit('}', 1)[-1]
+    return name
+
+
+def read_gpx(data):
+    points, info = [], {}
+    for _, elem in ET.iterparse(io.BytesIO(data.lstrip())):
+        tag = _local(elem.tag)
+        if tag == "trkpt":
+            values = {_local(child.tag): child.text for child in elem}
+            ele = values.get("ele")
+            points.append((_parse_time(values.get("time")), float(elem.get("lat")), float(elem.get("lon")),
+                           float(ele) if ele else None, None))
+            elem.clear()
+        elif tag == "name" and "name" not in info and elem.text:
+            info["name"] = elem.text.strip()
+        elif tag == "type" and elem.text:
+            info["type"] = _sport_type(elem.text)
+    return points, info
+
+
+def read_tcx(data):
+    points, info = [], {}
+    for _, elem in ET.iterparse(io.BytesIO(data.lstrip())):
+        tag = _local(elem.tag)
+        if tag == "Trackpoint":
+            values = {}
+            for child in elem.iter():
+                values[_local(child.tag)] = child.text
+            lat, lon = values.get("LatitudeDegrees"), values.get("LongitudeDegrees")
+            ele, dist = values.get("AltitudeMeters"), values.get("DistanceMeters")
+            points.append((_parse_time(values.get("Time")),
+                           float(lat) if lat else None, float(lon) if lon else None,
+                           float(ele) if ele else None, float(dist) if dist else None))
+            elem.clear()
+        elif tag == "Activity" and elem.get("Sport"):
+            info["type"] = _sport_type(elem.get("Sport"))
+    return points, info
+
+
+# --- DÉCODEUR FIT MINIMAL ---
+# Seuls les messages record (20) et session (18) sont lus ; les autres messages, les
+# champs inconnus et les champs développeur sont sautés d'après leur définition.
+_FIT_FORMATS = {0: 'B', 1: 'b', 2: 'B', 3: 'h', 4: 'H', 5: 'i', 6: 'I', 8: 'f', 9: 'd',
+                10: 'B', 11: 'H', 12: 'I', 13: 'B', 14: 'q', 15: 'Q', 16: 'Q'}
+_FIT_INVALID = {'B': 0xFF, 'b': 0x7F, 'H': 0xFFFF, 'h': 0x7FFF, 'I': 0xFFFFFFFF, 'i': 0x7FFFFFFF}
+_FIT_FIELDS = {
+    20: {253: "timestamp", 0: "lat", 1: "lon", 2: "altitude", 5: "distance", 78: "enhanced_altitude"},
+    18: {2: "start_time", 5: "sport", 7: "timer_time", 9: "total_distance", 22: "total_ascent"},
+}
+_SEMICIRCLE = 180 / 2 ** 31
+
+
+def _fit_messages(data):
+    """Générateur (numéro global, {champ: valeur}) des messages record et session d'un fichier FIT."""
+    header_size = data[0]
+    if data[8:12] != b".FIT":
+        raise ValueError("fichier FIT invalide")
+    end = header_size + struct.unpack_from("<I", data, 4)[0]
+    pos = header_size
+    definitions = {}
+    last_timestamp = None
+    while pos < end:
+        record_header = data[pos]
+        pos += 1
+        if record_header & 0x80:
+            # En-tête à horodatage compressé : message de données, décalage de 5 bits
+            local_type = (record_header >> 5) & 0x03
+            offset = record_header & 0x1F
+            timestamp = None
+            if last_timestamp is not None:
+                timestamp = (last_timestamp & ~0x1F) + offset
+                if offset < (last_timestamp & 0x1F):
+                    timestamp += 0x20
+        else:
+            local_type = record_header & 0x0F
+            timestamp = None
+            if record_header & 0x40:
+                # Message de définition
+                endian = ">" if data[pos + 1] else "<"
+                global_num = struct.unpack_from(endian + "H", data, pos + 2)[0]
+                num_fields = data[pos + 4]
+                pos += 5
+                wanted = _FIT_FIELDS.get(global_num, {})
+                fields, offset_in_msg = [], 0
+                for i in range(num_fields):
+                    field_num, size, base_type = data[pos + 3 * i: pos + 3 * i + 3]
+                    fmt = _FIT_FORMATS.get(base_type & 0x1F)
+                    if field_num in wanted and fmt and struct.calcsize(fmt) == size:
+                        fields.append((wanted[field_num], offset_in_msg, endian + fmt, fmt))
+                    offset_in_msg += size
+                pos += 3 * num_fields
+                if record_header & 0x20:
+                    num_dev = data[pos]
+                    offset_in_msg += sum(data[pos + 1 + 3 * i + 1] for i in range(num_dev))
+                    pos += 1 + 3 * num_dev
+                definitions[local_type] = (global_num, fields, offset_in_msg)
+                continue
+        global_num, fields, size = definitions[local_type]
+        if global_num in _FIT_FIELDS:
+            values = {}
+            for name, offset_in_msg, fmt, base in fields:
+                value = struct.unpack_from(fmt, data, pos + offset_in_msg)[0]
+                if value != _FIT_INVALID.get(base):
+                    values[name] = value
+            if "timestamp" in values:
+                last_timestamp = values["timestamp"]
+            elif timestamp is not None:
+                values["timestamp"] = last_timestamp = timestamp
+            yield global_num, values
+        pos += size
+
+
+def read_fit(data):
+    points, info = [], {}
+    for global_num, values in _fit_messages(data):
+        if global_num == 20:
+            altitude = values.get("enhanced_altitude", values.get("altitude"))
+            lat, lon = values.get("lat"), values.get("lon")
+            points.append((
+                values["timestamp"] + FIT_EPOCH if "timestamp" in values else None,
+                lat * _SEMICIRCLE if lat is not None else None,
+                lon * _SEMICIRCLE if lon is not None else None,
+                altitude / 5 - 500 if altitude is not None else None,
+                values["distance"] / 100 if "distance" in values else None,
+            ))
+        elif global_num == 18:
+            if "start_time" in values:
+                info["start"] = values["start_time"] + FIT_EPOCH
+            if "total_distance" in values:
+                info["distance"] = values["total_distance"] / 100
+            if "timer_time" in values:
+                info["moving_time"] = int(values["timer_time"] / 1000)
+            if "total_ascent" in values:
+                info["total_elevation_gain"] = float(values["total_ascent"])
+            if "sport" in values:
+                info["type"] = _sport_type(values["sport"])
+    return points, info
+
+
+_READERS = {".gpx": read_gpx, ".tcx": read_tcx, ".fit": read_fit}
+
+
+# --- RÉSUMÉ D'UNE ACTIVITÉ ---
+
+def summarize(points):
+    """Distance (m), dénivelé positif (m), temps en mouvement (s), départ (epoch) et polyline résumée."""
+    distance = 0.0
+    moving_time = 0.0
+    elevation_gain = 0.0
+    ref_altitude = None
+    start = next((p[0] for p in points if p[0] is not None), None)
+    recorded = [p[4] for p in points if p[4] is not None]
+    first = next((p for p in points if p[1] is not None and p[2] is not None), None)
+    cos_lat = math.cos(math.radians(first[1])) if first else 1.0
+    summary_points = []
+    since_kept = 0.0
+    previous = None
+    for t, lat, lon, ele, dist in points:
+        if ele is not None:
+            if ref_altitude is None or ele < ref_altitude:
+                ref_altitude = ele
+            elif ele - ref_altitude >= ELEVATION_THRESHOLD:
+                elevation_gain += ele - ref_altitude
+                ref_altitude = ele
+        if lat is None or lon is None:
+            continue
+        if previous is None:
+            summary_points.append((round(lat, 5), round(lon, 5)))
+        else:
+            step = _step_m(previous[1], previous[2], lat, lon, cos_lat)
+            distance += step
+            if t is not None and previous[0] is not None and t > previous[0] and step / (t - previous[0]) >= MOVING_SPEED:
+                moving_time += t - previous[0]
+            since_kept += step
+            if since_kept >= POLYLINE_STEP_M:
+                since_kept = 0.0
+                summary_points.append((round(lat, 5), round(lon, 5)))
+        previous = (t, lat, lon)
+    if previous is not None and summary_points[-1] != (round(previous[1], 5), round(previous[2], 5)):
+        summary_points.append((round(previous[1], 5), round(previous[2], 5)))
+    if recorded:
+        # Distance cumulée enregistrée par le compteur : plus juste que les points GPS
+        distance = max(recorded) - min(recorded)
+    return {
+        "start": start,
+        "distance": distance,
+        "total_elevation_gain": round(elevation_gain, 1),
+        "moving_time": int(moving_time),
+        "summary_polyline": polyline.encode(summary_points) if len(summary_points) > 1 else None,
+    }
+
+
+def parse_activity_file(name, data):
+    """Analyse un fichier d'activité (contenu brut, .gz accepté). Retourne le résumé + les infos du fichier."""
+    if name.endswith(".gz"):
+        data = gzip.decompress(data)
+        name = name[:-3]
+    reader = _READERS.get(os.path.splitext(name)[1].lower())
+    if reader is None:
+        raise ValueError(f"format non pris en charge : {name}")
+    points, info = reader(data)
+    summary = summarize(points)
+    # Les totaux de session FIT (compteur) priment sur ceux recalculés depuis les points
+    for key in ("start", "distance", "moving_time", "total_elevation_gain"):
+        if info.get(key) is not None:
+            summary[key] = info[key]
+    summary["name"] = info.get("name")
+    summary["type"] = info.get("type")
+    return summary
+
+
+_worker_archive = None
+
+
+def _open_archive(zip_path):
+    """Initialisation d'un processus du pool : l'archive (et son répertoire central) n'est lue qu'une fois."""
+    global _worker_archive
+    _worker_archive = zipfile.ZipFile(zip_path)
+
+
+def _parse_member(member):
+    """Tâche du pool : lit et analyse un fichier de l'archive. Retourne (membre, résumé, erreur)."""
+    try:
+        return member, parse_activity_file(member, _worker_archive.read(member)), None
+    except Exception as e:
+        return member, None, str(e)
+
+
+# --- ARCHIVE ---
+
+def _csv_float(row, key):
+    try:
+        return float(row.get(key) or "")
+    except ValueError:
+        return None
+
+
+def read_activities_csv(archive):
+    """activities.csv de l'export : {Filename: ligne}, et les activités sans fichier (saisies à la main)."""
+    name = next((n for n in archive.namelist() if n.rsplit("/", 1)[-1] == "activities.csv"), None)
+    if name is None:
+        return {}, []
+    by_file, manual = {}, []
+    with archive.open(name) as f:
+        # Colonnes en double (Distance en km puis en m...) : DictReader garde la dernière, en unités SI
+        for row in csv.DictReader(io.TextIOWrapper(f, encoding="utf-8-sig")):
+            if row.get("Filename"):
+                by_file[row["Filename"].strip()] = row
+            else:
+                manual.append(row)
+    return by_file, manual
+
+
+# Libellés de la colonne « Activity Type » de activities.csv -> type de l'API Strava.
+# Les libellés composés perdent espaces et tirets (« Virtual Ride » -> VirtualRide) ;
+# les variantes qui n'ont pas de type API propre sont ramenées au type de base.
+_API_TYPES = {
+    "AlpineSki", "BackcountrySki", "Canoeing", "Crossfit", "EBikeRide", "Elliptical", "Golf", "Handcycle",
+    "Hike", "IceSkate", "InlineSkate", "Kayaking", "Kitesurf", "NordicSki", "Ride", "RockClimbing",
+    "RollerSki", "Rowing", "Run", "Sail", "Skateboard", "Snowboard", "Snowshoe", "Soccer", "StairStepper",
+    "StandUpPaddling", "Surfing", "Swim", "Velomobile", "VirtualRide", "VirtualRun", "Walk",
+    "WeightTraining", "Wheelchair", "Windsurf", "Workout", "Yoga",
+}
+_CSV_TYPES = {
+    "mountain bike ride": "Ride", "gravel ride": "Ride", "e-mountain bike ride": "EBikeRide",
+    "trail run": "Run", "canoe": "Canoeing", "kayak": "Kayaking",
+    # Exports d'un compte en français
+    "vélo": "Ride", "vtt": "Ride", "vélo gravel": "Ride", "vélo virtuel": "VirtualRide",
+    "vélo électrique": "EBikeRide", "course à pied": "Run", "trail": "Run", "course virtuelle": "VirtualRun",
+    "marche": "Walk", "randonnée": "Hike", "natation": "Swim", "musculation": "WeightTraining",
+}
+
+
+def _api_type(label):
+    """Type API d'un libellé de activities.csv ; None si le libellé est inconnu."""
+    label = (label or "").strip()
+    if not label:
+        return None
+    if label.lower() in _CSV_TYPES:
+        return _CSV_TYPES[label.lower()]
+    compact = label.replace(" ", "").replace("-", "")
+    return next((t for t in _API_TYPES if t.lower() == compact.lower()), None)
+
+
+def _csv_start(row):
+    """Date de activities.csv ('Mar 14, 2020, 8:01:23 AM', en UTC) -> epoch, ou None."""
+    try:
+        dt = datetime.datetime.strptime(row.get("Activity Date", ""), "%b %d, %Y, %I:%M:%S %p")
+    except ValueError:
+        return None
+    return dt.replace(tzinfo=datetime.timezone.utc).timestamp()
+
+
+def to_strava_activity(summary, csv_row, member):
+    """
+    Activité au format de l'API Strava (celui qu'attend format_activity), ou None sans id ni date.
+    Les totaux de activities.csv (ceux affichés par Strava) priment sur les valeurs recalculées.
+    """
+    csv_row = csv_row or {}
+    activity_id = csv_row.get("Activity ID") or os.path.basename(member).split(".")[0]
+    start = summary.get("start") or _csv_start(csv_row)
+    if not str(activity_id).isdigit() or start is None:
+        return None
+    distance = _csv_float(csv_row, "Distance")
+    elevation = _csv_float(csv_row, "Elevation Gain")
+    moving_time = _csv_float(csv_row, "Moving Time")
+    return {
+        "id": int(activity_id),
+        "name": csv_row.get("Activity Name") or summary.get("name") or "Activité importée",
+        "type": _api_type(csv_row.get("Activity Type")) or summary.get("type") or "Workout",
+        "start_date": datetime.datetime.fromtimestamp(start, datetime.timezone.utc).strftime("%Y-%m-%dT%H:%M:%SZ"),
+        "distance": distance if distance is not None else summary.get("distance", 0.0),
+        "total_elevation_gain": elevation if elevation is not None else summary.get("total_elevation_gain", 0.0),
+        "moving_time": int(moving_time) if moving_time is not None else summary.get("moving_time", 0),
+        "map": {"summary_polyline": summary.get("summary_polyline")},
+    }
+
+
+def iter_archive_activities(zip_path, workers=None):
+    """
+    Générateur (activité au format API, ou None, erreur) pour chaque activité de l'archive.
+    Les fichiers sont analysés en parallèle dans un pool de processus.
+    """
+    with zipfile.ZipFile(zip_path) as archive:
+        by_file, manual = read_activities_csv(archive)
+        members = [n for n in archive.namelist()
+                   if os.path.splitext(n[:-3] if n.endswith(".gz") else n)[1].lower() in _READERS]
+
+    for row in manual:
+        activity = to_strava_activity({}, row, "")
+        yield activity, None if activity else f"activité {row.get('Activity ID')} sans date"
+
+    with concurrent.futures.ProcessPoolExecutor(max_workers=workers, initializer=_open_archive,
+                                                initargs=(zip_path,)) as executor:
+        results = executor.map(_parse_member, members, chunksize=16)
+        for member, summary, error in results:
+            if error:
+                yield None, f"{member} : {error}"
+                continue
+            activity = to_strava_activity(summary, by_file.get(member), member)
+            yield activity, None if activity else f"{member} : id d'activité ou date introuvable"
+
+
+def import_archive(zip_path, athlete_id, workers=None, dry_run=False):
+    """
+    Importe l'export Strava d'un athlète (déjà inscrit : le profil doit exister).
+    Seules les activités absentes de la base sont ajoutées ; les autres sont comptées dans "existing".
+    Retourne les compteurs {"inserted", "existing", "errors"}, ou {"parsed", "errors"} en dry_run.
+    """
+    upsert_activities = None
+    known = set()
+    if not dry_run:
+        # Import tardif : l'analyse seule (--dry-run) se passe de Supabase
+        from core.db import upsert_activities, get_profile, _known_hashes
+        if not get_profile(athlete_id):
+            raise ValueError(f"athlète {athlete_id} inconnu : il doit s'être connecté une première fois")
+        known = set(_known_hashes(athlete_id))
+
+    stats = {"parsed": 0, "errors": 0} if dry_run else {"inserted": 0, "existing": 0, "errors": 0}
+    batch = {}
+
+    def flush():
+        if upsert_activities and batch:
+            stats["inserted"] += upsert_activities(athlete_id, list(batch.values()))["inserted"]
+        batch.clear()
+
+    for activity, error in iter_archive_activities(zip_path, workers=workers):
+        if error:
+            stats["errors"] += 1
+            print(f"⚠️ {error}")
+            continue
+        if dry_run:
+            stats["parsed"] += 1
+            continue
+        if activity["id"] in known:
+            stats["existing"] += 1
+            continue
+        batch[activity["id"]] = activity
+        if len(batch) >= IMPORT_BATCH:
+            flush()
+            print(f"📦 {stats['inserted']} activités importées...")
+    flush()
+    return stats
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Import d'un export Strava (zip) sans passer par l'API")
+    parser.add_argument("archive", help="zip de l'export Strava")
+    parser.add_argument("--athlete", type=int, required=True, help="id Strava de l'athlète")
+    parser.add_argument("--workers", type=int, default=None, help="processus d'analyse (défaut : nombre de CPU)")
+    parser.add_argument("--dry-run", action="store_true", help="analyse l'archive sans rien écrire en base")
+    args = parser.parse_args()
+
+    started = time.perf_counter()
+    result = import_archive(args.archive, args.athlete, workers=args.workers, dry_run=args.dry_run)
+    elapsed = time.perf_counter() - started
+    if args.dry_run:
+        print(f"✅ Analyse terminée en {elapsed:.1f}s : {result['parsed']} activités lues, {result['errors']} en erreur.")
+    else:
+        print(f"✅ Import terminé en {elapsed:.1f}s : {result['inserted']} insérées, "
+              f"{result['existing']} déjà en base (inchangées), {result['errors']} en erreur.")
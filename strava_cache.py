@@ -0,0 +1,99 @@
+import os
+import re
+import json
+import time
+import sqlite3
+import threading
+
+# --- CACHE DES RÉPONSES STRAVA ---
+# Les endpoints de lecture qui changent peu (totaux d'un athlète, profil) sont servis
+# depuis un cache disque partagé entre processus (UI Streamlit, webhook, worker) :
+# une réponse fraîche ne coûte aucune requête ; une réponse expirée est revalidée avec
+# son ETag (If-None-Match, 304 sans corps). Clé : athlète + URL + paramètres, pour
+# qu'un token qui tourne ne vide pas le cache.
+STRAVA_CACHE_DB = os.getenv("STRAVA_CACHE_DB", "strava_cache.db")
+
+# Durée de vie par endpoint (chemin sous /api/v3) ; les endpoints absents ne sont pas mis en cache
+CACHE_TTLS = (
+    (re.compile(r"/athletes/\d+/stats$"), 3600),   # totaux : invalidés aussi à chaque nouvelle activité
+    (re.compile(r"/athlete$"), 24 * 3600),         # profil de l'athlète connecté
+)
+
+
+def ttl_for(url):
+    """Durée de vie du cache pour une URL de l'API, None si l'endpoint n'est pas mis en cache."""
+    path = url.split("?", 1)[0]
+    for pattern, ttl in CACHE_TTLS:
+        if pattern.search(path):
+            return ttl
+    return None
+
+
+def cache_key(url, params=None):
+    """URL normalisée : paramètres triés, pour qu'un même GET ait toujours la même clé."""
+    if not params:
+        return url
+    return url + "?" + "&".join(f"{k}={v}" for k, v in sorted(params.items()))
+
+
+class StravaResponseCache:
+    """Réponses JSON des GET Strava, par athlète, avec ETag et date de récupération (SQLite)."""
+
+    def __init__(self, path=STRAVA_CACHE_DB):
+        self.path = path
+        self._ready = False
+        self._init_lock = threading.Lock()
+
+    def _connect(self):
+        conn = sqlite3.connect(self.path, timeout=30)
+        if not self._ready:
+            with self._init_lock:
+                conn.execute("""
+                    CREATE TABLE IF NOT EXISTS responses (
+                        athlete_id INTEGER NOT NULL,
+                        key TEXT NOT NULL,
+                        etag TEXT,
+                        body TEXT NOT NULL,
+                        fetched_at REAL NOT NULL,
+                        PRIMARY KEY (athlete_id, key)
+                    )
+                """)
+                conn.commit()
+                self._ready = True
+        return conn
+
+    def get(self, athlete_id, key):
+        """{"etag", "data", "fetched_at"} ou None."""
+        with self._connect() as conn:
+            row = conn.execute("SELECT etag, body, fetched_at FROM responses WHERE athlete_id = ? AND key = ?",
+                               (athlete_id, key)).fetchone()
+        if not row:
+            return None
+        return {"etag": row[0], "data": json.loads(row[1]), "fetched_at": row[2]}
+
+    def store(self, athlete_id, key, data, etag=None):
+        with self._connect() as conn:
+            conn.execute("INSERT OR REPLACE INTO responses (athlete_id, key, etag, body, fetched_at) VALUES (?, ?, ?, ?, ?)",
+                         (athlete_id, key, etag, json.dumps(data), time.time()))
+
+    def touch(self, athlete_id, key):
+        """Réponse revalidée (304) : elle repart pour une durée de vie complète."""
+        with self._connect() as conn:
+            conn.execute("UPDATE responses SET fetched_at = ? WHERE athlete_id = ? AND key = ?",
+                         (time.time(), athlete_id, key))
+
+    def invalidate(self, athlete_id, pattern=None):
+        """
+        Oublie les réponses d'un athlète (celles dont la clé contient pattern si fourni).
+        Les ETag sont conservés : la prochaine lecture revalide au lieu de tout retélécharger.
+        """
+        with self._connect() as conn:
+            if pattern is None:
+                conn.execute("UPDATE responses SET fetched_at = 0 WHERE athlete_id = ?", (athlete_id,))
+            else:
+                conn.execute("UPDATE responses SET fetched_at = 0 WHERE athlete_id = ? AND instr(key, ?) > 0",
+                             (athlete_id, pattern))
+
+
+# Instance unique partagée par tous les appels Strava du processus
+response_cache = StravaResponseCache()
@@ -0,0 +1,153 @@
+import os
+import time
+import random
+import threading
+import email.utils
+import datetime
+import requests
+from requests.adapters import HTTPAdapter
+from strava_ratelimit import rate_limiter
+import sync_metrics
+from strava_cache import response_cache, ttl_for, cache_key
+
+# --- COUCHE HTTP STRAVA ---
+# Session partagée (keep-alive) : un seul handshake TCP+TLS par connexion du pool
+# au lieu d'un par requête. Le pool est dimensionné sur le nombre de pages
+# récupérées en parallèle par iter_activity_pages, multiplié par le nombre
+# d'athlètes synchronisés simultanément (cron_sync.SYNC_CONCURRENCY).
+POOL_SIZE = 10
+POOL_MAXSIZE = int(os.getenv("STRAVA_HTTP_POOL_MAXSIZE", POOL_SIZE * 4))
+DEFAULT_TIMEOUT = (5, 30)  # (connexion, lecture) en secondes
+MAX_RETRIES = 4
+BACKOFF_BASE = 1.0
+BACKOFF_MAX = 60
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+# Surchargeable pour pointer vers un faux serveur local (fake_strava.py)
+STRAVA_BASE_URL = os.getenv("STRAVA_BASE_URL", "https://www.strava.com").rstrip("/")
+STRAVA_API_URL = f"{STRAVA_BASE_URL}/api/v3"
+STRAVA_TOKEN_URL = f"{STRAVA_BASE_URL}/oauth/token"
+
+_adapter = HTTPAdapter(pool_connections=2, pool_maxsize=POOL_MAXSIZE)
+_local = threading.local()
+
+
+def _session():
+    """Une Session par thread, toutes montées sur le même pool de connexions (thread-safe)."""
+    session = getattr(_local, "session", None)
+    if session is None:
+        session = requests.Session()
+        session.mount("https://", _adapter)
+        session.mount("http://", _adapter)
+        _local.session = session
+    return session
+
+
+def _retry_after(response):
+    """Délai demandé par le serveur (header Retry-After en secondes ou date HTTP), sinon None."""
+    value = response.headers.get("Retry-After")
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        date = email.utils.parsedate_to_datetime(value)
+        return max(0.0, (date - datetime.datetime.now(datetime.timezone.utc)).total_seconds())
+    except (TypeError, ValueError):
+        return None
+
+
+def _backoff(attempt):
+    """Backoff exponentiel avec jitter complet."""
+    return random.uniform(0, min(BACKOFF_MAX, BACKOFF_BASE * 2 ** attempt))
+
+
+def strava_request(method, url, rate_limited=True, timeout=DEFAULT_TIMEOUT, reserve=0, **kwargs):
+    """
+    Requête vers Strava avec réessais sur erreurs réseau, 429 et 5xx.
+    rate_limited=True : la requête est décomptée du budget partagé (API v3) ;
+    les appels OAuth (/oauth/token) ne le sont pas.
+    reserve : requêtes de la fenêtre de 15 min laissées aux appels prioritaires (cf. rate_limiter.acquire).
+    """
+    for attempt in range(MAX_RETRIES + 1):
+        if rate_limited:
+            rate_limiter.acquire(reserve=reserve)
+        try:
+            response = _session().request(method, url, timeout=timeout, **kwargs)
+        except (requests.ConnectionError, requests.Timeout) as e:
+            if rate_limited:
+                sync_metrics.record_request("network")
+            if attempt == MAX_RETRIES:
+                raise
+            delay = _backoff(attempt)
+            print(f"⚠️ Erreur réseau Strava ({e.__class__.__name__}), nouvel essai dans {delay:.1f}s...")
+            time.sleep(delay)
+            continue
+
+        if rate_limited:
+            sync_metrics.record_request(response.status_code)
+            if response.status_code == 429:
+                rate_limiter.on_rate_limited(response.headers)
+            else:
+                rate_limiter.update_from_headers(response.headers)
+
+        if response.status_code not in RETRY_STATUSES or attempt == MAX_RETRIES:
+            return response
+
+        if response.status_code == 429 and rate_limited:
+            # Fenêtre marquée pleine par on_rate_limited : l'attente se fait une seule fois,
+            # dans rate_limiter.acquire() au tour suivant (jusqu'au début de la fenêtre suivante)
+            print("⚠️ Strava a répondu 429, nouvel essai à l'ouverture de la prochaine fenêtre de quota...")
+            continue
+
+        delay = _retry_after(response)
+        if delay is None:
+            delay = _backoff(attempt)
+        print(f"⚠️ Strava a répondu {response.status_code}, nouvel essai dans {delay:.1f}s...")
+        if response.status_code == 429:
+            sync_metrics.add("rate_limited_seconds", delay)
+        time.sleep(delay)
+    return response
+
+
+def strava_get(url, **kwargs):
+    """GET sur l'API Strava, décompté du budget de requêtes partagé (threads + processus)."""
+    return strava_request("GET", url, **kwargs)
+
+
+def strava_get_cached(url, athlete_id, params=None, **kwargs):
+    """
+    GET d'un endpoint de lecture avec cache disque (strava_cache) : sans requête tant que
+    la réponse de l'athlète est fraîche, puis revalidée par If-None-Match (304 = inchangée).
+    Les endpoints sans durée de vie passent directement à strava_get.
+    Retourne (code HTTP, JSON) ; le JSON est None si la requête échoue.
+    """
+    ttl = ttl_for(url)
+    if ttl is None:
+        response = strava_get(url, params=params, **kwargs)
+        return response.status_code, response.json() if response.status_code == 200 else None
+
+    key = cache_key(url, params)
+    cached = response_cache.get(athlete_id, key)
+    if cached and time.time() - cached["fetched_at"] < ttl:
+        return 200, cached["data"]
+
+    headers = dict(kwargs.pop("headers", None) or {})
+    if cached and cached["etag"]:
+        headers["If-None-Match"] = cached["etag"]
+    response = strava_get(url, params=params, headers=headers, **kwargs)
+    if response.status_code == 304 and cached:
+        response_cache.touch(athlete_id, key)
+        return 200, cached["data"]
+    if response.status_code != 200:
+        return response.status_code, None
+    data = response.json()
+    response_cache.store(athlete_id, key, data, response.headers.get("ETag"))
+    return 200, data
+
+
+def strava_post(url, **kwargs):
+    """POST vers Strava (OAuth) : réessais et timeouts, hors budget API."""
+    return strava_request("POST", url, rate_limited=False, **kwargs)
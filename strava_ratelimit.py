@@ -0,0 +1,159 @@
+import os
+import json
+import time
+import tempfile
+import contextlib
+import threading
+import sync_metrics
+
+try:
+    import fcntl  # Verrou inter-processus (Linux / macOS)
+except ImportError:
+    fcntl = None
+
+# --- QUOTA STRAVA ---
+# Strava applique deux fenêtres de lecture : 15 minutes (remise à zéro à 0, 15, 30, 45)
+# et journalière (remise à zéro à minuit UTC). Les valeurs par défaut correspondent
+# au quota "read" d'une application standard (100 req / 15 min, 1000 req / jour).
+SHORT_WINDOW_SECONDS = 15 * 60
+DAY_SECONDS = 24 * 3600
+
+RATE_STATE_FILE = os.getenv("STRAVA_RATE_STATE", os.path.join(tempfile.gettempdir(), "strava_rate_state.json"))
+SHORT_LIMIT = int(os.getenv("STRAVA_RATE_LIMIT_15MIN", 100))
+DAILY_LIMIT = int(os.getenv("STRAVA_RATE_LIMIT_DAILY", 1000))
+
+
+class RateLimitExceeded(Exception):
+    """Quota journalier Strava épuisé : inutile d'attendre la prochaine fenêtre de 15 min."""
+
+
+class StravaRateLimiter:
+    """
+    Budget de requêtes Strava partagé entre threads ET processus (UI Streamlit + cron).
+    L'état est persisté dans un fichier JSON protégé par un verrou ; chaque réponse
+    Strava recale le compteur grâce aux headers X-ReadRateLimit-*.
+    """
+
+    def __init__(self, state_file=RATE_STATE_FILE, short_limit=SHORT_LIMIT, daily_limit=DAILY_LIMIT, safety_margin=2):
+        self.state_file = state_file
+        self.lock_file = state_file + ".lock"
+        self.short_limit = short_limit
+        self.daily_limit = daily_limit
+        self.safety_margin = safety_margin
+        self._thread_lock = threading.Lock()
+
+    # --- PERSISTANCE ---
+
+    @contextlib.contextmanager
+    def _locked(self):
+        with self._thread_lock:
+            if not fcntl:
+                yield
+                return
+            with open(self.lock_file, "a") as fd:
+                fcntl.flock(fd, fcntl.LOCK_EX)
+                try:
+                    yield
+                finally:
+                    fcntl.flock(fd, fcntl.LOCK_UN)
+
+    def _load(self, now):
+        try:
+            with open(self.state_file) as f:
+                state = json.load(f)
+        except (FileNotFoundError, ValueError):
+            state = {}
+
+        short_window = int(now // SHORT_WINDOW_SECONDS)
+        day_window = int(now // DAY_SECONDS)
+        # Changement de fenêtre : le compteur correspondant repart de zéro
+        if state.get("short_window") != short_window:
+            state["short_window"] = short_window
+            state["short_used"] = 0
+        if state.get("day_window") != day_window:
+            state["day_window"] = day_window
+            state["day_used"] = 0
+        state.setdefault("short_limit", self.short_limit)
+        state.setdefault("daily_limit", self.daily_limit)
+        return state
+
+    def _save(self, state):
+        tmp = self.state_file + ".tmp"
+        with open(tmp, "w") as f:
+            json.dump(state, f)
+        os.replace(tmp, self.state_file)
+
+    # --- API ---
+
+    def acquire(self, reserve=0):
+        """
+        Réserve une requête dans le budget. Bloque jusqu'à la prochaine fenêtre de 15 min
+        si le quota court est atteint ; lève RateLimitExceeded si le quota du jour est épuisé.
+        'reserve' laisse des requêtes disponibles pour les appels prioritaires.
+        """
+        while True:
+            now = time.time()
+            with self._locked():
+                state = self._load(now)
+                if state["day_used"] >= state["daily_limit"] - self.safety_margin:
+                    raise RateLimitExceeded(f"Quota journalier Strava atteint ({state['day_used']}/{state['daily_limit']})")
+                if state["short_used"] < state["short_limit"] - self.safety_margin - reserve:
+                    state["short_used"] += 1
+                    state["day_used"] += 1
+                    self._save(state)
+                    return
+                wait = SHORT_WINDOW_SECONDS - (now % SHORT_WINDOW_SECONDS) + 1
+                used = state["short_used"]
+            print(f"🕒 Quota Strava 15 min atteint ({used}/{state['short_limit']}) : attente de {int(wait)}s...")
+            with sync_metrics.timed("rate_limited_seconds"):
+                time.sleep(wait)
+
+    def update_from_headers(self, headers):
+        """Recale le budget sur les compteurs renvoyés par Strava (usage et limites)."""
+        usage = _parse_pair(headers.get("X-ReadRateLimit-Usage") or headers.get("X-RateLimit-Usage"))
+        limit = _parse_pair(headers.get("X-ReadRateLimit-Limit") or headers.get("X-RateLimit-Limit"))
+        if not usage and not limit:
+            return
+        with self._locked():
+            state = self._load(time.time())
+            if limit:
+                state["short_limit"], state["daily_limit"] = limit
+            if usage:
+                # Strava fait foi, mais on garde les requêtes déjà réservées localement et pas encore comptées
+                state["short_used"] = max(state["short_used"], usage[0])
+                state["day_used"] = max(state["day_used"], usage[1])
+            self._save(state)
+
+    def on_rate_limited(self, headers):
+        """Réponse 429 : on considère la fenêtre de 15 min comme pleine."""
+        self.update_from_headers(headers)
+        with self._locked():
+            state = self._load(time.time())
+            state["short_used"] = max(state["short_used"], state["short_limit"])
+            self._save(state)
+
+    def status(self):
+        """Photographie du budget courant (pour affichage)."""
+        with self._locked():
+            state = self._load(time.time())
+        return {
+            "short_used": state["short_used"],
+            "short_limit": state["short_limit"],
+            "day_used": state["day_used"],
+            "daily_limit": state["daily_limit"],
+        }
+
+
+def _parse_pair(value):
+    """'12,345' -> (12, 345) ; None si header absent ou illisible."""
+    if not value:
+        return None
+    try:
+        short, daily = (int(v) for v in value.split(",")[:2])
+        return short, daily
+    except ValueError:
+        return None
+
+
+# Instance unique partagée par tous les appels Strava du processus
+rate_limiter = StravaRateLimiter()
@@ -0,0 +1,97 @@
+import time
+import threading
+import sync_metrics
+from core.strava import exchange_refresh_token
+from core.db import save_strava_tokens, get_stored_tokens
+
+# --- CACHE DES ACCESS TOKENS STRAVA ---
+# Un access token Strava vit ~6h : on le réutilise jusqu'à EXPIRY_MARGIN secondes
+# de son expiration au lieu de refaire un échange OAuth à chaque synchro.
+# Les tokens sont gardés en mémoire et persistés dans profiles (access_token,
+# token_expires_at) pour être partagés entre l'UI, la console admin et le cron.
+EXPIRY_MARGIN = 10 * 60
+
+
+class TokenRejected(Exception):
+    """Strava refuse le refresh token (400 / 401) : révoqué ou invalide, l'athlète doit se reconnecter."""
+
+
+_tokens = {}
+_locks = {}
+_locks_guard = threading.Lock()
+
+
+def _lock_for(athlete_id):
+    """
+    Un verrou par athlète : les appels concurrents partagent un seul refresh.
+    Réentrant, car store_tokens le reprend quand get_valid_tokens le tient déjà.
+    """
+    with _locks_guard:
+        return _locks.setdefault(athlete_id, threading.RLock())
+
+
+def _is_fresh(tokens):
+    return bool(tokens and tokens.get("access_token") and (tokens.get("expires_at") or 0) > time.time() + EXPIRY_MARGIN)
+
+
+def _from_profile(profile):
+    """Tokens déjà stockés dans une ligne profiles (dict ou ligne de DataFrame)."""
+    if profile is None:
+        return None
+    access = profile.get("access_token")
+    expires_at = profile.get("token_expires_at")
+    if not isinstance(access, str) or expires_at is None or expires_at != expires_at:  # NaN
+        return None
+    return {"access_token": access, "refresh_token": profile.get("refresh_token"), "expires_at": int(expires_at)}
+
+
+def _latest(*candidates):
+    """Le plus récent des jeux de tokens connus (expiration la plus lointaine)."""
+    known = [t for t in candidates if t]
+    return max(known, key=lambda t: t["expires_at"]) if known else None
+
+
+def store_tokens(athlete_id, tokens):
+    """Mémorise une réponse OAuth Strava (login ou refresh) en cache et en base."""
+    entry = {
+        "access_token": tokens["access_token"],
+        "refresh_token": tokens["refresh_token"],
+        "expires_at": int(tokens.get("expires_at") or time.time() + int(tokens.get("expires_in", 0))),
+    }
+    with _lock_for(athlete_id):
+        _tokens[athlete_id] = entry
+        save_strava_tokens(athlete_id, entry["access_token"], entry["refresh_token"], entry["expires_at"])
+    return entry
+
+
+def get_valid_tokens(athlete_id, refresh_token, profile=None, refresh_func=exchange_refresh_token):
+    """
+    Retourne un dict {access_token, refresh_token, expires_at} valide pour l'athlète,
+    en ne rafraîchissant auprès de Strava que si le token connu expire bientôt.
+    Retourne None si le refresh échoue ; refresh_func peut lever TokenRejected
+    si Strava refuse le refresh token lui-même.
+    """
+    with _lock_for(athlete_id):
+        cached = _tokens.get(athlete_id)
+        if _is_fresh(cached):
+            return cached
+        stored = _from_profile(profile)
+        if _is_fresh(stored):
+            _tokens[athlete_id] = stored
+            return stored
+
+        # Relecture sous le verrou : un autre processus (UI, webhook, autre cron) a pu
+        # faire tourner le refresh token depuis que profile a été lu
+        row = get_stored_tokens(athlete_id) or {}
+        latest = _latest(cached, _from_profile(row))
+        if _is_fresh(latest):
+            _tokens[athlete_id] = latest
+            return latest
+        current_refresh = (latest or {}).get("refresh_token") or row.get("refresh_token") or refresh_token
+        with sync_metrics.timed("token_refresh_seconds"):
+            tokens = refresh_func(current_refresh)
+        sync_metrics.add("token_refreshes")
+        if not tokens or "access_token" not in tokens:
+            return None
+        tokens.setdefault("refresh_token", current_refresh)
+        return store_tokens(athlete_id, tokens)
@@ -0,0 +1,270 @@
+"""
+Réception des événements webhook Strava (création / modification / suppression d'activités).
+
+Les événements sont stockés dans une file SQLite locale qui fusionne les événements
+répétés d'une même activité, puis vidée par lots vers la base (sync_profile_and_activities).
+
+Utilisation :
+    python strava_webhook.py serve --port 8080     # récepteur + vidage périodique
+    python strava_webhook.py drain                 # vidage ponctuel de la file
+    python strava_webhook.py replay events.jsonl --url http://127.0.0.1:8080/webhook
+"""
+import os
+import sys
+import json
+import time
+import sqlite3
+import argparse
+import threading
+import urllib.parse
+import http.server
+import requests
+from dotenv import load_dotenv
+
+load_dotenv()
+
+WEBHOOK_QUEUE_DB = os.getenv("STRAVA_WEBHOOK_QUEUE", "webhook_events.db")
+WEBHOOK_VERIFY_TOKEN = os.getenv("STRAVA_WEBHOOK_VERIFY_TOKEN", "")
+# Id de l'abonnement renvoyé par Strava à sa création : les événements d'un autre abonnement sont refusés
+WEBHOOK_SUBSCRIPTION_ID = os.getenv("STRAVA_WEBHOOK_SUBSCRIPTION_ID")
+DRAIN_INTERVAL = 60       # secondes entre deux vidages en mode serve
+DRAIN_BATCH_SIZE = 50     # événements traités par lot
+MAX_ATTEMPTS = 5          # au-delà, l'événement est abandonné
+
+
+class WebhookEventQueue:
+    """
+    File durable (SQLite) des événements d'activités. Une ligne par activité :
+    un nouvel événement sur la même activité remplace le précédent (le plus récent gagne),
+    donc 10 modifications d'une sortie ne coûtent qu'un seul appel Strava.
+    """
+
+    def __init__(self, path=WEBHOOK_QUEUE_DB):
+        self.path = path
+        with self._connect() as conn:
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS events (
+                    object_id INTEGER PRIMARY KEY,
+                    owner_id INTEGER NOT NULL,
+                    action TEXT NOT NULL,          -- 'upsert' ou 'delete'
+                    event_time INTEGER NOT NULL,
+                    received_at REAL NOT NULL,
+                    hits INTEGER NOT NULL DEFAULT 1,
+                    attempts INTEGER NOT NULL DEFAULT 0
+                )
+            """)
+
+    def _connect(self):
+        return sqlite3.connect(self.path, timeout=30)
+
+    def push(self, event):
+        """Ajoute un événement Strava (dict du webhook). Retourne False s'il est ignoré."""
+        if event.get("object_type") != "activity":
+            return False
+        action = "delete" if event.get("aspect_type") == "delete" else "upsert"
+        with self._connect() as conn:
+            conn.execute("""
+                INSERT INTO events (object_id, owner_id, action, event_time, received_at)
+                VALUES (?, ?, ?, ?, ?)
+                ON CONFLICT(object_id) DO UPDATE SET
+                    action = CASE WHEN excluded.event_time >= events.event_time THEN excluded.action ELSE events.action END,
+                    event_time = MAX(events.event_time, excluded.event_time),
+                    hits = events.hits + 1,
+                    attempts = 0
+            """, (int(event["object_id"]), int(event["owner_id"]), action,
+                  int(event.get("event_time") or time.time()), time.time()))
+        return True
+
+    def peek(self, limit=DRAIN_BATCH_SIZE):
+        """Les plus anciens événements en attente."""
+        with self._connect() as conn:
+            rows = conn.execute(
+                "SELECT object_id, owner_id, action, event_time FROM events ORDER BY received_at LIMIT ?", (limit,)
+            ).fetchall()
+        return [{"object_id": r[0], "owner_id": r[1], "action": r[2], "event_time": r[3]} for r in rows]
+
+    def ack(self, events):
+        """Retire les événements traités (sauf s'ils ont été mis à jour entre-temps)."""
+        with self._connect() as conn:
+            conn.executemany("DELETE FROM events WHERE object_id = ? AND event_time = ?",
+                             [(e["object_id"], e["event_time"]) for e in events])
+
+    def retry_later(self, events):
+        """Échec de traitement : on incrémente le compteur, abandon après MAX_ATTEMPTS."""
+        with self._connect() as conn:
+            conn.executemany("UPDATE events SET attempts = attempts + 1 WHERE object_id = ?",
+                             [(e["object_id"],) for e in events])
+            dropped = conn.execute("DELETE FROM events WHERE attempts >= ?", (MAX_ATTEMPTS,)).rowcount
+        if dropped:
+            print(f"🗑️ {dropped} événement(s) abandonné(s) après {MAX_ATTEMPTS} essais.")
+
+    def __len__(self):
+        with self._connect() as conn:
+            return conn.execute("SELECT COUNT(*) FROM events").fetchone()[0]
+
+
+def drain_events(queue, batch_size=DRAIN_BATCH_SIZE):
+    """
+    Vide un lot d'événements : un seul passage par athlète (token, fetch des activités
+    créées/modifiées, suppression des activités effacées, upsert groupé).
+    Le récepteur n'est pas authentifié : chaque événement est vérifié auprès de Strava
+    avec le token de l'athlète. Une suppression n'est appliquée que si Strava répond 404,
+    et une activité n'est enregistrée que si elle appartient bien à owner_id.
+    Retourne le nombre d'événements traités.
+    """
+    # Import tardif : le récepteur doit pouvoir démarrer sans Supabase
+    from core.db import sync_profile_and_activities, delete_activities, get_profile
+    from core.strava import fetch_activity
+    from strava_tokens import get_valid_tokens
+
+    events = queue.peek(batch_size)
+    by_owner = {}
+    for e in events:
+        by_owner.setdefault(e["owner_id"], []).append(e)
+
+    done = 0
+    for owner_id, owner_events in by_owner.items():
+        profile = get_profile(owner_id)
+        if not profile or not profile.get("refresh_token"):
+            # Athlète inconnu du club : rien à synchroniser
+            queue.ack(owner_events)
+            continue
+        try:
+            tokens = get_valid_tokens(owner_id, profile["refresh_token"], profile)
+            if not tokens:
+                queue.retry_later(owner_events)
+                continue
+            deleted = []
+            activities = []
+            failed = []
+            for e in owner_events:
+                activity = fetch_activity(tokens["access_token"], e["object_id"])
+                if activity is None:
+                    failed.append(e)
+                elif not activity:
+                    # 404 : suppression confirmée (ou activité déjà disparue pour un upsert)
+                    if e["action"] == "delete":
+                        deleted.append(e["object_id"])
+                elif (activity.get("athlete") or {}).get("id") == owner_id:
+                    # Toujours visible sur Strava : une suppression non confirmée devient un rafraîchissement
+                    activities.append(activity)
+                else:
+                    print(f"⚠️ Webhook : activité {e['object_id']} n'appartient pas à {owner_id}, ignorée.")
+
+            delete_activities(owner_id, deleted)
+            if activities:
+                athlete_obj = {
+                    "id": owner_id,
+                    "firstname": profile.get("firstname"),
+                    "lastname": profile.get("lastname"),
+                    "profile_medium": profile.get("avatar_url"),
+                }
+                if not sync_profile_and_activities(athlete_obj, activities, tokens["refresh_token"], is_from_ui=False):
+                    queue.retry_later(owner_events)
+                    continue
+
+            queue.ack([e for e in owner_events if e not in failed])
+            if failed:
+                queue.retry_later(failed)
+            done += len(owner_events) - len(failed)
+            print(f"📬 {owner_id} : {len(activities)} activité(s) mises à jour, {len(deleted)} supprimée(s).")
+        except Exception as e:
+            print(f"❌ Webhook {owner_id} : {e}")
+            queue.retry_later(owner_events)
+    return done
+
+
+class _WebhookHandler(http.server.BaseHTTPRequestHandler):
+    queue = None
+
+    def log_message(self, *args):
+        pass
+
+    def _reply(self, status, payload):
+        body = json.dumps(payload).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        # Validation de l'abonnement : Strava attend l'écho de hub.challenge
+        query = {k: v[0] for k, v in urllib.parse.parse_qs(urllib.parse.urlparse(self.path).query).items()}
+        if query.get("hub.mode") == "subscribe" and query.get("hub.verify_token") == WEBHOOK_VERIFY_TOKEN:
+            return self._reply(200, {"hub.challenge": query.get("hub.challenge")})
+        self._reply(403, {"error": "forbidden"})
+
+    def do_POST(self):
+        # Strava exige une réponse en moins de 2 s : on se contente d'empiler
+        length = int(self.headers.get("Content-Length", 0))
+        try:
+            event = json.loads(self.rfile.read(length) or b"{}")
+            if WEBHOOK_SUBSCRIPTION_ID and str(event.get("subscription_id")) != WEBHOOK_SUBSCRIPTION_ID:
+                print(f"⚠️ Événement d'un abonnement inconnu ({event.get('subscription_id')}) refusé.")
+                return self._reply(403, {"error": "forbidden"})
+            self.queue.push(event)
+        except (ValueError, KeyError, TypeError) as e:
+            print(f"⚠️ Événement webhook illisible : {e}")
+        self._reply(200, {"ok": True})
+
+
+def serve(queue, host="0.0.0.0", port=8080, drain_interval=DRAIN_INTERVAL):
+    """Récepteur HTTP + thread de vidage périodique de la file."""
+    if not WEBHOOK_VERIFY_TOKEN:
+        raise SystemExit("❌ STRAVA_WEBHOOK_VERIFY_TOKEN manquant : le récepteur ne démarre pas sans token de vérification.")
+    if not WEBHOOK_SUBSCRIPTION_ID:
+        print("⚠️ STRAVA_WEBHOOK_SUBSCRIPTION_ID non défini : subscription_id non vérifié (à renseigner une fois l'abonnement créé).")
+    handler = type("WebhookHandler", (_WebhookHandler,), {"queue": queue})
+    server = http.server.ThreadingHTTPServer((host, port), handler)
+
+    def drain_loop():
+        while True:
+            time.sleep(drain_interval)
+            try:
+                while len(queue) and drain_events(queue):
+                    pass
+            except Exception as e:
+                print(f"❌ Vidage de la file webhook : {e}")
+
+    threading.Thread(target=drain_loop, daemon=True).start()
+    print(f"📡 Webhook Strava en écoute sur {host}:{port}")
+    server.serve_forever()
+
+
+def replay_events(events, url):
+    """Rejoue des événements (liste de dicts au format Strava) vers un récepteur local."""
+    for event in events:
+        event.setdefault("event_time", int(time.time()))
+        res = requests.post(url, json=event, timeout=5)
+        print(f"↪️ {event.get('aspect_type')} {event.get('object_id')} -> {res.status_code}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Webhook Strava")
+    sub = parser.add_subparsers(dest="command", required=True)
+    p_serve = sub.add_parser("serve", help="récepteur + vidage périodique")
+    p_serve.add_argument("--port", type=int, default=8080)
+    p_serve.add_argument("--interval", type=int, default=DRAIN_INTERVAL)
+    sub.add_parser("drain", help="vide la file une fois")
+    p_replay = sub.add_parser("replay", help="rejoue un fichier JSONL d'événements")
+    p_replay.add_argument("file")
+    p_replay.add_argument("--url", default="http://127.0.0.1:8080/webhook")
+    args = parser.parse_args()
+
+    if args.command == "replay":
+        with open(args.file) as f:
+            replay_events([json.loads(line) for line in f if line.strip()], args.url)
+        sys.exit(0)
+
+    event_queue = WebhookEventQueue()
+    if args.command == "serve":
+        serve(event_queue, port=args.port, drain_interval=args.interval)
+    else:
+        total = 0
+        while len(event_queue):
+            processed = drain_events(event_queue)
+            if not processed:
+                break
+            total += processed
+        print(f"✅ {total} événement(s) traité(s), {len(event_queue)} en attente.")
@@ -0,0 +1,107 @@
+import os
+import time
+import threading
+import concurrent.futures
+
+# --- GESTIONNAIRE DE SYNCHROS EN ARRIÈRE-PLAN ---
+# Un seul gestionnaire par processus serveur (app.py le crée via st.cache_resource) :
+# pool de threads borné, au plus une synchro par athlète à la fois. Deux onglets ou
+# deux sessions du même athlète récupèrent le même SyncJob au lieu de relancer un fetch.
+SYNC_JOB_WORKERS = int(os.getenv("SYNC_JOB_WORKERS", 4))
+RECENT_JOB_SECONDS = 120   # une synchro terminée depuis moins longtemps est réutilisée telle quelle
+
+
+class SyncJob:
+    """Synchro d'un athlète : statut, progression et résultat, lus par les sessions Streamlit."""
+
+    def __init__(self, athlete_id, kind):
+        self.athlete_id = athlete_id
+        self.kind = kind              # "login", "full"...
+        self.status = "queued"        # queued -> running -> done | error
+        self.progress = {"pages": 0, "activities": 0, "window": None, "windows_done": 0}
+        self.result = None
+        self.error = None
+        self.created_at = time.time()
+        self.finished_at = None
+        self._lock = threading.Lock()
+        self._finished = threading.Event()
+
+    @property
+    def finished(self):
+        return self.status in ("done", "error")
+
+    def wait(self, timeout=None):
+        """Bloque jusqu'à la fin de la synchro ; retourne False si timeout atteint avant."""
+        return self._finished.wait(timeout)
+
+    def report(self, pages=0, activities=0, window=None, window_done=False):
+        """
+        Appelé par la synchro au fil de l'eau (thread du pool).
+        window : tranche d'historique en cours (année) ; window_done : tranche écrite en base.
+        """
+        with self._lock:
+            self.progress["pages"] += pages
+            self.progress["activities"] += activities
+            if window is not None:
+                self.progress["window"] = window
+            if window_done:
+                self.progress["windows_done"] += 1
+
+    def snapshot(self):
+        with self._lock:
+            return {
+                "athlete_id": self.athlete_id,
+                "kind": self.kind,
+                "status": self.status,
+                "progress": dict(self.progress),
+                "error": self.error,
+                "created_at": self.created_at,
+                "finished_at": self.finished_at,
+            }
+
+
+class SyncJobManager:
+    """Pool de synchros partagé par toutes les sessions du processus."""
+
+    def __init__(self, max_workers=SYNC_JOB_WORKERS):
+        self._executor = concurrent.futures.ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="sync-job")
+        self._jobs = {}
+        self._lock = threading.Lock()
+
+    def submit(self, athlete_id, func, *args, kind="login"):
+        """
+        Lance func(job, *args) pour l'athlète, sauf si une synchro est déjà en cours
+        (quel que soit son type) ou si une synchro du même type vient de se terminer :
+        le SyncJob existant est alors renvoyé.
+        """
+        with self._lock:
+            job = self._jobs.get(athlete_id)
+            if job and not job.finished:
+                return job
+            if job and job.kind == kind and time.time() - job.finished_at < RECENT_JOB_SECONDS:
+                return job
+            job = SyncJob(athlete_id, kind)
+            self._jobs[athlete_id] = job
+        self._executor.submit(self._run, job, func, args)
+        return job
+
+    def _run(self, job, func, args):
+        job.status = "running"
+        try:
+            job.result = func(job, *args)
+        except Exception as e:
+            job.error = str(e)
+        # finished_at avant le statut : submit() le lit dès que job.finished est vrai
+        job.finished_at = time.time()
+        job.status = "error" if job.error else "done"
+        job._finished.set()
+
+    def get(self, athlete_id):
+        with self._lock:
+            return self._jobs.get(athlete_id)
+
+    def snapshot(self):
+        """État de toutes les synchros connues (console admin)."""
+        with self._lock:
+            jobs = list(self._jobs.values())
+        return [job.snapshot() for job in jobs]
@@ -0,0 +1,280 @@
+"""
+Métriques structurées des synchros (cron, worker, rafale du dimanche) : requêtes Strava,
+pages, activités écrites, latence des refresh de token, temps passé à attendre le quota
+et erreurs par classe, au total et par athlète.
+
+Les compteurs sont alimentés par les couches basses (strava_http, strava_ratelimit,
+strava_tokens, core) pendant un run ouvert avec `run(mode)` ; hors run, tout est ignoré
+(UI Streamlit). En fin de run, un résumé JSON et un fichier texte Prometheus (collecteur
+textfile de node_exporter) sont écrits dans SYNC_METRICS_DIR, et le résumé est passé à
+on_finish (ex. core.db.save_sync_run pour la console admin).
+
+Vérification (base en mémoire, dossier temporaire) : un run qui lève une exception
+écrit quand même ses rapports et sa ligne sync_runs.
+    python sync_metrics.py check
+"""
+import os
+import json
+import time
+import datetime
+import threading
+import contextlib
+import contextvars
+
+SYNC_METRICS_DIR = os.getenv("SYNC_METRICS_DIR", "sync_metrics")
+HISTORY_FILE = "sync_runs.jsonl"
+
+# Compteurs d'un run et d'un athlète (tous additifs)
+COUNTERS = (
+    "requests",               # requêtes API décomptées du quota (réessais compris)
+    "pages",                  # pages d'activités reçues
+    "activities_fetched",     # activités reçues de Strava
+    "activities_inserted",
+    "activities_updated",
+    "activities_skipped",     # inchangées (empreinte identique)
+    "token_refreshes",        # échanges OAuth effectifs (hors tokens encore valides)
+    "token_refresh_seconds",
+    "rate_limited_seconds",   # attente de fenêtre de quota et Retry-After des 429
+    "errors",
+    "seconds",                # durée de synchro (par athlète)
+)
+
+_HELP = {
+    "requests": "Requêtes API Strava décomptées du quota",
+    "pages": "Pages d'activités reçues",
+    "activities_fetched": "Activités reçues de Strava",
+    "activities_inserted": "Activités ajoutées en base",
+    "activities_updated": "Activités modifiées en base",
+    "activities_skipped": "Activités inchangées",
+    "token_refreshes": "Refresh de token OAuth",
+    "token_refresh_seconds": "Durée cumulée des refresh de token",
+    "rate_limited_seconds": "Temps passé à attendre le quota Strava",
+    "errors": "Erreurs",
+    "seconds": "Durée de synchro de l'athlète",
+}
+
+_athlete = contextvars.ContextVar("sync_metrics_athlete", default=None)
+_active = None   # run en cours dans le processus (un seul à la fois)
+
+
+def _empty():
+    return dict.fromkeys(COUNTERS, 0)
+
+
+class SyncRun:
+    """Compteurs d'un run, partagés par tous les threads de synchro."""
+
+    def __init__(self, mode):
+        self.mode = mode
+        self.started_at = time.time()
+        self.finished_at = None
+        self.totals = _empty()
+        self.athletes = {}
+        self.errors = {}          # classe d'erreur -> nombre
+        self.status_codes = {}    # code HTTP (ou "network") -> nombre
+        self.lock = threading.Lock()
+
+    def add(self, counter, value=1, athlete_id=None):
+        athlete_id = athlete_id if athlete_id is not None else _athlete.get()
+        with self.lock:
+            self.totals[counter] += value
+            if athlete_id is not None:
+                self.athletes.setdefault(athlete_id, _empty())[counter] += value
+
+    def error(self, error_class, athlete_id=None):
+        with self.lock:
+            self.errors[error_class] = self.errors.get(error_class, 0) + 1
+        self.add("errors", 1, athlete_id)
+
+    def status(self, code):
+        with self.lock:
+            self.status_codes[str(code)] = self.status_codes.get(str(code), 0) + 1
+
+    def summary(self):
+        """Résumé sérialisable du run (JSON, table sync_runs)."""
+        finished_at = self.finished_at or time.time()
+        with self.lock:
+            return {
+                "mode": self.mode,
+                "started_at": _iso(self.started_at),
+                "finished_at": _iso(finished_at),
+                "duration_s": round(finished_at - self.started_at, 3),
+                "totals": _rounded(self.totals),
+                "errors": dict(self.errors),
+                "status_codes": dict(self.status_codes),
+                "athletes": {str(a): _rounded(c) for a, c in self.athletes.items()},
+            }
+
+
+def _iso(ts):
+    return datetime.datetime.fromtimestamp(ts, datetime.timezone.utc).isoformat()
+
+
+def _rounded(counters):
+    return {k: round(v, 3) if isinstance(v, float) else v for k, v in counters.items()}
+
+
+# --- ALIMENTATION (sans effet hors run) ---
+
+def add(counter, value=1, athlete_id=None):
+    """Incrémente un compteur du run en cours (athlète courant si athlete_id n'est pas donné)."""
+    if _active is not None:
+        _active.add(counter, value, athlete_id)
+
+
+def record_error(error, athlete_id=None):
+    """Erreur comptée par classe : une exception ou un nom de classe."""
+    if _active is not None:
+        _active.error(error if isinstance(error, str) else type(error).__name__, athlete_id)
+
+
+def record_request(status_code):
+    """Requête API décomptée du quota, avec son code de réponse ("network" si aucune réponse)."""
+    if _active is not None:
+        _active.add("requests")
+        _active.status(status_code)
+
+
+@contextlib.contextmanager
+def timed(counter):
+    """Ajoute au compteur la durée du bloc (en secondes)."""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        add(counter, time.perf_counter() - start)
+
+
+@contextlib.contextmanager
+def athlete(athlete_id):
+    """Attribue à l'athlète les compteurs du bloc (et des threads lancés avec son contexte)."""
+    token = _athlete.set(athlete_id)
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        add("seconds", time.perf_counter() - start)
+        _athlete.reset(token)
+
+
+# --- RUN ---
+
+@contextlib.contextmanager
+def run(mode, directory=None, on_finish=None):
+    """
+    Ouvre un run de synchro ; à la sortie (même en erreur), écrit les rapports
+    et appelle on_finish(résumé). Un run déjà ouvert est réutilisé tel quel.
+    """
+    global _active
+    if _active is not None:
+        yield _active
+        return
+    current = _active = SyncRun(mode)
+    try:
+        yield current
+    except BaseException as e:
+        # Nom de classe comme clé : le résumé doit rester sérialisable pour un run en échec
+        current.error(type(e).__name__)
+        raise
+    finally:
+        _active = None
+        current.finished_at = time.time()
+        summary = current.summary()
+        try:
+            write_reports(summary, directory or SYNC_METRICS_DIR)
+            if on_finish:
+                on_finish(summary)
+        except Exception as e:
+            print(f"⚠️ Métriques de synchro non enregistrées : {e}")
+        totals = summary["totals"]
+        print(f"📈 Métriques : {totals['requests']} requêtes, {totals['pages']} pages, "
+              f"{totals['activities_inserted']} ajoutées / {totals['activities_updated']} modifiées / "
+              f"{totals['activities_skipped']} inchangées, {totals['rate_limited_seconds']:.0f}s d'attente quota, "
+              f"{totals['errors']} erreur(s).")
+
+
+# --- RAPPORTS ---
+
+def _write_atomic(path, text):
+    # Le collecteur textfile ne doit jamais lire un fichier à moitié écrit
+    tmp = path + ".tmp"
+    with open(tmp, "w") as f:
+        f.write(text)
+    os.replace(tmp, path)
+
+
+def _labels(**labels):
+    return "{" + ",".join(f'{k}="{v}"' for k, v in labels.items()) + "}"
+
+
+def prometheus_text(summary):
+    """Format texte Prometheus : jauges du dernier run du mode, totales et par athlète."""
+    mode = summary["mode"]
+    lines = []
+
+    def gauge(name, help_text, samples):
+        lines.append(f"# HELP strava_sync_{name} {help_text}")
+        lines.append(f"# TYPE strava_sync_{name} gauge")
+        lines.extend(f"strava_sync_{name}{_labels(**labels)} {value}" for labels, value in samples)
+
+    finished = datetime.datetime.fromisoformat(summary["finished_at"]).timestamp()
+    gauge("last_run_timestamp_seconds", "Fin du dernier run", [({"mode": mode}, round(finished))])
+    gauge("last_run_duration_seconds", "Durée du dernier run", [({"mode": mode}, summary["duration_s"])])
+    gauge("last_run_athletes", "Athlètes synchronisés", [({"mode": mode}, len(summary["athletes"]))])
+    for counter in COUNTERS:
+        samples = [] if counter == "seconds" else [({"mode": mode}, summary["totals"][counter])]
+        samples += [({"mode": mode, "athlete": a}, c[counter]) for a, c in summary["athletes"].items() if c[counter]]
+        if samples:
+            gauge(f"last_run_{counter}", _HELP[counter], samples)
+    gauge("last_run_errors_by_class", "Erreurs par classe",
+          [({"mode": mode, "class": cls}, n) for cls, n in summary["errors"].items()])
+    gauge("last_run_responses", "Réponses Strava par code HTTP",
+          [({"mode": mode, "code": code}, n) for code, n in summary["status_codes"].items()])
+    return "\n".join(lines) + "\n"
+
+
+def write_reports(summary, directory=SYNC_METRICS_DIR):
+    """Fichier Prometheus et résumé JSON du dernier run du mode, historique en JSON Lines."""
+    os.makedirs(directory, exist_ok=True)
+    mode = summary["mode"]
+    _write_atomic(os.path.join(directory, f"strava_sync_{mode}.prom"), prometheus_text(summary))
+    _write_atomic(os.path.join(directory, f"strava_sync_{mode}.json"), json.dumps(summary, indent=2))
+    with open(os.path.join(directory, HISTORY_FILE), "a") as f:
+        f.write(json.dumps(summary) + "\n")
+
+
+# --- VÉRIFICATION ---
+
+def check_failed_run():
+    """Run qui lève : .prom, JSON, historique et ligne sync_runs écrits malgré l'erreur. Retourne le résumé."""
+    import tempfile
+    from fake_strava import MemorySupabase
+    from core import db as core_db
+
+    core_db.supabase = MemorySupabase()
+    directory = tempfile.mkdtemp(prefix="sync_metrics_")
+    try:
+        with run("check", directory=directory, on_finish=core_db.save_sync_run):
+            add("requests", 3)
+            raise RuntimeError("boom")
+    except RuntimeError:
+        pass
+    for name in ("strava_sync_check.prom", "strava_sync_check.json", HISTORY_FILE):
+        assert os.path.exists(os.path.join(directory, name)), f"{name} absent"
+    with open(os.path.join(directory, "strava_sync_check.json")) as f:
+        summary = json.load(f)
+    assert summary["errors"] == {"RuntimeError": 1}, summary["errors"]
+    with open(os.path.join(directory, "strava_sync_check.prom")) as f:
+        assert 'class="RuntimeError"' in f.read()
+    rows = core_db.get_sync_runs()
+    assert len(rows) == 1 and rows[0]["errors"] == {"RuntimeError": 1}, rows
+    return summary
+
+
+if __name__ == "__main__":
+    import sys
+    if sys.argv[1:] == ["check"]:
+        result = check_failed_run()
+        print(f"✅ Run en échec enregistré : erreurs {result['errors']}, {result['totals']['requests']} requêtes.")
+    else:
+        print("Utilisation : python sync_metrics.py check")
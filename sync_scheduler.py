@@ -0,0 +1,153 @@
+import os
+import math
+import datetime
+
+# --- PLANIFICATION DES SYNCHROS COMPLÈTES ---
+# Les athlètes sont classés par ancienneté de leur dernière synchro complète, rapportée
+# au nombre de requêtes Strava qu'elle coûtera (estimé d'après leur nombre d'activités
+# en base), puis rangés dans des fenêtres de 15 min sans dépasser le quota court.
+# Les athlètes dont le refresh token échoue à répétition sont mis de côté avec un
+# délai exponentiel (profiles.token_failures / token_retry_after).
+PAGE_SIZE = 200
+NEW_ATHLETE_PAGES = 3          # coût supposé d'un athlète sans activité en base
+NEVER_SYNCED_DAYS = 365        # ancienneté attribuée à un athlète jamais synchronisé
+WINDOW_RESERVE = int(os.getenv("SYNC_WINDOW_RESERVE", 10))  # requêtes laissées à l'UI / au webhook
+TOKEN_BACKOFF_BASE_HOURS = 6
+TOKEN_BACKOFF_MAX_HOURS = 7 * 24
+
+
+def _parse_date(value):
+    if not isinstance(value, str) or not value:
+        return None
+    try:
+        dt = datetime.datetime.fromisoformat(value.replace('Z', '+00:00'))
+    except ValueError:
+        return None
+    return dt if dt.tzinfo else dt.replace(tzinfo=datetime.timezone.utc)
+
+
+def estimate_cost(nb_activities):
+    """Requêtes Strava d'une synchro complète : une page par tranche de 200 + la page vide finale."""
+    if not nb_activities:
+        return NEW_ATHLETE_PAGES
+    return nb_activities // PAGE_SIZE + 1
+
+
+def staleness_days(profile, now):
+    """Jours écoulés depuis la dernière synchro complète."""
+    last_sync = _parse_date(profile.get('last_full_synchro'))
+    if last_sync is None:
+        return NEVER_SYNCED_DAYS
+    return max(0.0, (now - last_sync).total_seconds() / 86400)
+
+
+def token_failures(profile):
+    failures = profile.get('token_failures')
+    return int(failures) if isinstance(failures, (int, float)) and failures == failures else 0  # NaN
+
+
+def token_retry_after(failures, now):
+    """Prochain essai après `failures` échecs consécutifs du refresh token."""
+    hours = min(TOKEN_BACKOFF_MAX_HOURS, TOKEN_BACKOFF_BASE_HOURS * 2 ** (failures - 1))
+    return now + datetime.timedelta(hours=hours)
+
+
+def is_token_blocked(profile, now):
+    """Vrai si l'athlète est en attente après des échecs de refresh token."""
+    retry_after = _parse_date(profile.get('token_retry_after'))
+    return retry_after is not None and retry_after > now
+
+
+def priority(profile, cost, now):
+    """
+    Score de passage (plus grand = plus tôt) : ancienneté par requête, pénalisée par
+    les échecs de token. Une synchro complète interrompue passe avant tout le reste.
+    """
+    if profile.get('full_sync_before'):
+        return math.inf
+    return staleness_days(profile, now) / cost / (1 + token_failures(profile))
+
+
+def plan_full_sync(profiles, activity_counts, now, budget):
+    """
+    Range les athlètes dans des fenêtres de 15 min.
+    activity_counts : {id_strava: nb_activités} ; budget : rate_limiter.status().
+    Retourne (fenêtres [[profil, ...], ...], reportés [profil, ...], bloqués [profil, ...]).
+    Les athlètes qui ne tiennent pas dans le quota du jour sont reportés au prochain run.
+    """
+    blocked = [p for p in profiles if is_token_blocked(p, now)]
+    candidates = []
+    for p in profiles:
+        if is_token_blocked(p, now):
+            continue
+        cost = estimate_cost(activity_counts.get(p['id_strava'], 0))
+        candidates.append((priority(p, cost, now), cost, p))
+    candidates.sort(key=lambda c: c[0], reverse=True)
+
+    window_size = max(1, budget['short_limit'] - WINDOW_RESERVE)
+    first_window = max(0, budget['short_limit'] - budget['short_used'] - WINDOW_RESERVE)
+    day_left = budget['daily_limit'] - budget['day_used'] - WINDOW_RESERVE
+
+    windows, free = [], []    # free[i] : requêtes encore disponibles dans la fenêtre i
+    deferred = []
+    for _, cost, p in candidates:
+        if cost > day_left:
+            deferred.append(p)
+            continue
+        day_left -= cost
+        # Première fenêtre ouverte où l'athlète tient (comble les trous laissés par les gros historiques)
+        start = next((i for i, room in enumerate(free) if room >= cost), None)
+        if start is None:
+            windows.append([])
+            free.append(first_window if not free else window_size)
+            start = slot = len(free) - 1
+            # Historique plus gros qu'une fenêtre : il déborde sur les suivantes
+            while free[slot] < cost:
+                cost -= free[slot]
+                free[slot] = 0
+                windows.append([])
+                free.append(window_size)
+                slot += 1
+            free[slot] -= cost
+        else:
+            free[start] -= cost
+        windows[start].append(p)
+    return [w for w in windows if w], deferred, blocked
+
+
+# --- FRÉQUENCE DE SYNCHRO PARTIELLE PAR ATHLÈTE ---
+# Le cron passe toutes les 3 h mais n'interroge que les athlètes dont profiles.next_poll_at
+# est échu. L'intervalle suit le rythme de sorties des CADENCE_DAYS derniers jours (environ
+# deux passages par sortie attendue) et se raccourcit quand l'athlète s'est connecté récemment.
+MIN_POLL_HOURS = 3
+MAX_POLL_HOURS = 7 * 24
+CADENCE_DAYS = 60
+ACTIVE_LOGIN_DAYS = 7
+ACTIVE_LOGIN_POLL_HOURS = 12
+
+
+def poll_interval_hours(profile, recent_activities, now):
+    """Intervalle (h) entre deux synchros partielles, d'après recent_activities sur CADENCE_DAYS jours."""
+    if profile.get('poll_interval_hours') is None:
+        # Premier passage : les activités en base ne reflètent pas encore le rythme réel
+        return MIN_POLL_HOURS
+    rides_per_week = recent_activities / (CADENCE_DAYS / 7)
+    interval = MAX_POLL_HOURS if rides_per_week <= 0 else 7 * 24 / (2 * rides_per_week)
+    last_login = _parse_date(profile.get('last_login'))
+    if last_login and now - last_login < datetime.timedelta(days=ACTIVE_LOGIN_DAYS):
+        interval = min(interval, ACTIVE_LOGIN_POLL_HOURS)
+    return round(min(MAX_POLL_HOURS, max(MIN_POLL_HOURS, interval)), 1)
+
+
+def is_poll_due(profile, now):
+    """Vrai si la prochaine synchro partielle de l'athlète est échue (ou jamais planifiée)."""
+    next_poll = _parse_date(profile.get('next_poll_at'))
+    return next_poll is None or next_poll <= now
+
+
+def login_poll_schedule(now):
+    """Colonnes profiles à écrire à la connexion : l'athlète repasse au rythme le plus rapide."""
+    return {
+        "poll_interval_hours": MIN_POLL_HOURS,
+        "next_poll_at": (now + datetime.timedelta(hours=MIN_POLL_HOURS)).isoformat(),
+    }
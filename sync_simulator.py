@@ -0,0 +1,484 @@
+"""
+Simulateur hors ligne des politiques de synchro, pour dimensionner le quota Strava.
+
+À partir de la distribution réelle du club (nombre d'activités et rythme de sorties par
+athlète, lus dans la table activities) ou d'une population synthétique, rejoue une
+politique de synchro (crons partiels / complets, pagination, pauses, fréquence adaptative,
+réconciliation, rafale du dimanche, flux détaillés, webhook) contre les limites Strava
+(100 requêtes / 15 min, 1000 / jour) et mesure : requêtes consommées par charge, fraîcheur
+des données (délai entre l'envoi d'une sortie sur Strava et son arrivée en base), au total
+et par athlète, et durée des runs. Le balayage --members indique à partir de combien de
+membres la politique ne tient plus.
+
+Utilisation :
+    python sync_simulator.py --policy current --days 14 --members 50 100 200 400
+    python sync_simulator.py --policy legacy --synthetic 60 --json
+"""
+import json
+import random
+import argparse
+import datetime
+
+from sync_scheduler import poll_interval_hours, estimate_cost, plan_full_sync, CADENCE_DAYS, PAGE_SIZE, WINDOW_RESERVE
+from activity_streams import streams_budget, STREAMS_MAX_PER_RUN
+
+SHORT_WINDOW = 15 * 60
+DAY = 24 * 3600
+UPLOAD_DELAY = 3 * 3600        # une sortie arrive sur Strava ~3 h après son départ
+SIM_START = datetime.datetime(2024, 1, 1, tzinfo=datetime.timezone.utc)   # un lundi : jour 6 = dimanche
+
+# Politiques de référence (surchargeables en ligne de commande)
+POLICIES = {
+    # Avant : partiel de 10 activités toutes les 12 h pour tout le monde, complet quotidien
+    # (ignoré si < 2 jours), pagination fixe et pause de 600 s après chaque athlète
+    "legacy": {
+        "partial_every_hours": 12,
+        "partial_per_page": 10,
+        "adaptive_polling": False,
+        "full_every_hours": 24,
+        "full_min_days": 2,
+        "full_planner": False,
+        "pagination": "fixed",
+        "max_pages": 10,
+        "sleep_between_athletes": 600,
+        "concurrency": 1,
+        "reconcile_hour": None,
+        "sunday_burst": False,
+        "streams_hour": None,
+        "webhook": False,
+    },
+    # Actuel : curseur incrémental, cron toutes les 3 h avec fréquence adaptative,
+    # pagination par fenêtres croissantes, pas de pause fixe, 4 athlètes en parallèle,
+    # synchro complète planifiée par fenêtre de quota (sync_scheduler), plus les charges
+    # quotidiennes : réconciliation à 3 h, flux à 4 h 30, rafale du dimanche et webhook
+    "current": {
+        "partial_every_hours": 3,
+        "partial_per_page": 200,
+        "adaptive_polling": True,
+        "full_every_hours": 24,
+        "full_min_days": 2,
+        "full_planner": True,
+        "pagination": "adaptive",
+        "max_window": 10,
+        "sleep_between_athletes": 0,
+        "concurrency": 4,
+        "reconcile_hour": 3,
+        "reconcile_horizon_days": 90,
+        "sunday_burst": True,
+        "sunday_hours": [8, 14],          # UTC : de la fin de la sortie club à 16 h à Toulouse
+        "sunday_poll_minutes": 15,
+        "sunday_max_poll_minutes": 60,
+        "streams_hour": 4.5,
+        "streams_opt_in": 0.2,            # part des athlètes volontaires pour les flux
+        "webhook": True,
+        "webhook_drain_seconds": 60,
+    },
+}
+# Charges comptées séparément dans le rapport
+SOURCES = ("partial", "full", "reconcile", "sunday", "streams", "webhook")
+
+
+# --- POPULATION ---
+
+def load_population():
+    """Distribution réelle : [{"id", "activities", "rides_per_week"}] depuis Supabase."""
+    from core.db import get_activity_counts, get_recent_activity_counts
+    since = datetime.datetime.now(datetime.timezone.utc) - datetime.timedelta(days=CADENCE_DAYS)
+    recent = get_recent_activity_counts(since.isoformat())
+    return [
+        {"id": athlete_id, "activities": count, "rides_per_week": recent.get(athlete_id, 0) / (CADENCE_DAYS / 7)}
+        for athlete_id, count in get_activity_counts().items()
+    ]
+
+
+def synthetic_population(n, seed=0):
+    """Population synthétique : historiques log-normaux, un tiers de comptes dormants."""
+    rng = random.Random(seed)
+    population = []
+    for i in range(n):
+        dormant = rng.random() < 0.33
+        population.append({
+            "id": i + 1,
+            "activities": int(rng.lognormvariate(6, 1.1)),
+            "rides_per_week": 0.0 if dormant else rng.uniform(0.5, 7),
+        })
+    return population
+
+
+def resample(population, n, seed=0):
+    """Club de n membres tirés (avec remise) dans la distribution observée."""
+    rng = random.Random(seed)
+    return [{**rng.choice(population), "id": i + 1} for i in range(n)]
+
+
+# --- MODÈLE ---
+
+def pages_requested(nb_activities, policy):
+    """Requêtes d'une pagination complète selon la stratégie de la politique."""
+    needed = nb_activities // PAGE_SIZE + 1
+    if policy["pagination"] == "fixed":
+        return policy["max_pages"]
+    if policy["pagination"] == "sequential":
+        return estimate_cost(nb_activities)
+    # adaptive : fenêtres de 1, 2, 4... max_window pages, la dernière peut déborder
+    fetched, window = 0, 1
+    while fetched < needed:
+        fetched += window
+        window = min(window * 2, policy["max_window"])
+    return fetched
+
+
+class _Budget:
+    """Limiteur Strava simulé : fenêtres de 15 min alignées et jour UTC."""
+
+    def __init__(self, short_limit, daily_limit):
+        self.short_limit = short_limit
+        self.daily_limit = daily_limit
+        self.short = {}     # index de fenêtre -> requêtes
+        self.daily = {}     # index de jour -> requêtes
+        self.saturated_windows = set()
+        self.exhausted_days = set()
+
+    def request(self, t):
+        """Consomme une requête à partir de t ; retourne l'instant de départ, ou None si le jour est épuisé."""
+        while True:
+            day = int(t // DAY)
+            if self.daily.get(day, 0) >= self.daily_limit:
+                self.exhausted_days.add(day)
+                return None
+            window = int(t // SHORT_WINDOW)
+            if self.short.get(window, 0) < self.short_limit:
+                self.short[window] = self.short.get(window, 0) + 1
+                self.daily[day] = self.daily.get(day, 0) + 1
+                return t
+            self.saturated_windows.add(window)
+            t = (window + 1) * SHORT_WINDOW
+
+    def status(self, t):
+        """Même forme que rate_limiter.status(), à l'instant t (pour sync_scheduler / activity_streams)."""
+        return {
+            "short_limit": self.short_limit,
+            "short_used": self.short.get(int(t // SHORT_WINDOW), 0),
+            "daily_limit": self.daily_limit,
+            "day_used": self.daily.get(int(t // DAY), 0),
+        }
+
+
+def _ride_uploads(athlete, days, rng):
+    """Instants (s) d'arrivée sur Strava des sorties de l'athlète pendant la simulation."""
+    rate = athlete["rides_per_week"] / (7 * DAY)
+    uploads, t = [], 0.0
+    while rate > 0:
+        t += rng.expovariate(rate)
+        if t >= days * DAY:
+            break
+        uploads.append(t + UPLOAD_DELAY)
+    return uploads
+
+
+def _sim_datetime(t):
+    return SIM_START + datetime.timedelta(seconds=t)
+
+
+def _is_sunday(day):
+    return (SIM_START + datetime.timedelta(days=day)).weekday() == 6
+
+
+def simulate(population, policy, days=7, latency=0.4, short_limit=100, daily_limit=1000, seed=0):
+    """Rejoue la politique sur `days` jours et retourne le rapport (dict)."""
+    rng = random.Random(seed)
+    budget = _Budget(short_limit, daily_limit)
+    per_request = latency / max(1, policy["concurrency"])
+    requests = dict.fromkeys(SOURCES, 0)
+
+    athletes = []
+    for a in population:
+        streams = rng.random() < policy.get("streams_opt_in", 0)
+        athletes.append({
+            "id": a["id"],
+            "activities": a["activities"],
+            "rides_per_week": a["rides_per_week"],
+            "uploads": _ride_uploads(a, days, rng),   # sorties pas encore en base, triées
+            "next_poll": 0.0,
+            "poll_interval": None,
+            "last_full": -rng.uniform(0, policy["full_min_days"] * DAY),
+            "streams_pending": a["activities"] if streams else 0,   # sorties sans flux (volontaires)
+            "streams_opt_in": streams,
+            "last_synced_upload": None,
+            "freshness": [],
+        })
+
+    def call(t, source):
+        """Une requête de la charge `source` à partir de t ; instant de fin, ou None si le jour est épuisé."""
+        started = budget.request(t)
+        if started is None:
+            return None
+        requests[source] += 1
+        return started + per_request
+
+    def store(a, t, synced):
+        """Sorties `synced` en base à l'instant t."""
+        a["freshness"].extend(t - u for u in synced)
+        a["uploads"] = [u for u in a["uploads"] if u not in synced]
+        a["activities"] += len(synced)
+        if a["streams_opt_in"]:
+            a["streams_pending"] += len(synced)
+        if synced:
+            a["last_synced_upload"] = max(synced[-1], a["last_synced_upload"] or 0)
+
+    def sync(a, t, visible=None):
+        """Sorties arrivées sur Strava avant t (les `visible` plus récentes) : en base."""
+        arrived = [u for u in a["uploads"] if u <= t]
+        store(a, t, arrived if visible is None else arrived[-visible:])
+
+    # --- Webhook : une lecture d'activité par sortie envoyée, au vidage suivant de la file ---
+    webhook_events = sorted((u + policy.get("webhook_drain_seconds", 60), a["id"], u)
+                            for a in athletes for u in a["uploads"]) if policy.get("webhook") else []
+    by_id = {a["id"]: a for a in athletes}
+
+    def drain_webhooks(until):
+        while webhook_events and webhook_events[0][0] <= until:
+            at, athlete_id, upload = webhook_events.pop(0)
+            a = by_id[athlete_id]
+            if upload not in a["uploads"]:
+                continue      # déjà ramenée par un cron
+            done = call(at, "webhook")
+            if done is None:
+                continue      # quota du jour épuisé : le cron la rattrapera
+            store(a, done, [upload])
+
+    runs = [(k * policy["partial_every_hours"] * 3600, "partial")
+            for k in range(int(days * 24 / policy["partial_every_hours"]))]
+    if policy.get("full_every_hours"):
+        runs += [(k * policy["full_every_hours"] * 3600 + 2 * 3600, "full")
+                 for k in range(int(days * 24 / policy["full_every_hours"]))]
+    if policy.get("reconcile_hour") is not None:
+        runs += [(d * DAY + policy["reconcile_hour"] * 3600, "reconcile") for d in range(days)]
+    if policy.get("streams_hour") is not None:
+        runs += [(d * DAY + policy["streams_hour"] * 3600, "streams") for d in range(days)]
+    if policy.get("sunday_burst"):
+        runs += [(d * DAY + policy["sunday_hours"][0] * 3600, "sunday") for d in range(days) if _is_sunday(d)]
+    runs.sort()
+
+    run_stats = {"partial": [], "full": []}
+    full_deferred = 0
+    clock = 0.0          # fin du run précédent : un run ne démarre pas avant
+    for scheduled, kind in runs:
+        if kind == "sunday":
+            # Workflow à part, en parallèle des crons : ne décale pas leur horloge
+            drain_webhooks(scheduled)
+            _sunday_burst(athletes, policy, scheduled, budget, call, sync, drain_webhooks)
+            continue
+
+        t = start = max(scheduled, clock)
+        drain_webhooks(t)
+
+        if kind == "streams":
+            # activity_streams.fetch_pending_streams : une requête par sortie, budget plafonné
+            status = budget.status(t)
+            allowed = streams_budget(status, STREAMS_MAX_PER_RUN)
+            queues = [a for a in athletes if a["streams_pending"]]
+            while allowed > 0 and queues:
+                for a in list(queues):
+                    if allowed <= 0:
+                        break
+                    done = call(t, "streams")
+                    if done is None:
+                        allowed = 0
+                        break
+                    t, allowed = done, allowed - 1
+                    a["streams_pending"] -= 1
+                    if not a["streams_pending"]:
+                        queues.remove(a)
+            clock = t
+            continue
+
+        order = athletes
+        if kind == "full" and policy.get("full_planner"):
+            # cron_sync.nightly_sync : athlètes éligibles rangés par sync_scheduler
+            now = _sim_datetime(t)
+            eligible = [a for a in athletes if t - a["last_full"] >= policy["full_min_days"] * DAY]
+            profiles = [{"id_strava": a["id"], "last_full_synchro": _sim_datetime(a["last_full"]).isoformat()}
+                        for a in eligible]
+            windows, deferred, _ = plan_full_sync(profiles, {a["id"]: a["activities"] for a in eligible},
+                                                  now, budget.status(t))
+            full_deferred += len(deferred)
+            order = [by_id[p["id_strava"]] for w in windows for p in w]
+
+        for a in order:
+            if kind == "partial":
+                if policy["adaptive_polling"] and a["next_poll"] > t:
+                    continue
+                new = sum(1 for u in a["uploads"] if u <= t)
+                if policy["partial_per_page"] < PAGE_SIZE:
+                    # Une seule page des N plus récentes : le surplus attend la synchro complète
+                    cost, visible = 1, policy["partial_per_page"]
+                else:
+                    cost, visible = new // PAGE_SIZE + 1, None
+            elif kind == "reconcile":
+                # Résumés Strava de l'horizon : toutes les sorties arrivées sur la période repassent
+                in_horizon = int(a["rides_per_week"] * policy["reconcile_horizon_days"] / 7)
+                cost, visible = pages_requested(in_horizon, policy), None
+            else:
+                if not policy.get("full_planner") and t - a["last_full"] < policy["full_min_days"] * DAY:
+                    continue
+                cost, visible = pages_requested(a["activities"], policy), None
+
+            done = True
+            for _ in range(cost):
+                end_t = call(t, kind)
+                if end_t is None:
+                    done = False
+                    break
+                t = end_t
+            if not done:
+                break     # quota du jour épuisé : le reste du run est perdu
+
+            sync(a, t, visible)
+            if kind == "full":
+                a["last_full"] = t
+            if policy["adaptive_polling"] and kind == "partial":
+                recent = a["rides_per_week"] * CADENCE_DAYS / 7
+                interval = poll_interval_hours({"poll_interval_hours": a["poll_interval"]}, recent, None)
+                a["poll_interval"] = interval
+                a["next_poll"] = t + interval * 3600
+            t += policy["sleep_between_athletes"]
+        clock = t
+        if kind in run_stats:
+            run_stats[kind].append(t - start)
+
+    # Sorties jamais arrivées en base : fraîcheur comptée jusqu'à la fin de la simulation
+    end = days * DAY
+    drain_webhooks(end)
+    unsynced = sum(len(a["uploads"]) for a in athletes)
+    # (une sortie en attente compte avec l'âge qu'elle a à la fin, sinon les oubliés amélioreraient les percentiles)
+    freshness = sorted([f for a in athletes for f in a["freshness"]] + [end - u for a in athletes for u in a["uploads"]])
+    per_athlete = sorted((_athlete_freshness(a, end) for a in athletes if a["freshness"] or a["uploads"]),
+                         key=lambda r: r["freshness_mean_h"], reverse=True)
+
+    def pct(values, q):
+        return round(values[min(len(values) - 1, int(q * len(values)))] / 3600, 1) if values else None
+
+    return {
+        "members": len(population),
+        "days": days,
+        "requests": sum(requests.values()),
+        "requests_by_source": {k: v for k, v in requests.items() if v},
+        "requests_per_day_max": max(budget.daily.values(), default=0),
+        "requests_per_window_max": max(budget.short.values(), default=0),
+        "saturated_windows": len(budget.saturated_windows),
+        "days_quota_exhausted": len(budget.exhausted_days),
+        "rides": len(freshness),
+        "rides_unsynced": unsynced,
+        "oldest_unsynced_h": round(max((end - a["uploads"][0] for a in athletes if a["uploads"]), default=0) / 3600, 1),
+        "freshness_p50_h": pct(freshness, 0.5),
+        "freshness_p95_h": pct(freshness, 0.95),
+        "worst_athlete_mean_h": per_athlete[0]["freshness_mean_h"] if per_athlete else None,
+        "partial_run_minutes_max": round(max(run_stats["partial"], default=0) / 60, 1),
+        "full_run_minutes_max": round(max(run_stats["full"], default=0) / 60, 1),
+        "full_deferred": full_deferred,
+        "streams_backlog": sum(a["streams_pending"] for a in athletes),
+        "athletes": per_athlete,
+    }
+
+
+def _athlete_freshness(a, end):
+    """Fraîcheur d'un athlète : moyenne et pire délai (sorties en attente comptées jusqu'à la fin)."""
+    delays = a["freshness"] + [end - u for u in a["uploads"]]
+    return {
+        "id": a["id"],
+        "rides_per_week": round(a["rides_per_week"], 1),
+        "rides": len(delays),
+        "unsynced": len(a["uploads"]),
+        "freshness_mean_h": round(sum(delays) / len(delays) / 3600, 1),
+        "freshness_max_h": round(max(delays) / 3600, 1),
+    }
+
+
+def _sunday_burst(athletes, policy, start, budget, call, sync, drain_webhooks):
+    """
+    cron_sync.sunday_burst_sync : les membres actifs sont interrogés toutes les 15 min
+    (délai doublé sans nouveauté, plafonné) jusqu'à l'arrivée d'une sortie du jour ou l'heure limite.
+    """
+    day_start = start - start % DAY
+    deadline = day_start + policy["sunday_hours"][1] * 3600
+    pending = {a["id"]: a for a in athletes if a["rides_per_week"] > 0}
+    next_poll = dict.fromkeys(pending, start)
+    delay = dict.fromkeys(pending, policy["sunday_poll_minutes"])
+    t = start
+    while pending and t < deadline:
+        drain_webhooks(t)
+        due = [i for i in pending if next_poll[i] <= t]
+        status = budget.status(t)
+        if len(due) > status["daily_limit"] - status["day_used"] - WINDOW_RESERVE:
+            return
+        for athlete_id in due:
+            a = pending[athlete_id]
+            done = call(t, "sunday")
+            if done is None:
+                return
+            sync(a, done)
+            if (a["last_synced_upload"] or 0) >= day_start:
+                # Sortie du jour en base (par cette interrogation ou par le webhook)
+                del pending[athlete_id]
+            else:
+                next_poll[athlete_id] = t + delay[athlete_id] * 60
+                delay[athlete_id] = min(policy["sunday_max_poll_minutes"], delay[athlete_id] * 2)
+        t += policy["sunday_poll_minutes"] * 60
+
+
+def breaks(report, max_staleness_hours):
+    """La politique « casse » si le quota du jour est atteint ou si la fraîcheur p95 dépasse le seuil."""
+    if report["days_quota_exhausted"]:
+        return True
+    return report["freshness_p95_h"] is not None and report["freshness_p95_h"] > max_staleness_hours
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Simulateur de politique de synchro Strava")
+    parser.add_argument("--policy", choices=sorted(POLICIES), default="current")
+    parser.add_argument("--days", type=int, default=7)
+    parser.add_argument("--members", type=int, nargs="+", help="tailles de club à simuler (rééchantillonnage)")
+    parser.add_argument("--synthetic", type=int, help="population synthétique de N membres (sans Supabase)")
+    parser.add_argument("--latency", type=float, default=0.4, help="durée d'une requête Strava (s)")
+    parser.add_argument("--short-limit", type=int, default=100)
+    parser.add_argument("--daily-limit", type=int, default=1000)
+    parser.add_argument("--max-staleness-hours", type=float, default=24)
+    parser.add_argument("--set", nargs="*", default=[], metavar="CLÉ=VALEUR", help="surcharge de la politique (ex. partial_every_hours=6)")
+    parser.add_argument("--per-athlete", type=int, default=5, metavar="N", help="athlètes les moins à jour affichés")
+    parser.add_argument("--json", action="store_true", help="sortie JSON")
+    args = parser.parse_args()
+
+    policy = dict(POLICIES[args.policy])
+    for item in args.set:
+        key, value = item.split("=", 1)
+        policy[key] = json.loads(value) if value[:1].isdigit() or value in ("true", "false", "null") else value
+
+    base = synthetic_population(args.synthetic) if args.synthetic else load_population()
+    sizes = args.members or [len(base)]
+    reports = []
+    for n in sizes:
+        population = base if n == len(base) else resample(base, n)
+        report = simulate(population, policy, days=args.days, latency=args.latency,
+                          short_limit=args.short_limit, daily_limit=args.daily_limit)
+        report["breaks"] = breaks(report, args.max_staleness_hours)
+        reports.append(report)
+
+    if args.json:
+        print(json.dumps({"policy": policy, "reports": reports}, indent=2))
+    else:
+        print(f"Politique {args.policy} : {policy}")
+        print(f"{'membres':>8}{'req/jour':>10}{'req/15min':>11}{'quota KO':>10}{'p50 h':>8}{'p95 h':>8}"
+              f"{'non sync':>10}{'run part. min':>15}{'run full min':>14}  verdict")
+        for r in reports:
+            print(f"{r['members']:>8}{r['requests_per_day_max']:>10}{r['requests_per_window_max']:>11}"
+                  f"{r['days_quota_exhausted']:>10}{str(r['freshness_p50_h']):>8}{str(r['freshness_p95_h']):>8}"
+                  f"{r['rides_unsynced']:>10}{r['partial_run_minutes_max']:>15}{r['full_run_minutes_max']:>14}"
+                  f"  {'❌ ne tient pas' if r['breaks'] else '✅'}")
+        for r in reports:
+            sources = ", ".join(f"{k} {v}" for k, v in r["requests_by_source"].items())
+            print(f"\n{r['members']} membres : {r['requests']} requêtes ({sources}), "
+                  f"{r['full_deferred']} synchro(s) complète(s) reportée(s), {r['streams_backlog']} flux en attente")
+            for a in r["athletes"][:args.per_athlete]:
+                print(f"   athlète {a['id']:>5} : {a['rides_per_week']:>4} sorties/sem, fraîcheur moyenne "
+                      f"{a['freshness_mean_h']} h, pire {a['freshness_max_h']} h, {a['unsynced']} non synchronisée(s)")
@@ -0,0 +1,319 @@
+"""
+File durable des synchros lancées depuis la console admin, et worker qui les exécute
+dans un processus séparé (le serveur Streamlit n'est plus bloqué pendant des heures,
+et la synchro continue si l'onglet est fermé).
+
+Les jobs, leurs résultats par athlète et leurs lignes de log sont stockés dans une
+base SQLite locale, relue au fil de l'eau par la console admin.
+
+Utilisation :
+    python sync_worker.py                          # worker : traite la file en continu
+    python sync_worker.py --once                   # traite les jobs en attente puis s'arrête
+    python sync_worker.py enqueue all [--full]     # synchro de tous les athlètes
+    python sync_worker.py enqueue 12345 [--full]   # synchro d'un athlète
+"""
+import os
+import sys
+import time
+import sqlite3
+import argparse
+import threading
+import contextlib
+import sync_metrics
+from dotenv import load_dotenv
+
+load_dotenv()
+
+SYNC_JOBS_DB = os.getenv("SYNC_JOBS_DB", "sync_jobs.db")
+POLL_INTERVAL = 5     # secondes entre deux consultations de la file
+HEARTBEAT_INTERVAL = 30          # secondes entre deux signes de vie d'un job en cours
+HEARTBEAT_TIMEOUT = 5 * 60       # job en cours sans signe de vie depuis : worker considéré mort
+JOB_LOG_RETENTION_DAYS = int(os.getenv("JOB_LOG_RETENTION_DAYS", "30"))
+
+
+class SyncJobQueue:
+    """
+    Table des jobs de synchro (SQLite). Un job = un athlète (athlete_id) ou tout le
+    club (athlete_id NULL), en partiel ou complet. Statuts : queued, running, done, error.
+    Un job en cours porte le pid de son worker et un heartbeat rafraîchi pendant la synchro.
+    """
+
+    def __init__(self, path=SYNC_JOBS_DB):
+        self.path = path
+        with self._connect() as conn:
+            conn.executescript("""
+                CREATE TABLE IF NOT EXISTS jobs (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    athlete_id INTEGER,                -- NULL : tous les athlètes
+                    is_partial INTEGER NOT NULL,
+                    status TEXT NOT NULL DEFAULT 'queued',
+                    message TEXT,
+                    created_at REAL NOT NULL,
+                    started_at REAL,
+                    finished_at REAL,
+                    worker_pid INTEGER,
+                    heartbeat_at REAL
+                );
+                CREATE TABLE IF NOT EXISTS job_results (
+                    job_id INTEGER NOT NULL,
+                    athlete_id INTEGER NOT NULL,
+                    success INTEGER NOT NULL,
+                    message TEXT,
+                    created_at REAL NOT NULL
+                );
+                CREATE TABLE IF NOT EXISTS job_logs (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    job_id INTEGER NOT NULL,
+                    created_at REAL NOT NULL,
+                    line TEXT NOT NULL
+                );
+                CREATE INDEX IF NOT EXISTS job_logs_job ON job_logs (job_id, id);
+                CREATE INDEX IF NOT EXISTS job_results_job ON job_results (job_id);
+                CREATE INDEX IF NOT EXISTS job_logs_created ON job_logs (created_at);
+            """)
+            # Files créées avant le heartbeat
+            columns = {row[1] for row in conn.execute("PRAGMA table_info(jobs)")}
+            for column, sql_type in (("worker_pid", "INTEGER"), ("heartbeat_at", "REAL")):
+                if column not in columns:
+                    conn.execute(f"ALTER TABLE jobs ADD COLUMN {column} {sql_type}")
+
+    def _connect(self):
+        return sqlite3.connect(self.path, timeout=30)
+
+    def enqueue(self, athlete_id=None, is_partial=True):
+        """Ajoute un job ; un job identique déjà en attente ou en cours est réutilisé. Retourne son id."""
+        with self._connect() as conn:
+            existing = conn.execute(
+                "SELECT id FROM jobs WHERE athlete_id IS ? AND is_partial = ? AND status IN ('queued', 'running')",
+                (athlete_id, int(is_partial))
+            ).fetchone()
+            if existing:
+                return existing[0]
+            return conn.execute(
+                "INSERT INTO jobs (athlete_id, is_partial, created_at) VALUES (?, ?, ?)",
+                (athlete_id, int(is_partial), time.time())
+            ).lastrowid
+
+    def claim(self):
+        """Prend le plus ancien job en attente (passage en running) ; None si la file est vide."""
+        conn = self._connect()
+        conn.isolation_level = None
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            row = conn.execute(
+                "SELECT id, athlete_id, is_partial FROM jobs WHERE status = 'queued' ORDER BY id LIMIT 1"
+            ).fetchone()
+            if row:
+                now = time.time()
+                conn.execute("UPDATE jobs SET status = 'running', started_at = ?, worker_pid = ?, heartbeat_at = ? WHERE id = ?",
+                             (now, os.getpid(), now, row[0]))
+            conn.execute("COMMIT")
+        finally:
+            conn.close()
+        if not row:
+            return None
+        return {"id": row[0], "athlete_id": row[1], "is_partial": bool(row[2])}
+
+    def heartbeat(self, job_id):
+        with self._connect() as conn:
+            conn.execute("UPDATE jobs SET heartbeat_at = ? WHERE id = ?", (time.time(), job_id))
+
+    def requeue_interrupted(self, timeout=HEARTBEAT_TIMEOUT):
+        """
+        Jobs en running dont le worker est mort (pid disparu, ou plus de heartbeat depuis
+        timeout secondes) : remis en attente. Ceux d'un worker vivant ne sont pas touchés.
+        """
+        now = time.time()
+        with self._connect() as conn:
+            running = conn.execute("SELECT id, worker_pid, heartbeat_at FROM jobs WHERE status = 'running'").fetchall()
+            stale = [job_id for job_id, pid, heartbeat_at in running
+                     if not _pid_alive(pid) or heartbeat_at is None or now - heartbeat_at > timeout]
+            for job_id in stale:
+                conn.execute("UPDATE jobs SET status = 'queued', started_at = NULL, worker_pid = NULL, heartbeat_at = NULL "
+                             "WHERE id = ? AND status = 'running'", (job_id,))
+        return len(stale)
+
+    def prune_logs(self, retention_days=JOB_LOG_RETENTION_DAYS):
+        """Supprime les lignes de log plus anciennes que retention_days ; retourne leur nombre."""
+        with self._connect() as conn:
+            return conn.execute("DELETE FROM job_logs WHERE created_at < ?",
+                                (time.time() - retention_days * 86400,)).rowcount
+
+    def finish(self, job_id, status, message=None):
+        with self._connect() as conn:
+            conn.execute("UPDATE jobs SET status = ?, message = ?, finished_at = ? WHERE id = ?",
+                         (status, message, time.time(), job_id))
+
+    def add_result(self, job_id, athlete_id, success, message):
+        with self._connect() as conn:
+            conn.execute("INSERT INTO job_results (job_id, athlete_id, success, message, created_at) VALUES (?, ?, ?, ?, ?)",
+                         (job_id, athlete_id, int(success), message, time.time()))
+
+    def log(self, job_id, line):
+        with self._connect() as conn:
+            conn.execute("INSERT INTO job_logs (job_id, created_at, line) VALUES (?, ?, ?)", (job_id, time.time(), line))
+
+    def recent_jobs(self, limit=20):
+        with self._connect() as conn:
+            rows = conn.execute(
+                "SELECT id, athlete_id, is_partial, status, message, created_at, started_at, finished_at "
+                "FROM jobs ORDER BY id DESC LIMIT ?", (limit,)
+            ).fetchall()
+        keys = ("id", "athlete_id", "is_partial", "status", "message", "created_at", "started_at", "finished_at")
+        return [dict(zip(keys, r)) for r in rows]
+
+    def results(self, job_id):
+        with self._connect() as conn:
+            rows = conn.execute(
+                "SELECT athlete_id, success, message FROM job_results WHERE job_id = ? ORDER BY created_at", (job_id,)
+            ).fetchall()
+        return [{"athlete_id": r[0], "success": bool(r[1]), "message": r[2]} for r in rows]
+
+    def logs_since(self, job_id, after_id=0):
+        """Lignes de log postérieures à after_id : [(id, ligne), ...] pour une lecture incrémentale."""
+        with self._connect() as conn:
+            return conn.execute(
+                "SELECT id, line FROM job_logs WHERE job_id = ? AND id > ? ORDER BY id", (job_id, after_id)
+            ).fetchall()
+
+
+def _pid_alive(pid):
+    """Processus encore présent sur la machine (la file SQLite est locale au worker)."""
+    if not pid:
+        return False
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+class _Heartbeat(threading.Thread):
+    """Signe de vie du job en cours, tant que la synchro tourne."""
+
+    def __init__(self, queue, job_id, interval=HEARTBEAT_INTERVAL):
+        super().__init__(daemon=True)
+        self.queue = queue
+        self.job_id = job_id
+        self.interval = interval
+        self.stopped = threading.Event()
+
+    def run(self):
+        while not self.stopped.wait(self.interval):
+            try:
+                self.queue.heartbeat(self.job_id)
+            except sqlite3.Error as e:
+                print(f"⚠️ Heartbeat du job {self.job_id} non écrit : {e}", file=sys.__stdout__)
+
+    def stop(self):
+        self.stopped.set()
+
+
+class _JobLog:
+    """stdout du worker : chaque ligne est écrite dans job_logs et recopiée sur la console."""
+
+    def __init__(self, queue, job_id, echo):
+        self.queue = queue
+        self.job_id = job_id
+        self.echo = echo
+        self.buffer = ""
+        self.lock = threading.Lock()   # les threads de synchro écrivent en parallèle
+
+    def write(self, text):
+        with self.lock:
+            self.echo.write(text)
+            self.buffer += text
+            while "\n" in self.buffer:
+                line, self.buffer = self.buffer.split("\n", 1)
+                if line.strip():
+                    self.queue.log(self.job_id, line)
+        return len(text)
+
+    def flush(self):
+        with self.lock:
+            if self.buffer.strip():
+                self.queue.log(self.job_id, self.buffer)
+            self.buffer = ""
+            self.echo.flush()
+
+
+def run_job(queue, job):
+    """Exécute un job (athlète ou club entier) en enregistrant logs et résultats."""
+    # Import tardif : la console admin importe ce module sans Supabase ni Strava
+    from cron_sync import nightly_sync, sync_single_athlete, metered_run
+    from core.db import get_profile
+
+    job_log = _JobLog(queue, job["id"], sys.__stdout__)
+    heartbeat = _Heartbeat(queue, job["id"])
+    heartbeat.start()
+    if job["athlete_id"] is not None:
+        mode = "athlete"
+    else:
+        mode = "partial" if job["is_partial"] else "full"
+    try:
+        with contextlib.redirect_stdout(job_log), metered_run(mode):
+            if job["athlete_id"] is None:
+                # Demande explicite de l'admin : tout le club, pas seulement les passages échus
+                nightly_sync(job["is_partial"], force=True, on_result=lambda profile, result:
+                             queue.add_result(job["id"], profile["id_strava"], *result))
+                message = "Synchro du club terminée"
+            else:
+                profile = get_profile(job["athlete_id"])
+                if not profile:
+                    raise ValueError(f"athlète {job['athlete_id']} inconnu")
+                with sync_metrics.athlete(job["athlete_id"]):
+                    success, message = sync_single_athlete(profile, is_partial=job["is_partial"])
+                print(message)
+                queue.add_result(job["id"], job["athlete_id"], success, message)
+        job_log.flush()
+        queue.finish(job["id"], "done", message)
+    except Exception as e:
+        job_log.flush()
+        queue.log(job["id"], f"❌ {e}")
+        queue.finish(job["id"], "error", str(e))
+    finally:
+        heartbeat.stop()
+
+
+def run_worker(queue, poll_interval=POLL_INTERVAL, once=False):
+    """
+    Boucle du worker : un job à la fois (le budget Strava est partagé de toute façon).
+    Plusieurs workers peuvent partager la file : seuls les jobs d'un worker mort sont repris.
+    """
+    pruned = queue.prune_logs()
+    if pruned:
+        print(f"🧹 {pruned} ligne(s) de log de plus de {JOB_LOG_RETENTION_DAYS} jours supprimée(s).")
+    print(f"👷 Worker de synchro prêt (file : {queue.path})")
+    while True:
+        requeued = queue.requeue_interrupted()
+        if requeued:
+            print(f"↩️ {requeued} job(s) interrompu(s) remis en file.")
+        job = queue.claim()
+        if job is None:
+            if once:
+                return
+            time.sleep(poll_interval)
+            continue
+        target = "tous les athlètes" if job["athlete_id"] is None else f"athlète {job['athlete_id']}"
+        print(f"▶️ Job {job['id']} : {target}, partiel={job['is_partial']}")
+        run_job(queue, job)
+        queue.prune_logs()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Worker des synchros lancées depuis la console admin")
+    parser.add_argument("--once", action="store_true", help="vide la file puis s'arrête")
+    sub = parser.add_subparsers(dest="command")
+    p_enqueue = sub.add_parser("enqueue", help="ajoute un job à la file")
+    p_enqueue.add_argument("target", help="'all' ou id Strava de l'athlète")
+    p_enqueue.add_argument("--full", action="store_true", help="synchro complète")
+    args = parser.parse_args()
+
+    job_queue = SyncJobQueue()
+    if args.command == "enqueue":
+        athlete_id = None if args.target == "all" else int(args.target)
+        print(f"📥 Job {job_queue.enqueue(athlete_id, is_partial=not args.full)} en file.")
+    else:
+        run_worker(job_queue, once=args.once)
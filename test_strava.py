@@ -1,6 +1,8 @@
+import os
 import requests
 
-ACCESS_TOKEN = "9dabccb98393a378008a19e8162086dabf04a4af" 
+# Token d'accès Strava à fournir par variable d'environnement (jamais en dur dans le code)
+ACCESS_TOKEN = os.getenv("STRAVA_ACCESS_TOKEN")
 JAN_1_2026 = 1735689600
 
 def check_everything():
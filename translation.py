@@ -7,6 +7,7 @@ lang_dict = {
         "sync_btn": "🚀 Forcer synchronisation complète depuis Strava",
         "sync_spinner": "Synchronisation complète en cours...",
         "sync_success": "Base de données mise à jour !",
+        "sync_running": "🔄 Une synchronisation est déjà en cours, réessayez quand elle sera terminée.",
         "in_db": "Activités en base",
         "strava_stats": "Stats Strava",
         "last_activities": "📊 Vos dernières activités",
@@ -46,6 +47,7 @@ lang_dict = {
         "sync_btn": "🚀 Force full synchronization from Strava",
         "sync_spinner": "Complete sync in progress...",
         "sync_success": "Database updated!",
+        "sync_running": "🔄 A synchronization is already running, try again once it has finished.",
         "in_db": "Activities in DB",
         "strava_stats": "Strava Stats",
         "last_activities": "📊 Your last activities",
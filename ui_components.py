@@ -3,7 +3,7 @@ import pandas as pd
 import altair as alt
 from strava_operations import *
 from db_operations import *
-from ui_components_statistics import render_advanced_stats, render_epic_rides_scatter
+from ui_components_statistics import render_advanced_stats, render_epic_rides_scatter, add_stream_summaries
 
 def make_display_names(df):
     """
@@ -53,7 +53,7 @@ def render_tab_stats(texts):
     #st.info(f"DEBUG : res:{res}")
     
     if res.data:
-        df_my_activities = pd.DataFrame(res.data)
+        df_my_activities = add_stream_summaries(pd.DataFrame(res.data), st.session_state.athlete['id'])
         render_advanced_stats(df_my_activities)
         st.divider()
         # Ajout du Scatter Plot
@@ -2,7 +2,8 @@ import streamlit as st
 import pandas as pd
 import altair as alt
 import datetime
-from db_operations import get_activities_for_athlete # Assurez-vous d'avoir cette fonction
+from db_operations import get_activities_for_athlete, get_profile, write_profile # Assurez-vous d'avoir cette fonction
+from activity_streams import get_stream_summaries, get_athlete_curves, club_curves
 
 
 # --- FONCTIONS UTILITAIRES ---
@@ -75,6 +76,9 @@ def render_advanced_stats(df_activities):
     with col3:
         render_stat_card("⛰️", "Max Dénivelé", f"{max_elev:.0f} m", "", "#e67e22")
 
+    if pd.notna(max_watts) and max_watts > 0:
+        render_stat_card("⚡", "Max Puissance moyenne", f"{max_watts:.0f} W", "Sorties avec capteur de puissance", "#f1c40f")
+
     st.write("Le numéro d'Eddington (E) est obtenu quand le nombre de kilomètre réalisés en une sortie est égale au nombre de fois où ce kilométrage a été effectué.")
     st.write("Exemple : Un cycliste à un nombre d'Eddington de 123 : cela veut dire qu'il a effectué 123 sorties d'au moins 123 km.")
     st.divider()
@@ -215,4 +219,79 @@ def render_epic_rides_scatter(df_activities):
                 validate="^https://www.strava.com/.*"
             )
         }
-    )
\ No newline at end of file
+    )
+
+# --- COURBES PUISSANCE / CARDIO (flux détaillés, athlètes volontaires) ---
+
+@st.cache_data(ttl=600)
+def _athlete_stream_summaries(athlete_id):
+    return get_stream_summaries(athlete_ids=[athlete_id])
+
+@st.cache_data(ttl=600)
+def _club_curves():
+    # Une ligne de records par athlète, pas les courbes de chaque activité
+    return get_athlete_curves()
+
+def _duration_label(seconds):
+    if seconds < 60:
+        return f"{seconds} s"
+    if seconds < 3600:
+        return f"{seconds // 60} min"
+    return f"{seconds // 3600} h"
+
+def add_stream_summaries(df_activities, athlete_id):
+    """Ajoute average_watts (calculée depuis les flux) aux activités de l'athlète qui ont des flux en base."""
+    rows = [r for r in _athlete_stream_summaries(athlete_id) if r.get("average_watts") is not None]
+    if not rows or df_activities.empty:
+        return df_activities
+    watts = pd.DataFrame(rows)[["id_activity", "average_watts"]]
+    return df_activities.drop(columns=["average_watts"], errors="ignore").merge(watts, on="id_activity", how="left")
+
+def render_power_curves(athlete_id):
+    """Courbe record de l'athlète (meilleure moyenne sur chaque durée) face au club."""
+    profile = get_profile(athlete_id)
+    opted_in = bool(profile and profile.get("streams_opt_in"))
+    wanted = st.toggle("Importer mes flux détaillés depuis Strava (puissance, cardio)", value=opted_in)
+    if wanted != opted_in:
+        write_profile(athlete_id, {"streams_opt_in": wanted})
+    if not wanted:
+        st.caption("Les flux sont récupérés chaque nuit, dans la limite du quota Strava du club.")
+        return
+
+    rows = _club_curves()
+    metric = st.segmented_control("Courbe", options=["Puissance (W)", "Cardio (bpm)"], default="Puissance (W)")
+    key = "heartrate" if metric == "Cardio (bpm)" else "watts"
+    curves = club_curves(rows, key)
+    if athlete_id not in curves.index:
+        st.info("Pas encore de flux pour vos sorties : ils arrivent au fil des nuits.")
+        return
+
+    durations = list(curves.columns)
+    df_curve = pd.concat([
+        pd.DataFrame({"durée": durations, "valeur": curves.loc[athlete_id].values, "courbe": "Moi"}),
+        pd.DataFrame({"durée": durations, "valeur": curves.max().values, "courbe": "Meilleur du club"}),
+        pd.DataFrame({"durée": durations, "valeur": curves.median().values, "courbe": "Médiane du club"}),
+    ]).dropna()
+    df_curve["label"] = df_curve["durée"].apply(_duration_label)
+
+    chart = alt.Chart(df_curve).mark_line(point=True).encode(
+        x=alt.X("durée:Q", title="Durée", scale=alt.Scale(type="log"),
+                axis=alt.Axis(values=durations, labelExpr="datum.value < 60 ? datum.value + ' s' : datum.value < 3600 ? datum.value / 60 + ' min' : datum.value / 3600 + ' h'")),
+        y=alt.Y("valeur:Q", title=metric),
+        color=alt.Color("courbe:N", title="", scale=alt.Scale(range=["#E62E2D", "#2c3e50", "#95a5a6"])),
+        tooltip=[alt.Tooltip("courbe:N", title=""), alt.Tooltip("label:N", title="Durée"),
+                 alt.Tooltip("valeur:Q", title=metric, format=".0f")],
+    ).properties(height=400)
+    st.altair_chart(chart, use_container_width=True)
+    st.caption(f"Courbes calculées sur {curves.shape[0]} athlète(s) volontaire(s).")
+
+    # Meilleurs temps sur distance (le record est le plus petit temps)
+    mine = next((r for r in rows if r["id_strava"] == athlete_id), None)
+    best = pd.Series((mine["mean_max"] or {}).get("best_efforts", {}) if mine else {}, dtype=float).dropna()
+    if not best.empty:
+        table = pd.DataFrame({
+            "Distance": [f"{int(d) // 1000} km" for d in best.index],
+            "Meilleur temps": [f"{int(v // 3600)}h {int(v % 3600 // 60):02d}m {int(v % 60):02d}s" for v in best.values],
+        })
+        st.markdown("**⏱️ Meilleurs temps sur distance**")
+        st.dataframe(table, hide_index=True, use_container_width=True)
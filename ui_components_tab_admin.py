@@ -1,8 +1,6 @@
-import sys
-import io
+import datetime
 import streamlit as st
-from contextlib import redirect_stdout
-from cron_sync import nightly_sync, sync_single_athlete
+from sync_worker import SyncJobQueue
 from db_operations import *
 from strava_operations import *
 import pandas as pd
@@ -65,18 +63,14 @@ def render_tab_admin(texts):
     col_btn1, col_btn2 = st.columns(2)
     selected_profile = athlete_dict[selected_athlete_name]
 
+    # Les synchros sont mises en file et exécutées par le worker (python sync_worker.py)
     if col_btn1.button(f"🔄 Sync Partielle pour {selected_profile['firstname']}", use_container_width=True):
-        with st.spinner("Synchronisation partielle en cours..."):
-            success, msg = sync_single_athlete(selected_profile, is_partial=True)
-            if success: st.success(msg)
-            else: st.error(msg)
+        st.session_state.admin_job_id = sync_jobs_queue().enqueue(int(selected_profile['id_strava']), is_partial=True)
+        st.session_state.admin_log_lines = None
 
     if col_btn2.button(f"🚀 FULL Sync pour {selected_profile['firstname']}", type="primary", use_container_width=True):
-        with st.spinner("Récupération de l'historique complet (peut prendre du temps)..."):
-            # On passe force_full=True pour contourner les limites éventuelles
-            success, msg = sync_single_athlete(selected_profile, is_partial=False)
-            if success: st.success(msg)
-            else: st.error(msg)
+        st.session_state.admin_job_id = sync_jobs_queue().enqueue(int(selected_profile['id_strava']), is_partial=False)
+        st.session_state.admin_log_lines = None
 
 
     # --- SECTION SYNCHRO GLOBALE ---
@@ -84,32 +78,140 @@ def render_tab_admin(texts):
     st.subheader("🌍 Synchronisation, tous les utilisateurs)")
     is_partial_sync = st.checkbox("🔄 Partial Sync si coché (derniers jours uniquement)", value=True)
 
-    if "sync_running" not in st.session_state:
-        st.session_state.sync_running = False
+    if st.button("Lancer la synchro"):
+        st.session_state.admin_job_id = sync_jobs_queue().enqueue(None, is_partial=is_partial_sync)
+        st.session_state.admin_log_lines = None
 
-    btn_label = "⏳ Synchro en cours..." if st.session_state.sync_running else "Lancer la synchro"
-    
-    if st.button(btn_label, disabled=st.session_state.sync_running):
-        st.session_state.sync_running = True
-        st.rerun()
-
-    if st.session_state.sync_running:
-        with st.status(f"Exécution de la synchronisation...Partial sync={is_partial_sync}", expanded=True) as status:
-            log_area = st.empty()
-            output = io.StringIO()
-            try:
-                with redirect_stdout(output):
-                    nightly_sync(is_partial_sync)
-                log_area.code(output.getvalue())
-                status.update(label="✅ Synchronisation terminée !", state="complete", expanded=False)
-            except Exception as e:
-                st.error(f"Erreur globale : {e}")
-                status.update(label="❌ Erreur", state="error")
-            finally:
-                st.session_state.sync_running = False
-                if st.button("Réinitialiser l'interface"):
-                    st.rerun()
+    # --- SUIVI DES JOBS ---
+    st.write("---")
+    st.subheader("📋 Jobs de synchronisation")
+    names = {int(row['id_strava']): f"{row['firstname']} {row['lastname']}" for _, row in df_admin.iterrows()}
+    render_sync_jobs(names)
+
+    # --- MÉTRIQUES DES SYNCHROS ---
+    st.write("---")
+    st.subheader("📈 Métriques des synchros")
+    render_sync_metrics(names)
 
     st.write("---")
     st.subheader("💡 Rappel technique")
-    st.caption("- Le script complet tourne automatiquement en tâche de fond.\n- La synchronisation individuelle met à jour les tokens à la volée.")
\ No newline at end of file
+    st.caption("- Le script complet tourne automatiquement en tâche de fond.\n- La synchronisation individuelle met à jour les tokens à la volée.\n- Les synchros lancées ici sont exécutées par le worker : `python sync_worker.py`.")
+
+
+@st.cache_resource
+def sync_jobs_queue():
+    return SyncJobQueue()
+
+JOB_STATUS_ICONS = {"queued": "⏳", "running": "🔄", "done": "✅", "error": "❌"}
+
+@st.fragment(run_every=3)
+def render_sync_jobs(names):
+    """Jobs récents, résultats par athlète et logs du job suivi, relus de façon incrémentale."""
+    queue = sync_jobs_queue()
+    jobs = queue.recent_jobs()
+    if not jobs:
+        st.caption("Aucun job pour l'instant.")
+        return
+
+    labels = {
+        job["id"]: f"{JOB_STATUS_ICONS.get(job['status'], '')} #{job['id']} · "
+                   f"{'Tous' if job['athlete_id'] is None else names.get(job['athlete_id'], job['athlete_id'])} · "
+                   f"{'partielle' if job['is_partial'] else 'complète'} · "
+                   f"{datetime.datetime.fromtimestamp(job['created_at']):%d/%m %H:%M}"
+        for job in jobs
+    }
+    ids = list(labels)
+    followed = st.session_state.get("admin_job_id")
+    job_id = st.selectbox("Job suivi :", ids, index=ids.index(followed) if followed in ids else 0,
+                          format_func=labels.get)
+    if job_id != followed:
+        st.session_state.admin_job_id = job_id
+        st.session_state.admin_log_lines = None
+    job = next(j for j in jobs if j["id"] == job_id)
+    if job["status"] == "queued":
+        st.info("En attente du worker (python sync_worker.py).")
+    elif job["message"]:
+        (st.error if job["status"] == "error" else st.success)(job["message"])
+
+    results = queue.results(job_id)
+    if results:
+        st.dataframe(pd.DataFrame([{
+            "Athlète": names.get(r["athlete_id"], r["athlete_id"]),
+            "OK": "✅" if r["success"] else "❌",
+            "Message": r["message"],
+        } for r in results]), use_container_width=True, hide_index=True)
+
+    # Logs : seules les nouvelles lignes sont lues à chaque rafraîchissement
+    if st.session_state.get("admin_log_lines") is None:
+        st.session_state.admin_log_lines = []
+        st.session_state.admin_log_last_id = 0
+    new_lines = queue.logs_since(job_id, st.session_state.admin_log_last_id)
+    if new_lines:
+        st.session_state.admin_log_last_id = new_lines[-1][0]
+        st.session_state.admin_log_lines.extend(line for _, line in new_lines)
+    if st.session_state.admin_log_lines:
+        st.code("\n".join(st.session_state.admin_log_lines[-500:]))
+
+SYNC_MODE_LABELS = {"partial": "partielle", "full": "complète", "reconcile": "réconciliation",
+                    "sunday": "dimanche", "athlete": "athlète"}
+
+@st.cache_data(ttl=60)
+def _sync_runs():
+    return get_sync_runs()
+
+def render_sync_metrics(names):
+    """Historique des runs (sync_metrics) : tendances, et détail par athlète et par erreur d'un run."""
+    try:
+        runs = _sync_runs()
+    except Exception as e:
+        st.caption(f"Historique indisponible (table sync_runs : dbScripts/add_sync_runs.sql) : {e}")
+        return
+    if not runs:
+        st.caption("Aucun run enregistré pour l'instant.")
+        return
+
+    df_runs = pd.DataFrame([{
+        "Début": pd.to_datetime(r["started_at"], utc=True).tz_convert("Europe/Paris").tz_localize(None),
+        "Mode": SYNC_MODE_LABELS.get(r["mode"], r["mode"]),
+        "Durée (s)": r["duration_s"],
+        "Athlètes": len(r["athletes"]),
+        "Requêtes": r["totals"].get("requests", 0),
+        "Pages": r["totals"].get("pages", 0),
+        "Ajoutées": r["totals"].get("activities_inserted", 0),
+        "Modifiées": r["totals"].get("activities_updated", 0),
+        "Inchangées": r["totals"].get("activities_skipped", 0),
+        "Attente quota (s)": r["totals"].get("rate_limited_seconds", 0),
+        "Refresh token (s)": r["totals"].get("token_refresh_seconds", 0),
+        "Erreurs": r["totals"].get("errors", 0),
+    } for r in runs])
+
+    last = runs[0]
+    col1, col2, col3, col4 = st.columns(4)
+    col1.metric("Dernier run", f"{df_runs['Début'].iloc[0]:%d/%m %H:%M}", df_runs["Mode"].iloc[0], delta_color="off")
+    col2.metric("Requêtes", last["totals"].get("requests", 0))
+    col3.metric("Attente quota", f"{last['totals'].get('rate_limited_seconds', 0):.0f} s")
+    col4.metric("Erreurs", last["totals"].get("errors", 0))
+
+    st.line_chart(df_runs.set_index("Début")[["Requêtes", "Attente quota (s)", "Durée (s)"]].sort_index())
+    st.dataframe(df_runs, use_container_width=True, hide_index=True)
+
+    labels = {i: f"{df_runs['Début'].iloc[i]:%d/%m %H:%M} · {df_runs['Mode'].iloc[i]}" for i in range(len(runs))}
+    selected = runs[st.selectbox("Détail du run :", list(labels), format_func=labels.get, key="admin_sync_run")]
+    if selected["errors"]:
+        st.dataframe(pd.DataFrame([{"Erreur": cls, "Nombre": n} for cls, n in
+                                   sorted(selected["errors"].items(), key=lambda e: -e[1])]),
+                     use_container_width=True, hide_index=True)
+    if selected["athletes"]:
+        # Où part le quota : athlètes classés par requêtes consommées
+        st.dataframe(pd.DataFrame([{
+            "Athlète": names.get(int(a), a),
+            "Requêtes": c.get("requests", 0),
+            "Pages": c.get("pages", 0),
+            "Ajoutées": c.get("activities_inserted", 0),
+            "Modifiées": c.get("activities_updated", 0),
+            "Inchangées": c.get("activities_skipped", 0),
+            "Durée (s)": c.get("seconds", 0),
+            "Attente quota (s)": c.get("rate_limited_seconds", 0),
+            "Erreurs": c.get("errors", 0),
+        } for a, c in selected["athletes"].items()]).sort_values("Requêtes", ascending=False),
+            use_container_width=True, hide_index=True)
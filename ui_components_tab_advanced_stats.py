@@ -3,7 +3,7 @@ import pandas as pd
 import altair as alt
 import datetime
 from db_operations import supabase
-from ui_components_statistics import calculate_eddington, render_stat_card, render_epic_rides_scatter
+from ui_components_statistics import calculate_eddington, render_stat_card, render_epic_rides_scatter, render_power_curves
 
 def format_time(seconds):
     """Convertit des secondes en format lisible Hh Mm Ss"""
@@ -181,6 +181,10 @@ def render_tab_advanced_stats(texts):
     with st.expander("🌌 Km / D+", expanded=False):
         render_epic_rides_scatter(df_filtered)
 
+    # Courbes puissance / cardio (flux détaillés, toutes sorties confondues)
+    with st.expander("⚡ Puissance & cardio", expanded=False):
+        render_power_curves(athlete_id)
+
     # --- 3. MÉTRIQUES RECORD ---
     with st.expander("🏆 Records (sur la sélection)", expanded=False):
         # Max calculs